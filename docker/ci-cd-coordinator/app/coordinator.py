@@ -82,11 +82,15 @@ class CICDCoordinator:
                 logger.error(f"Error in sync loop: {e}")
                 time.sleep(60)
                 
-    def start(self):
-        """Запуск координатора"""
+    def start_sync_loop(self):
+        """Запуск цикла синхронизации в фоновом потоке"""
         sync_thread = Thread(target=self.sync_loop, daemon=True)
         sync_thread.start()
         
+    def start(self):
+        """Запуск координатора встроенным сервером Flask (разработка, отладка без gunicorn)"""
+        self.start_sync_loop()
+        
         # Запуск Flask для health checks
         app.run(host='0.0.0.0', port=8085, debug=False)
 
@@ -0,0 +1,31 @@
+"""
+Gunicorn - конфигурация WSGI сервера CI/CD координатора
+
+Образ запускает gunicorn --config /app/gunicorn.conf.py coordinator:app,
+параметры задаются переменными окружения:
+- WSGI_BIND - адрес и порт;
+- WSGI_WORKERS, WSGI_THREADS - процессы и потоки в каждом (воркер gthread);
+- WSGI_TIMEOUT, WSGI_GRACEFUL_TIMEOUT - перезапуск зависшего воркера и
+  срок завершения текущих запросов при остановке.
+
+Цикл проверки сервисов запускается в каждом воркере при старте, поэтому
+по умолчанию воркер один: запросы /health и /status обслуживают его потоки.
+"""
+import os
+
+
+bind = os.getenv('WSGI_BIND', '0.0.0.0:8085')
+workers = int(os.getenv('WSGI_WORKERS', '1'))
+threads = int(os.getenv('WSGI_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.getenv('WSGI_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('WSGI_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('WSGI_KEEPALIVE', '5'))
+
+accesslog = None
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    from coordinator import CICDCoordinator
+    CICDCoordinator().start_sync_loop()
@@ -2,19 +2,27 @@
 API Server для CI/CD системы - обработка webhook'ов и управление
 """
 import os
+import sqlite3
 import sys
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
 
 # Добавление пути к shared модулям
 sys.path.append('/app')
 
 from shared.logger import get_logger
+from shared.log_index import get_log_index
+from shared.wsgi import install_request_timing, on_worker_start, run
 from pipeline_coordinator import get_pipeline_coordinator
+from dashboard_events import get_event_hub
+from upstream_status import get_upstream_status
+from webhook_inbox import delivery_id, get_webhook_inbox, stored_headers
 from integrations import get_postgres_client
 
 app = Flask(__name__)
 logger = get_logger("api_server")
+install_request_timing(app, "api-server")
 
 # Инициализация клиентов (отложенная)
 coordinator = None
@@ -38,6 +46,11 @@ def get_clients():
     return coordinator, postgres_client
 
 
+# Клиенты и кэш состояния сервисов готовы до первого запроса воркера
+on_worker_start(app, get_clients)
+on_worker_start(app, get_upstream_status)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -67,125 +80,127 @@ def health_check():
         }), 500
 
 
-@app.route('/api/gitlab-webhook', methods=['POST'])
-def gitlab_webhook():
-    """Обработка webhook'ов от GitLab"""
+def _accept_webhook(source: str, event_type: str = None):
+    """
+    Сохранение webhook'а в webhook_inbox и ответ 202
+    
+    Тело не разбирается: обработка выполняется асинхронно (webhook_inbox.py).
+    При ошибке записи - 503, отправитель повторит доставку.
+    """
+    body = request.get_data(cache=False)
+    webhook_delivery_id = delivery_id(request.headers, body)
+    
     try:
-        data = request.get_json()
-        event_type = request.headers.get('X-Gitlab-Event')
-        
-        logger.info("Received GitLab webhook", 
-                   component="webhook_handler",
-                   details={"event_type": event_type})
-        
-        if event_type == 'Pipeline Hook':
-            # Обработка событий пайплайна
-            pipeline_id = data.get('object_attributes', {}).get('id')
-            status = data.get('object_attributes', {}).get('status')
-            
-            logger.info("Pipeline webhook received", 
-                       component="webhook_handler",
-                       details={"pipeline_id": pipeline_id, "status": status})
-        
-        return jsonify({"status": "received"}), 200
-        
+        inserted = get_webhook_inbox().append(source, webhook_delivery_id, event_type,
+                                              stored_headers(request.headers), body)
     except Exception as e:
-        logger.error("Error processing GitLab webhook", 
+        logger.error("Failed to accept webhook",
                     component="webhook_handler",
-                    details={"error": str(e)})
-        return jsonify({"error": str(e)}), 500
+                    details={"source": source, "delivery_id": webhook_delivery_id, "error": str(e)})
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+    
+    logger.info("Webhook accepted",
+               component="webhook_handler",
+               details={"source": source, "event_type": event_type, "delivery_id": webhook_delivery_id,
+                        "duplicate": not inserted})
+    return jsonify({"status": "accepted", "delivery_id": webhook_delivery_id, "duplicate": not inserted}), 202
+
+
+@app.route('/api/gitlab-webhook', methods=['POST'])
+def gitlab_webhook():
+    """Прием webhook'ов от GitLab"""
+    return _accept_webhook("gitlab", request.headers.get('X-Gitlab-Event'))
 
 
 @app.route('/api/sonarqube-webhook', methods=['POST'])
 def sonarqube_webhook():
-    """Обработка webhook'ов от SonarQube"""
+    """Прием webhook'ов от SonarQube"""
+    return _accept_webhook("sonarqube")
+
+
+@app.route('/api/pipeline-completed', methods=['POST'])
+def pipeline_completed():
+    """Уведомление job'а notify_redmine из .gitlab-ci.yml о завершении пайплайна"""
+    return _accept_webhook("pipeline_completed")
+
+
+@app.route('/api/external-file-analyzed', methods=['POST'])
+def external_file_analyzed():
+    """Уведомление job'а notify_redmine_external из .gitlab-ci.yml об анализе внешнего файла"""
+    return _accept_webhook("external_file_analyzed")
+
+
+def _float_arg(name: str):
+    value = request.args.get(name)
+    return float(value) if value else None
+
+
+@app.route('/api/logs/trace/<correlation_id>', methods=['GET'])
+def log_trace(correlation_id):
+    """Все записи операции во всех сервисах по correlation_id из индекса логов"""
+    started = time.monotonic()
     try:
-        data = request.get_json()
-        
-        logger.info("Received SonarQube webhook", 
-                   component="webhook_handler",
-                   details={"project": data.get('project', {}).get('key')})
-        
-        return jsonify({"status": "received"}), 200
-        
-    except Exception as e:
-        logger.error("Error processing SonarQube webhook", 
-                    component="webhook_handler",
-                    details={"error": str(e)})
-        return jsonify({"error": str(e)}), 500
+        trace = get_log_index().trace(correlation_id)
+    except sqlite3.OperationalError as e:
+        # Индекс еще не создан процессом записи логов
+        return jsonify({"error": f"Log index is not available: {e}"}), 503
+    
+    trace["query_ms"] = round((time.monotonic() - started) * 1000, 1)
+    if not trace["records"]:
+        return jsonify(trace), 404
+    return jsonify(trace), 200
+
+
+@app.route('/api/logs/search', methods=['GET'])
+def log_search():
+    """Поиск записей логов по сервису, компоненту, операции, времени и тексту сообщения"""
+    started = time.monotonic()
+    try:
+        records = get_log_index().search(
+            correlation_id=request.args.get('correlation_id'),
+            service=request.args.get('service'),
+            component=request.args.get('component'),
+            operation=request.args.get('operation'),
+            since=_float_arg('since'),
+            until=_float_arg('until'),
+            text=request.args.get('q'),
+            limit=min(int(request.args.get('limit', '500')), 5000)
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"Log index is not available: {e}"}), 503
+    
+    return jsonify({
+        "records": records,
+        "count": len(records),
+        "query_ms": round((time.monotonic() - started) * 1000, 1)
+    }), 200
+
+
+def _cacheable(response, etag: str, max_age: int):
+    """ETag и Cache-Control по снимку состояния; при совпадении If-None-Match - 304 без тела"""
+    response.set_etag(etag)
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
 
 
 @app.route('/status', methods=['GET'])
 def system_status():
-    """Статус всей системы"""
+    """Статус всей системы из кэша состояния внешних сервисов"""
     try:
-        from integrations import get_gitlab_client, get_redmine_client, get_sonarqube_client
+        cache = get_upstream_status()
+        snapshot, etag = cache.get()
         
         status = {
             "system": "1C CI/CD Integration Platform",
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "services": {},
+            "timestamp": snapshot["checked_at"],
+            "services": snapshot["services"],
             "integrations": {},
-            "statistics": {}
+            "statistics": snapshot["statistics"]
         }
         
-        # Проверка PostgreSQL
-        try:
-            coordinator, postgres_client = get_clients()
-            if postgres_client:
-                result = postgres_client.execute_query("SELECT COUNT(*) as count FROM integration_config", fetch=True)
-                status["services"]["postgresql"] = {
-                    "status": "healthy",
-                    "config_entries": result[0]['count'] if result else 0
-                }
-            else:
-                status["services"]["postgresql"] = {"status": "not_initialized"}
-        except Exception as e:
-            status["services"]["postgresql"] = {"status": "error", "error": str(e)}
-        
-        # Проверка GitLab
-        try:
-            gitlab_client = get_gitlab_client()
-            projects = gitlab_client.get_projects()
-            status["services"]["gitlab"] = {
-                "status": "healthy",
-                "projects_count": len(projects) if projects else 0
-            }
-        except Exception as e:
-            status["services"]["gitlab"] = {"status": "error", "error": str(e)}
-        
-        # Проверка Redmine
-        try:
-            redmine_client = get_redmine_client()
-            projects = redmine_client.get_projects()
-            status["services"]["redmine"] = {
-                "status": "healthy",
-                "projects_count": len(projects) if projects else 0
-            }
-        except Exception as e:
-            status["services"]["redmine"] = {"status": "error", "error": str(e)}
-        
-        # Проверка SonarQube
-        try:
-            sonarqube_client = get_sonarqube_client()
-            ready = sonarqube_client.wait_for_sonarqube_ready()
-            status["services"]["sonarqube"] = {
-                "status": "healthy" if ready else "not_ready"
-            }
-        except Exception as e:
-            status["services"]["sonarqube"] = {"status": "error", "error": str(e)}
-        
-        # Статистика пайплайнов
-        try:
-            result = postgres_client.execute_query(
-                "SELECT COUNT(*) as count FROM pipelines WHERE DATE(triggered_at) = CURRENT_DATE", 
-                fetch=True
-            )
-            status["statistics"]["pipelines_today"] = result[0]['count'] if result else 0
-        except:
-            status["statistics"]["pipelines_today"] = 0
-        
-        return jsonify(status), 200
+        return _cacheable(jsonify(status), etag, cache.max_age())
         
     except Exception as e:
         return jsonify({
@@ -195,48 +210,59 @@ def system_status():
         }), 500
 
 
+def _service_label(result: dict, healthy: str = "✅ Healthy") -> str:
+    """Строка статуса сервиса для карточки dashboard"""
+    status = result.get("status")
+    if status == "healthy":
+        return healthy
+    if status in ("unknown", "not_ready"):
+        return "⏳ Initializing"
+    return "❌ Error"
+
+
+@app.route('/dashboard/events', methods=['GET'])
+def dashboard_events():
+    """Поток изменений dashboard (Server-Sent Events)"""
+    hub = get_event_hub()
+    subscriber = hub.subscribe()
+    
+    def stream():
+        try:
+            # Интервал переподключения браузера после обрыва соединения
+            yield "retry: 5000\n\n"
+            while True:
+                event = subscriber.next(15)
+                if event is None:
+                    if subscriber.dropped:
+                        return
+                    # Комментарий SSE держит соединение открытым через прокси
+                    yield ": keepalive\n\n"
+                    continue
+                yield event
+        finally:
+            hub.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
     """HTML Dashboard для мониторинга"""
     try:
-        # Получаем статус системы
-        from integrations import get_gitlab_client, get_redmine_client, get_sonarqube_client
+        # Статус сервисов из кэша: страница не ждет внешние сервисы
+        cache = get_upstream_status()
+        snapshot, etag = cache.get()
+        services = snapshot["services"]
         
-        # Проверяем все сервисы
-        services_status = {}
-        
-        # PostgreSQL
-        try:
-            coordinator, postgres_client = get_clients()
-            if postgres_client:
-                postgres_client.execute_query("SELECT 1", fetch=True)
-                services_status["postgresql"] = "✅ Healthy"
-            else:
-                services_status["postgresql"] = "⏳ Initializing"
-        except:
-            services_status["postgresql"] = "❌ Error"
-        
-        # GitLab
-        try:
-            gitlab_client = get_gitlab_client()
-            projects = gitlab_client.get_projects()
-            services_status["gitlab"] = f"✅ Healthy ({len(projects) if projects else 0} projects)"
-        except:
-            services_status["gitlab"] = "❌ Error"
-        
-        # Redmine
-        try:
-            redmine_client = get_redmine_client()
-            services_status["redmine"] = "✅ Healthy"
-        except:
-            services_status["redmine"] = "❌ Error"
-        
-        # SonarQube
-        try:
-            sonarqube_client = get_sonarqube_client()
-            services_status["sonarqube"] = "✅ Healthy"
-        except:
-            services_status["sonarqube"] = "❌ Error"
+        services_status = {
+            "postgresql": _service_label(services["postgresql"]),
+            "gitlab": _service_label(services["gitlab"],
+                                     f"✅ Healthy ({services['gitlab'].get('projects_count', 0)} projects)"),
+            "redmine": _service_label(services["redmine"]),
+            "sonarqube": _service_label(services["sonarqube"])
+        }
+        checked_at = snapshot["checked_at"][:19].replace('T', ' ') + " UTC" if snapshot["checked_at"] else "—"
         
         html = f"""
         <!DOCTYPE html>
@@ -258,20 +284,24 @@ def dashboard():
                 .links a:hover {{ background: #2980b9; }}
                 .refresh {{ text-align: center; margin: 20px 0; }}
                 .refresh button {{ padding: 10px 20px; background: #27ae60; color: white; border: none; border-radius: 4px; cursor: pointer; }}
-            </style>
+                .pipelines {{ margin-top: 20px; }}
+                .pipelines table {{ width: 100%; border-collapse: collapse; }}
+                .pipelines th, .pipelines td {{ text-align: left; padding: 6px 8px; border-bottom: 1px solid #eee; }}
+                .live {{ color: #7f8c8d; font-size: 14px; }}
+</style>
         </head>
         <body>
             <div class="container">
                 <div class="header">
                     <h1>🚀 1C CI/CD Integration Platform</h1>
                     <p>Система автоматической интеграции и развертывания для 1С</p>
-                    <p><strong>Время обновления:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+                    <p><strong>Время обновления:</strong> <span id="checked-at">{checked_at}</span></p>
                 </div>
                 
                 <div class="services">
                     <div class="service-card">
                         <h3>🗄️ PostgreSQL Database</h3>
-                        <div class="status">{services_status.get('postgresql', '❓ Unknown')}</div>
+                        <div class="status" id="status-postgresql">{services_status.get('postgresql', '❓ Unknown')}</div>
                         <p>Центральная база данных для хранения конфигураций и метаданных</p>
                         <div class="links">
                             <a href="http://localhost:5433" target="_blank">Database (Port 5433)</a>
@@ -280,7 +310,7 @@ def dashboard():
                     
                     <div class="service-card">
                         <h3>🦊 GitLab Repository</h3>
-                        <div class="status">{services_status.get('gitlab', '❓ Unknown')}</div>
+                        <div class="status" id="status-gitlab">{services_status.get('gitlab', '❓ Unknown')}</div>
                         <p>Git репозиторий и CI/CD пайплайны для 1С проектов</p>
                         <div class="links">
                             <a href="http://localhost:8929" target="_blank">GitLab Web UI</a>
@@ -290,7 +320,7 @@ def dashboard():
                     
                     <div class="service-card">
                         <h3>📋 Redmine Project Management</h3>
-                        <div class="status">{services_status.get('redmine', '❓ Unknown')}</div>
+                        <div class="status" id="status-redmine">{services_status.get('redmine', '❓ Unknown')}</div>
                         <p>Управление задачами и внешними файлами</p>
                         <div class="links">
                             <a href="http://localhost:3000" target="_blank">Redmine Web UI</a>
@@ -300,7 +330,7 @@ def dashboard():
                     
                     <div class="service-card">
                         <h3>🔍 SonarQube Code Analysis</h3>
-                        <div class="status">{services_status.get('sonarqube', '❓ Unknown')}</div>
+                        <div class="status" id="status-sonarqube">{services_status.get('sonarqube', '❓ Unknown')}</div>
                         <p>Анализ качества кода и безопасности</p>
                         <div class="links">
                             <a href="http://localhost:9000" target="_blank">SonarQube Web UI</a>
@@ -317,6 +347,26 @@ def dashboard():
                             <a href="http://localhost:8080/status" target="_blank">Status API</a>
                         </div>
                     </div>
+                    
+                    <div class="service-card">
+                        <h3>🔒 Git Lock</h3>
+                        <div class="status" id="git-lock">❓ Unknown</div>
+                        <p id="git-lock-holders"></p>
+                    </div>
+                    
+                    <div class="service-card">
+                        <h3>🔄 Последняя синхронизация</h3>
+                        <div class="status" id="last-sync">❓ Unknown</div>
+                        <p id="last-sync-details"></p>
+                    </div>
+                </div>
+                
+                <div class="service-card pipelines">
+                    <h3>📦 Пайплайны <span class="live" id="live-state">подключение...</span></h3>
+                    <table>
+                        <thead><tr><th>ID</th><th>Тип</th><th>Статус</th><th>Запущен</th><th>Длительность, с</th></tr></thead>
+                        <tbody id="pipelines"></tbody>
+                    </table>
                 </div>
                 
                 <div class="refresh">
@@ -325,18 +375,78 @@ def dashboard():
             </div>
             
             <script>
-                // Автообновление каждые 30 секунд
-                setTimeout(function(){{ location.reload(); }}, 30000);
+                // Живое обновление через Server-Sent Events: сервер присылает только изменения
+                function setText(id, text) {{
+                    var element = document.getElementById(id);
+                    if (element) {{ element.textContent = text; }}
+                }}
+                
+                function serviceLabel(result, healthy) {{
+                    if (result.status === 'healthy') {{ return healthy || '✅ Healthy'; }}
+                    if (result.status === 'unknown' || result.status === 'not_ready') {{ return '⏳ Initializing'; }}
+                    return '❌ Error';
+                }}
+                
+                var pipelines = document.getElementById('pipelines');
+                var events = new EventSource('/dashboard/events');
+                
+                events.onopen = function() {{ setText('live-state', '● live'); }};
+                events.onerror = function() {{ setText('live-state', 'переподключение...'); }};
+                
+                events.addEventListener('services', function(event) {{
+                    var data = JSON.parse(event.data);
+                    Object.keys(data.services).forEach(function(name) {{
+                        var result = data.services[name];
+                        var healthy = name === 'gitlab' ? '✅ Healthy (' + (result.projects_count || 0) + ' projects)' : null;
+                        setText('status-' + name, serviceLabel(result, healthy));
+                    }});
+                    if (data.checked_at) {{
+                        setText('checked-at', data.checked_at.substring(0, 19).replace('T', ' ') + ' UTC');
+                    }}
+                }});
+                
+                events.addEventListener('lock', function(event) {{
+                    var data = JSON.parse(event.data);
+                    setText('git-lock', data.locked === 'unknown' ? '❓ Unknown' : data.locked ? '🔒 Locked' : '🔓 Free');
+                    setText('git-lock-holders', (data.holders || []).map(function(holder) {{
+                        return holder.service + ' (' + holder.mode + ')';
+                    }}).join(', '));
+                }});
+                
+                events.addEventListener('sync', function(event) {{
+                    var data = JSON.parse(event.data);
+                    setText('last-sync', data.success ? '✅ Completed' : '❌ Failed (' + data.outcome + ')');
+                    setText('last-sync-details', data.timestamp);
+                }});
+                
+                events.addEventListener('pipeline', function(event) {{
+                    var data = JSON.parse(event.data);
+                    var row = document.getElementById('pipeline-' + data.id);
+                    if (!row) {{
+                        row = document.createElement('tr');
+                        row.id = 'pipeline-' + data.id;
+                        pipelines.insertBefore(row, pipelines.firstChild);
+                        while (pipelines.children.length > 20) {{ pipelines.removeChild(pipelines.lastChild); }}
+                    }}
+                    row.innerHTML = '';
+                    [data.pipeline_id, data.pipeline_type, data.status, data.triggered_at,
+                     data.duration_seconds === null ? '' : data.duration_seconds].forEach(function(value) {{
+                        var cell = document.createElement('td');
+                        cell.textContent = value === undefined || value === null ? '' : value;
+                        row.appendChild(cell);
+                    }});
+                }});
             </script>
         </body>
         </html>
         """
         
-        return html, 200
+        return _cacheable(app.make_response((html, 200)), f"{etag}-html", cache.max_age())
         
     except Exception as e:
         return f"<h1>Error</h1><p>{str(e)}</p>", 500
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8090, debug=False)
\ No newline at end of file
+    # В контейнере сервер запускает gunicorn (gunicorn.conf.py), здесь - встроенный сервер Flask
+    run(app, port=8090)
\ No newline at end of file
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк логирования: записей в секунду на ядро
+
+Скорость считается по процессорному времени процесса (time.process_time),
+поэтому результат не зависит от загрузки остальных ядер. Потоку записи
+асинхронного логгера при этом засчитывается и его работа.
+
+Запуск: python benchmarks/logging_benchmark.py [--records 200000]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+# Добавление пути к модулям приложения
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shared import logger as logger_module
+from shared.logger import StructuredFormatter, _LogPipeline, new_correlation_id
+
+
+def _rate(count: int, action) -> float:
+    started = time.process_time()
+    action()
+    return count / max(time.process_time() - started, 1e-9)
+
+
+def _records(count: int):
+    details = {"branch": "external-file-42", "files_changed": 12, "duration": 1.25}
+    for i in range(count):
+        record = logging.LogRecord("benchmark", logging.INFO, __file__, 0, "Processed %s", (i,), None)
+        record.component = "benchmark"
+        record.correlation_id = new_correlation_id()
+        record.details = details
+        yield record
+
+
+def bench_formatter(count: int, dumps) -> float:
+    """Форматирование готовых записей заданным сериализатором"""
+    formatter = StructuredFormatter("benchmark")
+    records = list(_records(count))
+    previous, logger_module._dumps = logger_module._dumps, dumps
+    try:
+        return _rate(count, lambda: [formatter.format(record) for record in records])
+    finally:
+        logger_module._dumps = previous
+
+
+def bench_disabled_level(count: int) -> float:
+    """Вызовы debug при уровне INFO: запись не строится"""
+    ci_logger = logger_module.get_logger("benchmark-disabled", "INFO")
+    
+    def run():
+        for i in range(count):
+            ci_logger.debug("Skipped", component="benchmark", details={"i": i})
+    
+    return _rate(count, run)
+
+
+def bench_async_pipeline(count: int) -> float:
+    """Запись через очередь и поток записи в поток в памяти"""
+    pipeline = _LogPipeline()
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(StructuredFormatter("benchmark-async"))
+    
+    bench_logger = logging.getLogger("benchmark-async")
+    bench_logger.handlers = [pipeline.register("benchmark-async", [handler])]
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    
+    def run():
+        for i in range(count):
+            bench_logger.info("Processed %s", i, extra={"component": "benchmark",
+                                                        "correlation_id": new_correlation_id(),
+                                                        "details": {"i": i}})
+        pipeline.flush(60)
+    
+    try:
+        return _rate(count, run)
+    finally:
+        pipeline.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging throughput benchmark")
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+    
+    results = {"formatter (json)": bench_formatter(args.records, logger_module._dumps_stdlib)}
+    if logger_module.orjson is not None:
+        results["formatter (orjson)"] = bench_formatter(args.records, logger_module._dumps_orjson)
+    results["disabled level"] = bench_disabled_level(args.records)
+    results["async pipeline"] = bench_async_pipeline(args.records)
+    
+    for name, rate in results.items():
+        print(f"{name:<22} {rate:>12,.0f} records/s per core")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк webhook'ов API сервера: запросов в секунду и задержки
+
+Клиенты в отдельных потоках отправляют события Pipeline Hook GitLab по
+постоянным соединениям (keep-alive) в течение заданного времени. Сравнение
+режимов запуска: встроенный сервер Flask (python api_server.py) и gunicorn
+(gunicorn --config gunicorn.conf.py api_server:app) с разными
+WSGI_WORKERS/WSGI_THREADS.
+
+Запуск: python benchmarks/webhook_benchmark.py [--url http://localhost:8090/api/gitlab-webhook]
+        [--concurrency 32] [--duration 20]
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from typing import List
+from urllib.parse import urlsplit
+
+
+def _payload(number: int) -> bytes:
+    return json.dumps({
+        "object_kind": "pipeline",
+        "object_attributes": {"id": number, "status": "success", "ref": "master", "duration": 42},
+        "project": {"id": 1, "name": "ut103-ci"}
+    }).encode('utf-8')
+
+
+class _Client(threading.Thread):
+    """Поток, отправляющий запросы по одному соединению до окончания времени"""
+    
+    def __init__(self, url: str, stop_at: float):
+        super().__init__(daemon=True)
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = parts.path or '/'
+        self.stop_at = stop_at
+        self.latencies: List[float] = []
+        self.errors = 0
+    
+    def _connect(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+    
+    def run(self):
+        connection = self._connect()
+        headers = {"Content-Type": "application/json", "X-Gitlab-Event": "Pipeline Hook"}
+        number = 0
+        while time.monotonic() < self.stop_at:
+            number += 1
+            started = time.perf_counter()
+            try:
+                connection.request("POST", self.path, body=_payload(number), headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 300:
+                    self.errors += 1
+                    continue
+                self.latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self._connect()
+        connection.close()
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook load benchmark")
+    parser.add_argument("--url", default="http://localhost:8090/api/gitlab-webhook")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    
+    started = time.monotonic()
+    clients = [_Client(args.url, started + args.duration) for _ in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - started
+    
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    errors = sum(client.errors for client in clients)
+    print(f"requests     {len(latencies):>10,}  errors {errors}")
+    print(f"throughput   {len(latencies) / elapsed:>10,.0f} requests/s ({args.concurrency} clients)")
+    for percent in (50, 95, 99):
+        print(f"p{percent:<11} {_percentile(latencies, percent) * 1000:>10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Dashboard Events - поток событий живого dashboard API сервера (Server-Sent Events)
+
+Один фоновый поток опрашивает источники раз в DASHBOARD_EVENT_INTERVAL
+секунд, пока открыта хотя бы одна страница, и рассылает только изменения:
+- services - состояние внешних сервисов из кэша upstream_status;
+- lock - статус Git блокировки;
+- pipeline - смена статуса пайплайна (таблица pipelines);
+- sync - завершение цикла синхронизации gitsync (индекс логов).
+Событие сериализуется один раз и раздается всем подписчикам, поэтому
+стоимость опроса не зависит от числа открытых страниц. Новый подписчик
+сразу получает последнее состояние каждого источника.
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+# Добавление пути к shared модулям
+sys.path.append('/app')
+
+from shared.git_lock import get_git_coordinator
+from shared.log_index import get_log_index, parse_timestamp
+from shared.logger import get_logger
+from integrations import get_postgres_client
+from upstream_status import get_upstream_status
+
+
+logger = get_logger("dashboard_events")
+
+# Поля статуса блокировки, меняющиеся без изменения состояния
+_VOLATILE_LOCK_FIELDS = ("age_seconds", "heartbeat_age_seconds")
+
+
+def _lock_signature(status: Dict[str, Any]) -> str:
+    """Статус блокировки без возраста держателей - изменение означает смену состояния"""
+    stable = {key: value for key, value in status.items() if key != "holders"}
+    stable["holders"] = [{key: value for key, value in holder.items() if key not in _VOLATILE_LOCK_FIELDS}
+                         for holder in status.get("holders", [])]
+    return json.dumps(stable, sort_keys=True, default=str)
+
+
+class Subscriber:
+    """Очередь событий одной открытой страницы"""
+    
+    def __init__(self, queue_size: int):
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+    
+    def next(self, timeout: float) -> Optional[str]:
+        """Следующее событие в формате SSE или None по таймауту"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DashboardEventHub:
+    """Общий источник событий для всех подписчиков"""
+    
+    def __init__(self, interval: float = None, queue_size: int = None):
+        self.interval = interval or float(os.getenv('DASHBOARD_EVENT_INTERVAL', '2'))
+        self.queue_size = queue_size or int(os.getenv('DASHBOARD_EVENT_QUEUE_SIZE', '256'))
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._running = False
+        # Последнее событие каждого источника для новых подписчиков: ключ -> строка SSE
+        self._last: Dict[str, str] = {}
+        # Состояние источников на предыдущем опросе
+        self._services_etag: Optional[str] = None
+        self._lock_signature: Optional[str] = None
+        self._pipelines: Dict[Any, tuple] = {}
+        self._sync_since: Optional[float] = None
+    
+    def subscribe(self) -> Subscriber:
+        """Подписка страницы; первый подписчик запускает опрос источников"""
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            for event in self._last.values():
+                subscriber.queue.put_nowait(event)
+            self._subscribers.add(subscriber)
+            start = not self._running
+            self._running = True
+        if start:
+            threading.Thread(target=self._run, name="dashboard-events", daemon=True).start()
+        return subscriber
+    
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+    
+    def publish(self, event_type: str, data: Dict[str, Any], key: str = None):
+        """
+        Рассылка события всем подписчикам
+        
+        Подписчик, не успевающий читать поток, отключается: браузер
+        переподключается и получает текущее состояние заново.
+        """
+        event = f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        with self._lock:
+            self._last[key or event_type] = event
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.queue.put_nowait(event)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._running = False
+                    return
+            self.poll()
+            time.sleep(self.interval)
+    
+    def poll(self):
+        """Один опрос всех источников"""
+        for source in (self._poll_services, self._poll_lock, self._poll_pipelines, self._poll_sync):
+            try:
+                source()
+            except Exception as e:
+                logger.debug("Dashboard event source failed",
+                            component="dashboard_events",
+                            details={"source": source.__name__, "error": str(e)})
+    
+    def _poll_services(self):
+        snapshot, etag = get_upstream_status().get()
+        if etag != self._services_etag:
+            self._services_etag = etag
+            self.publish("services", {"services": snapshot["services"], "statistics": snapshot["statistics"],
+                                      "checked_at": snapshot["checked_at"]})
+    
+    def _poll_lock(self):
+        status = get_git_coordinator().get_lock_status()
+        signature = _lock_signature(status)
+        if signature != self._lock_signature:
+            self._lock_signature = signature
+            self.publish("lock", status)
+    
+    def _poll_pipelines(self):
+        rows = get_postgres_client().get_recent_pipelines(limit=20) or []
+        current = {}
+        for row in reversed(rows):
+            state = (row.get("status"), str(row.get("completed_at")))
+            current[row["id"]] = state
+            if self._pipelines.get(row["id"]) != state:
+                self.publish("pipeline", {
+                    "id": row["id"],
+                    "pipeline_id": row.get("pipeline_id"),
+                    "pipeline_type": row.get("pipeline_type"),
+                    "status": row.get("status"),
+                    "triggered_at": row.get("triggered_at"),
+                    "completed_at": row.get("completed_at"),
+                    "duration_seconds": row.get("duration_seconds")
+                }, key=f"pipeline:{row['id']}")
+        
+        # Новым подписчикам передаются только пайплайны из последней выборки
+        with self._lock:
+            for pipeline_db_id in set(self._pipelines) - set(current):
+                self._last.pop(f"pipeline:{pipeline_db_id}", None)
+        self._pipelines = current
+    
+    def _poll_sync(self):
+        first_poll = self._sync_since is None
+        since = time.time() - 86400 if first_poll else self._sync_since
+        records = get_log_index().search(service="gitsync", operation="sync_cycle", since=since, limit=1000)
+        if not records:
+            return
+        self._sync_since = parse_timestamp(records[-1]["timestamp"]) + 1e-6
+        
+        # Итоговая запись цикла (GitSyncService._sync_cycle) пишется всегда и содержит outcome
+        cycles = [record for record in records if record.get("message") == "Sync cycle finished"]
+        # При первом опросе - только последний цикл: история не нужна странице
+        for record in cycles[-1:] if first_poll else cycles:
+            details = record.get("details") or {}
+            self.publish("sync", {
+                "timestamp": record["timestamp"],
+                "success": details.get("outcome") == "success",
+                "outcome": details.get("outcome"),
+                "correlation_id": record.get("correlation_id"),
+                "details": details
+            })
+
+
+# Глобальный источник событий
+_event_hub: Optional[DashboardEventHub] = None
+_event_hub_lock = threading.Lock()
+
+
+def get_event_hub() -> DashboardEventHub:
+    """Получение общего источника событий dashboard"""
+    global _event_hub
+    if _event_hub is None:
+        with _event_hub_lock:
+            if _event_hub is None:
+                _event_hub = DashboardEventHub()
+    return _event_hub
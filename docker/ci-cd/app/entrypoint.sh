@@ -67,10 +67,14 @@ check_1c_storage() {
 create_directories() {
     log "Creating necessary directories..."
     
-    mkdir -p "$WORKSPACE_PATH/external-files"
+    mkdir -p "${EXTERNAL_FILES_PATH:-/precommit-worktree/external-files}"
     mkdir -p "/logs"
     mkdir -p "/tmp/1c"
     
+    # Файлы метрик прошлого запуска контейнера не должны попасть в /metrics
+    rm -rf "/tmp/prometheus-multiproc"
+    mkdir -p "/tmp/prometheus-multiproc"
+    
     log "Directories created successfully"
 }
 
@@ -0,0 +1,207 @@
+"""
+Change Set - извлечение изменений между коммитами с агрегацией до объектов метаданных 1С
+"""
+import subprocess
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+
+# Каталоги выгрузки конфигурации 1С (DumpConfigToFiles) - типы объектов метаданных
+METADATA_TYPES = {
+    'AccountingRegisters', 'AccumulationRegisters', 'BusinessProcesses',
+    'CalculationRegisters', 'Catalogs', 'ChartsOfAccounts',
+    'ChartsOfCalculationTypes', 'ChartsOfCharacteristicTypes', 'CommandGroups',
+    'CommonAttributes', 'CommonCommands', 'CommonForms', 'CommonModules',
+    'CommonPictures', 'CommonTemplates', 'Constants', 'DataProcessors',
+    'DefinedTypes', 'DocumentJournals', 'DocumentNumerators', 'Documents',
+    'Enums', 'EventSubscriptions', 'ExchangePlans', 'FilterCriteria',
+    'FunctionalOptions', 'FunctionalOptionsParameters', 'HTTPServices',
+    'InformationRegisters', 'Languages', 'Reports', 'Roles', 'ScheduledJobs',
+    'Sequences', 'SessionParameters', 'SettingsStorages', 'StyleItems',
+    'Styles', 'Subsystems', 'Tasks', 'WebServices', 'WSReferences',
+    'XDTOPackages'
+}
+
+# Объект для файлов вне каталогов метаданных (Configuration.xml, служебные файлы)
+OTHER_OBJECT = ('Other', '*')
+
+_READ_CHUNK = 64 * 1024
+
+# Сохраняемый хвост stderr git для сообщения об ошибке
+_STDERR_LIMIT = 64 * 1024
+
+
+def metadata_object_for_path(path: str) -> Tuple[str, str]:
+    """
+    Определение объекта метаданных по пути файла выгрузки
+    
+    Примеры:
+        src/cf/Catalogs/Номенклатура/Ext/ObjectModule.bsl -> ('Catalogs', 'Номенклатура')
+        Documents/ЗаказПокупателя.xml -> ('Documents', 'ЗаказПокупателя')
+        Configuration.xml -> ('Other', '*')
+    """
+    parts = path.split('/')
+    for index, part in enumerate(parts[:-1]):
+        if part in METADATA_TYPES:
+            name = parts[index + 1]
+            if name.endswith('.xml'):
+                name = name[:-4]
+            return part, name
+    return OTHER_OBJECT
+
+
+def _iter_numstat_records(stream, chunk_size: int = _READ_CHUNK) -> Iterator[Tuple[str, str, str]]:
+    """Потоковый разбор вывода `git diff-tree -z --numstat` без загрузки в память целиком"""
+    buffer = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        
+        buffer += chunk
+        *records, buffer = buffer.split(b'\0')
+        for record in records:
+            if not record:
+                continue
+            fields = record.split(b'\t', 2)
+            if len(fields) != 3:
+                continue
+            added, deleted, path = fields
+            yield added.decode('ascii'), deleted.decode('ascii'), path.decode('utf-8', errors='replace')
+
+
+def collect_change_set(repo_path: str, head: str, base: Optional[str] = None,
+                       timeout: int = 120) -> Dict[str, Any]:
+    """
+    Сбор изменений между base и head с агрегацией до объектов метаданных
+    
+    Память пропорциональна числу измененных объектов, а не размеру диффа:
+    список файлов не сохраняется.
+    
+    Args:
+        repo_path: Путь к Git репозиторию
+        head: Коммит, до которого собираются изменения
+        base: Предыдущий отправленный коммит; если не задан - изменения коммита head
+        timeout: Таймаут выполнения git в секундах, включая чтение вывода
+    
+    Returns:
+        Dict[str, Any]: base, head, files_changed, lines_added, lines_deleted,
+        objects - список {"type", "name", "files", "added", "deleted"}
+    
+    Raises:
+        subprocess.TimeoutExpired: git не завершился за timeout секунд
+        subprocess.CalledProcessError: git завершился с ошибкой
+    """
+    if base and base == head:
+        return {"base": base, "head": head, "files_changed": 0, "lines_added": 0,
+                "lines_deleted": 0, "objects": []}
+    
+    cmd = ['git', 'diff-tree', '-r', '-z', '--numstat', '--no-renames']
+    if base:
+        cmd += [base, head]
+    else:
+        cmd += ['--root', head]
+    
+    objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    files_changed = 0
+    lines_added = 0
+    lines_deleted = 0
+    
+    process = subprocess.Popen(cmd, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    # stderr читается параллельно: заполненный канал stderr остановил бы git
+    stderr_chunks: List[bytes] = []
+    
+    def drain_stderr():
+        size = 0
+        for chunk in iter(lambda: process.stderr.read(_READ_CHUNK), b''):
+            if size < _STDERR_LIMIT:
+                stderr_chunks.append(chunk)
+                size += len(chunk)
+    
+    stderr_reader = threading.Thread(target=drain_stderr, name="git-stderr", daemon=True)
+    stderr_reader.start()
+    
+    # Таймаут ограничивает и чтение вывода: зависший git завершается, чтение получает EOF
+    timed_out = threading.Event()
+    
+    def on_timeout():
+        timed_out.set()
+        process.kill()
+    
+    watchdog = threading.Timer(timeout, on_timeout)
+    watchdog.daemon = True
+    watchdog.start()
+    
+    try:
+        records = _iter_numstat_records(process.stdout)
+        
+        # При --root первой записью идет хеш коммита без табуляций - он отбрасывается парсером
+        for added, deleted, path in records:
+            metadata_type, name = metadata_object_for_path(path)
+            entry = objects.get((metadata_type, name))
+            if entry is None:
+                entry = {"type": metadata_type, "name": name, "files": 0, "added": 0, "deleted": 0}
+                objects[(metadata_type, name)] = entry
+            
+            entry["files"] += 1
+            files_changed += 1
+            
+            # Для бинарных файлов numstat выводит "-"
+            if added != '-':
+                entry["added"] += int(added)
+                lines_added += int(added)
+            if deleted != '-':
+                entry["deleted"] += int(deleted)
+                lines_deleted += int(deleted)
+        
+        returncode = process.wait()
+        stderr_reader.join()
+    
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    
+    finally:
+        watchdog.cancel()
+        process.stdout.close()
+    
+    process.stderr.close()
+    stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+    
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, stderr=stderr)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    
+    return {
+        "base": base,
+        "head": head,
+        "files_changed": files_changed,
+        "lines_added": lines_added,
+        "lines_deleted": lines_deleted,
+        "objects": sorted(objects.values(), key=lambda o: (o["type"], o["name"]))
+    }
+
+
+def build_sonar_inclusions(objects: List[Dict[str, Any]], max_objects: int = 200) -> Optional[str]:
+    """
+    Построение значения sonar.inclusions по измененным объектам метаданных
+    
+    Returns:
+        Optional[str]: Шаблоны через запятую или None, если нужен полный анализ:
+        изменены файлы уровня конфигурации, объектов слишком много или их нет
+    """
+    if not objects or len(objects) > max_objects:
+        return None
+    
+    patterns = []
+    for obj in objects:
+        if (obj["type"], obj["name"]) == OTHER_OBJECT:
+            return None
+        # Каталог объекта и его собственное описание <Тип>/<Имя>.xml
+        patterns.append(f"**/{obj['type']}/{obj['name']}/**")
+        patterns.append(f"**/{obj['type']}/{obj['name']}.xml")
+    
+    return ','.join(patterns)
@@ -2,6 +2,7 @@
 GitSync Service - сервис синхронизации хранилища 1С с Git репозиторием
 """
 import os
+import re
 import time
 import subprocess
 import signal
@@ -15,6 +16,14 @@ sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
 from shared.git_lock import get_git_coordinator
+from shared.metrics import SYNC_CYCLE_SECONDS
+from shared.process_runner import ProcessRunner
+from gitsync.storage_watcher import StorageWatcher
+from gitsync.change_set import collect_change_set
+
+
+# Строки вывода gitsync о начале обработки очередной версии хранилища
+_VERSION_PROGRESS_RE = re.compile(r'(?:верси[яиюей]+|version)\D{0,20}(\d+)', re.IGNORECASE)
 
 
 class GitSyncService:
@@ -23,6 +32,7 @@ class GitSyncService:
     def __init__(self):
         self.logger = get_logger("gitsync")
         self.git_coordinator = get_git_coordinator()
+        self.process_runner = ProcessRunner("gitsync")
         self.running = True
         
         # Конфигурация из переменных окружения
@@ -30,10 +40,22 @@ class GitSyncService:
         self.storage_user = os.getenv('GITSYNC_STORAGE_USER', 'gitsync')
         self.storage_password = self._get_secret('GITSYNC_STORAGE_PASSWORD')
         self.sync_interval = int(os.getenv('GITSYNC_SYNC_INTERVAL', '600'))  # 10 минут
+        # Таймаут gitsync sync; вместе с запасом должен укладываться в GIT_LOCK_MAX_HOLD
+        self.sync_timeout = int(os.getenv('GITSYNC_TIMEOUT', '200'))
         self.workspace_path = os.getenv('WORKSPACE_PATH', '/workspace')
         self.gitlab_url = os.getenv('GITLAB_URL', '')
         self.gitlab_token = self._get_secret('GITLAB_TOKEN')
         
+        # Запуск синхронизации по изменению хранилища: watch - по событиям, interval - по таймеру
+        self.trigger_mode = os.getenv('GITSYNC_TRIGGER_MODE', 'watch').lower()
+        self.storage_local_path = os.getenv('GITSYNC_STORAGE_LOCAL_PATH', '/1c-storage')
+        self.probe_interval = int(os.getenv('GITSYNC_PROBE_INTERVAL', '5'))
+        self.debounce_seconds = int(os.getenv('GITSYNC_DEBOUNCE_SECONDS', '10'))
+        self.progress_log_interval = int(os.getenv('GITSYNC_PROGRESS_LOG_INTERVAL', '30'))
+        self._last_progress_log = 0.0
+        self._progress_versions = 0
+        self.storage_watcher: Optional[StorageWatcher] = None
+        
         # Настройка обработчиков сигналов
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -45,7 +67,8 @@ class GitSyncService:
                             "storage_user": self.storage_user,
                             "sync_interval": self.sync_interval,
                             "workspace_path": self.workspace_path,
-                            "gitlab_url": self.gitlab_url
+                            "gitlab_url": self.gitlab_url,
+                            "trigger_mode": self.trigger_mode
                         })
     
     def _get_secret(self, env_var: str) -> str:
@@ -150,7 +173,7 @@ class GitSyncService:
             self.logger.info("GitSync configuration updated", 
                            component="config",
                            details={"config_path": config_path})
-            
+        
         except Exception as e:
             self.logger.error("Failed to update GitSync configuration", 
                             component="config",
@@ -182,16 +205,15 @@ class GitSyncService:
                                correlation_id=correlation_id)
             
             # Проверка доступа к хранилищу 1С
-            storage_local_path = "/1c-storage"
-            if not os.path.exists(storage_local_path):
+            if not os.path.exists(self.storage_local_path):
                 self.logger.warning("1C storage not mounted", 
                                   component="prerequisites",
-                                  details={"path": storage_local_path},
+                                  details={"path": self.storage_local_path},
                                   correlation_id=correlation_id)
             
             log_operation_success("gitsync", "prerequisites_check", correlation_id)
             return True
-            
+        
         except Exception as e:
             log_operation_error("gitsync", "prerequisites_check", correlation_id, e)
             return False
@@ -247,13 +269,19 @@ class GitSyncService:
             
             log_operation_success("gitsync", "git_init", correlation_id)
             return True
-            
+        
         except Exception as e:
             log_operation_error("gitsync", "git_init", correlation_id, e)
             return False
     
-    def _execute_gitsync(self):
-        """Выполнение синхронизации GitSync"""
+    def _execute_gitsync(self, lease=None):
+        """
+        Выполнение синхронизации GitSync
+        
+        Args:
+            lease: Аренда блокировки Git; продлевается по строкам вывода gitsync,
+                поэтому зависший без вывода процесс теряет блокировку
+        """
         correlation_id = log_operation_start("gitsync", "sync_execution")
         
         try:
@@ -277,33 +305,54 @@ class GitSyncService:
                            details={"command": ' '.join(cmd)},
                            correlation_id=correlation_id)
             
-            start_time = time.time()
+            def on_line(line: str):
+                if lease:
+                    lease.renew()
+                self._on_sync_output(line, correlation_id)
             
-            # Выполнение команды
-            result = subprocess.run(
+            # Выполнение команды с потоковым чтением вывода
+            result = self.process_runner.run(
                 cmd,
+                run_name="sync",
+                timeout=self.sync_timeout,
                 cwd=self.workspace_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=300,  # 5 минут таймаут
-                env=env
+                env=env,
+                on_line=on_line,
+                correlation_id=correlation_id
             )
             
-            duration = time.time() - start_time
+            duration = result["duration"]
+            
+            if result["timed_out"]:
+                error_msg = "GitSync execution timed out"
+                self.logger.error(error_msg, 
+                                component="sync_execution",
+                                details={
+                                    "output_tail": result["output_tail"],
+                                    "log_file": result["log_file"]
+                                },
+                                correlation_id=correlation_id)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "duration": duration,
+                    "log_file": result["log_file"],
+                    "timestamp": datetime.utcnow().isoformat()
+                }
             
             sync_result = {
-                "success": result.returncode == 0,
-                "exit_code": result.returncode,
+                "success": result["exit_code"] == 0,
+                "exit_code": result["exit_code"],
                 "duration": duration,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
+                "output_tail": result["output_tail"],
+                "output_lines": result["output_lines"],
+                "log_file": result["log_file"],
                 "timestamp": datetime.utcnow().isoformat()
             }
             
             if sync_result["success"]:
                 log_operation_success("gitsync", "sync_execution", correlation_id, 
-                                    {"duration": duration})
+                                    {"duration": duration, "output_lines": result["output_lines"]})
             else:
                 self.logger.error("GitSync execution failed", 
                                 component="sync_execution",
@@ -311,18 +360,7 @@ class GitSyncService:
                                 correlation_id=correlation_id)
             
             return sync_result
-            
-        except subprocess.TimeoutExpired:
-            error_msg = "GitSync execution timed out"
-            self.logger.error(error_msg, 
-                            component="sync_execution",
-                            correlation_id=correlation_id)
-            return {
-                "success": False,
-                "error": error_msg,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
+        
         except Exception as e:
             log_operation_error("gitsync", "sync_execution", correlation_id, e)
             return {
@@ -331,8 +369,40 @@ class GitSyncService:
                 "timestamp": datetime.utcnow().isoformat()
             }
     
-    def _push_to_gitlab(self) -> Tuple[bool, str]:
-        """Отправка изменений в GitLab"""
+    def _on_sync_output(self, line: str, correlation_id: str):
+        """
+        Разбор строки вывода gitsync: события прогресса по версиям хранилища
+        
+        В лог INFO попадает не чаще одной записи за GITSYNC_PROGRESS_LOG_INTERVAL
+        секунд с числом версий, обработанных с предыдущей записи.
+        """
+        match = _VERSION_PROGRESS_RE.search(line)
+        if not match:
+            return
+        
+        self._progress_versions += 1
+        now = time.monotonic()
+        if now - self._last_progress_log < self.progress_log_interval:
+            return
+        
+        self.logger.info("GitSync progress", 
+                       component="sync_execution",
+                       details={
+                           "storage_version": int(match.group(1)),
+                           "versions_since_last_report": self._progress_versions,
+                           "line": line[:200]
+                       },
+                       correlation_id=correlation_id)
+        self._last_progress_log = now
+        self._progress_versions = 0
+    
+    def _push_to_gitlab(self, lease=None) -> Tuple[bool, str]:
+        """
+        Отправка изменений в GitLab
+        
+        Args:
+            lease: Аренда блокировки Git; перед push проверяется, что она не перехвачена
+        """
         if not self.gitlab_url:
             self.logger.info("GitLab URL not configured, skipping push", 
                            component="git_push")
@@ -363,7 +433,9 @@ class GitSyncService:
                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
             commit_hash = commit_result.stdout.strip() if commit_result.returncode == 0 else ""
             
-            # Отправка в GitLab
+            # Отправка в GitLab, если блокировку не перехватили за время синхронизации
+            if lease:
+                lease.check()
             push_cmd = ['git', 'push', 'origin', 'master']
             
             result = subprocess.run(
@@ -386,71 +458,215 @@ class GitSyncService:
                                 },
                                 correlation_id=correlation_id)
                 return False, commit_hash
-                
+        
         except Exception as e:
             log_operation_error("gitsync", "git_push", correlation_id, e)
             return False, ""
     
-    def _sync_cycle(self):
-        """Один цикл синхронизации"""
+    def _last_pushed_state_path(self) -> str:
+        """Файл с хешем последнего коммита, для которого запущен пайплайн"""
+        return os.path.join(self.workspace_path, '.git', 'cicd-last-pushed-commit')
+    
+    def _get_last_pushed_commit(self) -> Optional[str]:
+        """Получение последнего обработанного коммита (до отправки новых изменений)"""
+        try:
+            with open(self._last_pushed_state_path(), 'r') as f:
+                commit_hash = f.read().strip()
+                if commit_hash:
+                    return commit_hash
+        except OSError:
+            pass
+        
+        # Первый запуск: состояние remote-ветки до отправки
+        result = subprocess.run(['git', 'rev-parse', '--verify', '-q', 'origin/master'], 
+                              cwd=self.workspace_path,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
+        return result.stdout.strip() if result.returncode == 0 and result.stdout.strip() else None
+    
+    def _save_last_pushed_commit(self, commit_hash: str):
+        """Сохранение последнего обработанного коммита"""
+        try:
+            with open(self._last_pushed_state_path(), 'w') as f:
+                f.write(commit_hash)
+        except OSError as e:
+            self.logger.warning("Failed to save last pushed commit", 
+                              component="change_set",
+                              details={"error": str(e)})
+    
+    def _collect_changes(self, base_commit: Optional[str], commit_hash: str, 
+                         correlation_id: str) -> Dict[str, Any]:
+        """Сбор изменений между отправленными коммитами на уровне объектов метаданных"""
+        try:
+            change_set = collect_change_set(self.workspace_path, commit_hash, base=base_commit)
+            
+            self.logger.info("Change set collected", 
+                           component="change_set",
+                           details={
+                               "base": change_set["base"],
+                               "head": commit_hash,
+                               "files_changed": change_set["files_changed"],
+                               "objects_changed": len(change_set["objects"])
+                           },
+                           correlation_id=correlation_id)
+            return change_set
+        
+        except Exception as e:
+            self.logger.error("Failed to collect change set", 
+                            component="change_set",
+                            details={"base": base_commit, "head": commit_hash, "error": str(e)},
+                            correlation_id=correlation_id)
+            return {
+                "base": base_commit,
+                "head": commit_hash,
+                "files_changed": 0,
+                "lines_added": 0,
+                "lines_deleted": 0,
+                "objects": []
+            }
+    
+    def _sync_cycle(self) -> bool:
+        """
+        Один цикл синхронизации
+        
+        Блокировки по фазам:
+        - gitsync sync переписывает рабочее дерево, индекс и HEAD - исключительная
+          блокировка репозитория;
+        - проверка и отправка master - блокировка ветки master, коммиты в ветки
+          external-file-* в это время идут параллельно;
+        - сбор изменений только читает объекты - разделяемая блокировка.
+        """
         cycle_id = log_operation_start("gitsync", "sync_cycle")
+        started = time.monotonic()
+        outcome = "error"
+        commit_hash = None
         
         try:
-            # Получение блокировки Git репозитория
-            with self.git_coordinator.acquire_lock("gitsync", timeout=300):
-                
+            # 1С может долго работать без вывода, а аренда продлевается по выводу:
+            # срок аренды не короче таймаута синхронизации
+            with self.git_coordinator.acquire_lock("gitsync", timeout=300,
+                                                   max_hold=self.sync_timeout + 30,
+                                                   lease_ttl=self.sync_timeout + 30) as lease:
                 # Выполнение GitSync
-                sync_result = self._execute_gitsync()
+                sync_result = self._execute_gitsync(lease)
+            
+            if not sync_result["success"]:
+                self.logger.error("Sync cycle failed", 
+                                component="sync_cycle",
+                                details=sync_result,
+                                correlation_id=cycle_id)
+                outcome = "sync_failed"
+                return False
+            
+            with self.git_coordinator.acquire_lock("gitsync", timeout=300, refs=["master"],
+                                                   max_hold=180, lease_ttl=180) as lease:
+                # Коммит, с которого считаются изменения для пайплайна
+                base_commit = self._get_last_pushed_commit()
+                
+                # Отправка в GitLab при успешной синхронизации
+                push_success, commit_hash = self._push_to_gitlab(lease)
+            
+            if push_success and commit_hash and commit_hash == base_commit:
+                # Новых коммитов нет - изменения этого коммита уже переданы в пайплайн
+                self.logger.info("No new commits since last pipeline", 
+                               component="sync_cycle",
+                               details={"commit_hash": commit_hash},
+                               correlation_id=cycle_id)
+            
+            elif push_success and commit_hash:
+                with self.git_coordinator.acquire_lock("gitsync", timeout=300, shared=True,
+                                                       max_hold=180, lease_ttl=180):
+                    change_set = self._collect_changes(base_commit, commit_hash, cycle_id)
+                pipeline_id = None
                 
-                if sync_result["success"]:
-                    # Отправка в GitLab при успешной синхронизации
-                    push_success, commit_hash = self._push_to_gitlab()
+                # Запуск пайплайна через Pipeline Coordinator
+                try:
+                    from pipeline_coordinator import get_pipeline_coordinator
+                    coordinator = get_pipeline_coordinator()
                     
-                    if push_success and commit_hash:
-                        # Запуск пайплайна через Pipeline Coordinator
-                        try:
-                            from pipeline_coordinator import get_pipeline_coordinator
-                            coordinator = get_pipeline_coordinator()
-                            
-                            # Подготовка информации об изменениях
-                            changes_info = [
-                                {
-                                    "type": "gitsync_sync",
-                                    "timestamp": sync_result.get("timestamp"),
-                                    "duration": sync_result.get("duration")
-                                }
-                            ]
-                            
-                            pipeline_id = coordinator.trigger_gitsync_pipeline(
-                                commit_hash=commit_hash,
-                                changes_info=changes_info
-                            )
-                            
-                            if pipeline_id:
-                                self.logger.info("Pipeline triggered successfully", 
-                                               component="sync_cycle",
-                                               details={"pipeline_id": pipeline_id},
-                                               correlation_id=cycle_id)
-                            
-                        except Exception as e:
-                            self.logger.error("Failed to trigger pipeline", 
-                                            component="sync_cycle",
-                                            details={"error": str(e)},
-                                            correlation_id=cycle_id)
+                    pipeline_id = coordinator.trigger_gitsync_pipeline(
+                        commit_hash=commit_hash,
+                        changes_info=change_set["objects"],
+                        change_summary={
+                            "base_commit": change_set["base"],
+                            "files_changed": change_set["files_changed"],
+                            "lines_added": change_set["lines_added"],
+                            "lines_deleted": change_set["lines_deleted"],
+                            "sync_duration": sync_result.get("duration")
+                        }
+                    )
                     
-                    log_operation_success("gitsync", "sync_cycle", cycle_id, {
-                        "sync_duration": sync_result.get("duration"),
-                        "push_success": push_success,
-                        "commit_hash": commit_hash
-                    })
-                else:
-                    self.logger.error("Sync cycle failed", 
+                    if pipeline_id:
+                        self.logger.info("Pipeline triggered successfully", 
+                                       component="sync_cycle",
+                                       details={"pipeline_id": pipeline_id},
+                                       correlation_id=cycle_id)
+                
+                except Exception as e:
+                    self.logger.error("Failed to trigger pipeline", 
                                     component="sync_cycle",
-                                    details=sync_result,
+                                    details={"error": str(e)},
                                     correlation_id=cycle_id)
-                    
+                
+                # Без запущенного пайплайна диапазон будет включен в следующий запуск
+                if pipeline_id:
+                    self._save_last_pushed_commit(commit_hash)
+            
+            log_operation_success("gitsync", "sync_cycle", cycle_id, {
+                "sync_duration": sync_result.get("duration"),
+                "push_success": push_success,
+                "commit_hash": commit_hash
+            })
+            outcome = "success" if push_success else "push_failed"
+            return push_success
+        
         except Exception as e:
             log_operation_error("gitsync", "sync_cycle", cycle_id, e)
+            return False
+        
+        finally:
+            duration = time.monotonic() - started
+            SYNC_CYCLE_SECONDS.labels(outcome=outcome).observe(duration)
+            # Итог цикла для dashboard: записи log_operation_* проходят выборку,
+            # а завершение с ошибкой отправки пишется как успешное
+            self.logger.info("Sync cycle finished",
+                           component="sync_cycle",
+                           details={"outcome": outcome, "duration": round(duration, 3),
+                                    "commit_hash": commit_hash},
+                           correlation_id=cycle_id,
+                           operation="sync_cycle")
+    
+    def _setup_storage_watcher(self):
+        """Настройка отслеживания изменений хранилища 1С"""
+        if self.trigger_mode != 'watch':
+            return
+        
+        if not os.path.isdir(self.storage_local_path):
+            self.logger.warning("1C storage not mounted, falling back to interval sync", 
+                              component="storage_watcher",
+                              details={"path": self.storage_local_path})
+            return
+        
+        self.storage_watcher = StorageWatcher(
+            self.storage_local_path,
+            probe_interval=self.probe_interval,
+            debounce_seconds=self.debounce_seconds
+        )
+    
+    def _wait_interval(self):
+        """Ожидание до следующего цикла по таймеру"""
+        for _ in range(self.sync_interval):
+            if not self.running:
+                break
+            time.sleep(1)
+    
+    def _wait_for_next_cycle(self, last_cycle_success: bool):
+        """Ожидание следующего цикла: изменения хранилища или таймер"""
+        if self.storage_watcher is None or not last_cycle_success:
+            # Без наблюдателя или после ошибки - повтор по таймеру
+            self._wait_interval()
+            return
+        
+        self.storage_watcher.wait_for_change(lambda: self.running)
     
     def run(self):
         """Основной цикл работы сервиса"""
@@ -469,21 +685,32 @@ class GitSyncService:
             self.logger.error("Git repository initialization failed, exiting", component="main")
             return 1
         
+        # Настройка отслеживания изменений хранилища
+        self._setup_storage_watcher()
+        
         self.logger.info("GitSync service started successfully", 
                         component="main",
-                        details={"sync_interval": self.sync_interval})
+                        details={
+                            "sync_interval": self.sync_interval,
+                            "trigger_mode": "watch" if self.storage_watcher else "interval"
+                        })
         
         # Основной цикл
         while self.running:
             try:
-                self._sync_cycle()
+                if self.storage_watcher:
+                    # Отпечаток снимается до синхронизации: изменения во время
+                    # синхронизации запустят следующий цикл
+                    fingerprint = self.storage_watcher.fingerprint()
+                    success = self._sync_cycle()
+                    if success:
+                        self.storage_watcher.mark_synced(fingerprint)
+                else:
+                    success = self._sync_cycle()
                 
                 # Ожидание до следующего цикла
-                for _ in range(self.sync_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
-                    
+                self._wait_for_next_cycle(success)
+            
             except KeyboardInterrupt:
                 self.logger.info("Received keyboard interrupt", component="main")
                 break
@@ -493,6 +720,9 @@ class GitSyncService:
                                 exc_info=True)
                 time.sleep(60)  # Ожидание перед повторной попыткой
         
+        if self.storage_watcher:
+            self.storage_watcher.close()
+        
         self.logger.info("GitSync service stopped", component="main")
         return 0
 
@@ -0,0 +1,197 @@
+"""
+Storage Watcher - отслеживание изменений хранилища конфигурации 1С
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from typing import Callable, Optional, Tuple
+
+from shared.logger import get_logger
+
+
+# Маска событий inotify: запись, создание, переименование и удаление файлов хранилища
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class _Inotify:
+    """Минимальная обертка над inotify через libc (только Linux)"""
+    
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify is not supported")
+        
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    
+    def add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+    
+    def wait(self, timeout: float) -> bool:
+        """Ожидание событий; возвращает True если события были"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        
+        # Вычитываем все накопившиеся события, их содержимое не важно -
+        # изменение подтверждается отпечатком хранилища
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+        return True
+    
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class StorageWatcher:
+    """
+    Отслеживание новых версий файлового хранилища 1С
+    
+    Изменение определяется дешевым отпечатком хранилища (размер и mtime файлов
+    верхнего уровня и каталогов данных). inotify используется, когда доступен,
+    только для быстрого пробуждения: на bind-mount из Windows события могут
+    не приходить, поэтому отпечаток проверяется и по таймеру.
+    """
+    
+    def __init__(self, storage_dir: str, probe_interval: int = 5, debounce_seconds: int = 10):
+        self.storage_dir = storage_dir
+        self.probe_interval = probe_interval
+        self.debounce_seconds = debounce_seconds
+        self.logger = get_logger("gitsync")
+        
+        self._synced_fingerprint: Optional[Tuple] = None
+        self._inotify: Optional[_Inotify] = None
+        self._setup_inotify()
+    
+    def _setup_inotify(self):
+        """Подписка на события inotify для каталога хранилища"""
+        try:
+            inotify = _Inotify()
+            inotify.add_watch(self.storage_dir)
+            for entry in os.scandir(self.storage_dir):
+                if entry.is_dir(follow_symlinks=False):
+                    inotify.add_watch(entry.path)
+            self._inotify = inotify
+            
+            self.logger.info("Storage watcher uses inotify",
+                           component="storage_watcher",
+                           details={"storage_dir": self.storage_dir})
+        
+        except Exception as e:
+            self.logger.info("inotify unavailable, storage watcher uses mtime probe",
+                           component="storage_watcher",
+                           details={"storage_dir": self.storage_dir, "reason": str(e)})
+    
+    def fingerprint(self) -> Optional[Tuple]:
+        """
+        Отпечаток текущего состояния хранилища
+        
+        Returns:
+            Optional[Tuple]: Отсортированный кортеж (имя, размер, mtime_ns) или None,
+            если хранилище недоступно
+        """
+        try:
+            items = []
+            with os.scandir(self.storage_dir) as entries:
+                for entry in entries:
+                    stat = entry.stat(follow_symlinks=False)
+                    size = 0 if entry.is_dir(follow_symlinks=False) else stat.st_size
+                    items.append((entry.name, size, stat.st_mtime_ns))
+            return tuple(sorted(items))
+        
+        except OSError as e:
+            self.logger.warning("Failed to probe 1C storage",
+                              component="storage_watcher",
+                              details={"storage_dir": self.storage_dir, "error": str(e)})
+            return None
+    
+    def mark_synced(self, fingerprint: Optional[Tuple] = None):
+        """Запоминание состояния хранилища, с которым выполнена синхронизация"""
+        self._synced_fingerprint = fingerprint if fingerprint is not None else self.fingerprint()
+    
+    def _wait_event(self, timeout: float, should_continue: Callable[[], bool]) -> bool:
+        """
+        Ожидание события inotify не дольше timeout секунд
+        
+        Ожидание выполняется интервалами по секунде, чтобы остановка сервиса
+        не задерживалась. Возвращает True, если пришло событие inotify.
+        """
+        deadline = time.monotonic() + timeout
+        while should_continue():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            
+            step = min(1.0, remaining)
+            if self._inotify:
+                if self._inotify.wait(step):
+                    return True
+            else:
+                time.sleep(step)
+        return False
+    
+    def wait_for_change(self, should_continue: Callable[[], bool]) -> bool:
+        """
+        Ожидание новой версии хранилища с подавлением дребезга
+        
+        Args:
+            should_continue: Функция, возвращающая False при остановке сервиса
+        
+        Returns:
+            bool: True если хранилище изменилось и стабилизировалось,
+            False если ожидание прервано остановкой сервиса
+        """
+        while should_continue():
+            self._wait_event(self.probe_interval, should_continue)
+            
+            current = self.fingerprint()
+            if current is None or current == self._synced_fingerprint:
+                continue
+            
+            # Ожидание окончания серии записей: отпечаток не меняется debounce_seconds
+            stable_since = time.monotonic()
+            while should_continue():
+                self._wait_event(1, should_continue)
+                latest = self.fingerprint()
+                if latest != current:
+                    current = latest
+                    stable_since = time.monotonic()
+                elif time.monotonic() - stable_since >= self.debounce_seconds:
+                    self.logger.info("1C storage change detected",
+                                   component="storage_watcher",
+                                   details={"storage_dir": self.storage_dir})
+                    return True
+        
+        return False
+    
+    def close(self):
+        """Освобождение ресурсов inotify"""
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,56 @@
+"""
+Gunicorn - конфигурация WSGI сервера api-server и health-check
+
+Обе программы supervisord запускают gunicorn с этим файлом, параметры
+задаются переменными окружения программы:
+- WSGI_BIND - адрес и порт;
+- WSGI_WORKERS, WSGI_THREADS - процессы и потоки в каждом (воркер gthread:
+  поток на соединение, поэтому поток SSE /dashboard/events не блокирует
+  обработку webhook'ов);
+- WSGI_TIMEOUT, WSGI_GRACEFUL_TIMEOUT - перезапуск зависшего воркера и
+  срок завершения текущих запросов при остановке.
+
+Код приложения загружается в главном процессе до fork (WSGI_PRELOAD),
+клиенты сервисов и фоновые обновления создаются в каждом воркере до
+приема первого запроса (shared/wsgi.py, on_worker_start).
+
+Плавный перезапуск воркеров: supervisorctl signal HUP <программа> - новые
+воркеры запускаются, старые дообрабатывают принятые запросы. Без
+WSGI_PRELOAD при этом загружается и новый код приложения.
+"""
+import os
+
+
+bind = os.getenv('WSGI_BIND', '0.0.0.0:8090')
+workers = int(os.getenv('WSGI_WORKERS', '2'))
+threads = int(os.getenv('WSGI_THREADS', '8'))
+worker_class = 'gthread'
+preload_app = os.getenv('WSGI_PRELOAD', 'true').lower() not in ('0', 'false', 'no')
+timeout = int(os.getenv('WSGI_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('WSGI_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('WSGI_KEEPALIVE', '5'))
+# Перезапуск воркера после N запросов ограничивает рост памяти; 0 - без перезапуска
+max_requests = int(os.getenv('WSGI_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Длительность запросов пишет shared/wsgi.py в метрики и лог сервиса
+accesslog = None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Python 3.6 не восстанавливает поток записи логов после fork сам
+    from shared.logger import after_fork
+    after_fork()
+
+
+def post_worker_init(worker):
+    from shared.wsgi import start_worker
+    start_worker(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # Gauge завершившегося воркера не должны суммироваться в /metrics
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
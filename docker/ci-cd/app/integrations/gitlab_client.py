@@ -14,6 +14,7 @@ import json
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.metrics import HTTP_REQUEST_SECONDS, endpoint_label
 
 
 class GitLabClient:
@@ -45,6 +46,7 @@ class GitLabClient:
         """Выполнение HTTP запроса к GitLab API"""
         url = f"{self.base_url}/api/v4/{endpoint.lstrip('/')}"
         
+        started = time.monotonic()
         try:
             response = self.session.request(
                 method=method,
@@ -74,6 +76,9 @@ class GitLabClient:
                                 "error": str(e)
                             })
             raise
+        finally:
+            HTTP_REQUEST_SECONDS.labels(upstream="gitlab", method=method,
+                                        endpoint=endpoint_label(endpoint)).observe(time.monotonic() - started)
     
     def wait_for_gitlab_ready(self, max_attempts: int = 30, delay: int = 10) -> bool:
         """Ожидание готовности GitLab"""
@@ -103,6 +108,28 @@ class GitLabClient:
                           Exception(f"GitLab not ready after {max_attempts} attempts"))
         return False
     
+    def check_health(self, timeout: int = 5) -> Dict[str, Any]:
+        """
+        Однократная проверка доступности GitLab без повторов
+        
+        Returns:
+            Dict[str, Any]: Статус и число проектов (из заголовка X-Total)
+        """
+        try:
+            response = self._make_request('GET', 'projects', params={'per_page': 1, 'simple': True},
+                                          timeout=timeout)
+            if response.status_code != 200:
+                return {"status": "error", "error": f"HTTP {response.status_code}"}
+            
+            total = response.headers.get('X-Total')
+            return {
+                "status": "healthy",
+                "projects_count": int(total) if total and total.isdigit() else len(response.json())
+            }
+        
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
     def create_root_token(self, username: str = "root", password: str = "gitlab_root_password") -> str:
         """Создание root токена при первом запуске GitLab"""
         correlation_id = log_operation_start("gitlab_client", "create_root_token")
@@ -254,8 +281,21 @@ class GitLabClient:
                             details={"name": name, "error": str(e)})
             return None
     
-    def create_ci_pipeline_config(self, project_id: int, pipeline_type: str = "main") -> str:
-        """Создание конфигурации CI/CD пайплайна"""
+    def create_ci_pipeline_config(self, project_id: int, pipeline_type: str = "main",
+                                  analysis_mode: str = None) -> str:
+        """
+        Создание конфигурации CI/CD пайплайна
+        
+        Args:
+            project_id: ID проекта GitLab
+            pipeline_type: main - основная конфигурация, external - внешние файлы
+            analysis_mode: full - полный анализ SonarQube на каждый коммит,
+                incremental - анализ только измененных объектов (SONAR_INCLUSIONS)
+                в отдельном проекте SonarQube с полным анализом основного проекта
+                по расписанию. По умолчанию SONAR_ANALYSIS_MODE.
+        """
+        analysis_mode = (analysis_mode or os.getenv('SONAR_ANALYSIS_MODE', 'full')).lower()
+        
         if pipeline_type == "main":
             gitlab_ci_content = """# GitLab CI/CD конфигурация для основного проекта 1С
 stages:
@@ -281,7 +321,12 @@ validate_1c_structure:
   rules:
     - if: $CI_PIPELINE_SOURCE == "push"
     - if: $CI_PIPELINE_SOURCE == "api"
-
+    - if: $CI_PIPELINE_SOURCE == "schedule"
+"""
+            if analysis_mode == "incremental":
+                gitlab_ci_content += self._incremental_sonar_jobs()
+            else:
+                gitlab_ci_content += """
 # Анализ качества кода в SonarQube
 sonarqube_analysis:
   stage: analyze
@@ -306,7 +351,8 @@ sonarqube_analysis:
   rules:
     - if: $CI_PIPELINE_SOURCE == "push"
     - if: $CI_PIPELINE_SOURCE == "api"
-
+"""
+            gitlab_ci_content += """
 # Уведомление в Redmine о результатах
 notify_redmine:
   stage: notify
@@ -322,8 +368,7 @@ notify_redmine:
           \"status\": \"$CI_JOB_STATUS\",
           \"pipeline_url\": \"$CI_PIPELINE_URL\"
         }"
-  dependencies:
-    - sonarqube_analysis
+  dependencies: []
   rules:
     - if: $CI_PIPELINE_SOURCE == "push"
     - if: $CI_PIPELINE_SOURCE == "api"
@@ -404,6 +449,128 @@ notify_redmine_external:
         
         return gitlab_ci_content
     
+    def _incremental_sonar_jobs(self) -> str:
+        """
+        Задания SonarQube для инкрементального режима
+        
+        Коммиты GitSync анализируются только в пределах измененных объектов
+        метаданных (SONAR_INCLUSIONS передается Pipeline Coordinator). Анализ
+        ограниченного набора файлов публикуется в отдельный проект
+        SONAR_CHANGES_PROJECT_KEY: в основном проекте SonarQube считал бы
+        остальные файлы удаленными, закрывал бы их замечания и обнулял метрики.
+        Основной проект обновляет только полный анализ - по расписанию, при
+        SONAR_FULL_ANALYSIS=true и когда список изменений не передан.
+        """
+        return """
+# Инкрементальный анализ SonarQube: только объекты, измененные с BASE_COMMIT_HASH,
+# в отдельном проекте - метрики основного проекта не затрагиваются
+sonarqube_incremental_analysis:
+  stage: analyze
+  image: sonarsource/sonar-scanner-cli:latest
+  variables:
+    SONAR_USER_HOME: "${CI_PROJECT_DIR}/.sonar"
+    SONAR_CHANGES_PROJECT_KEY: "ut103-ci-changes"
+    GIT_DEPTH: "50"
+  cache:
+    key: "sonar-cache-${SONAR_PROJECT_KEY}"
+    paths:
+      - .sonar/cache
+  script:
+    - echo "Incremental analysis of $CHANGES_COUNT changed objects since $BASE_COMMIT_HASH"
+    - sonar-scanner
+      -Dsonar.projectKey=$SONAR_CHANGES_PROJECT_KEY
+      -Dsonar.sources=.
+      -Dsonar.inclusions="$SONAR_INCLUSIONS"
+      -Dsonar.host.url=$SONARQUBE_URL
+      -Dsonar.login=$SONARQUBE_TOKEN
+      -Dsonar.exclusions="**/*.bak,**/*.tmp"
+      -Dsonar.sourceEncoding=UTF-8
+  dependencies:
+    - validate_1c_structure
+  rules:
+    - if: $CI_PIPELINE_SOURCE == "schedule"
+      when: never
+    - if: $SONAR_FULL_ANALYSIS == "true"
+      when: never
+    - if: $SONAR_INCLUSIONS && $CI_PIPELINE_SOURCE == "api"
+
+# Полный анализ SonarQube: по расписанию или без списка изменений
+sonarqube_analysis:
+  stage: analyze
+  image: sonarsource/sonar-scanner-cli:latest
+  variables:
+    SONAR_USER_HOME: "${CI_PROJECT_DIR}/.sonar"
+    GIT_DEPTH: "0"
+  cache:
+    key: "sonar-cache-${SONAR_PROJECT_KEY}"
+    paths:
+      - .sonar/cache
+  script:
+    - sonar-scanner
+      -Dsonar.projectKey=$SONAR_PROJECT_KEY
+      -Dsonar.sources=.
+      -Dsonar.host.url=$SONARQUBE_URL
+      -Dsonar.login=$SONARQUBE_TOKEN
+      -Dsonar.exclusions="**/*.bak,**/*.tmp"
+      -Dsonar.sourceEncoding=UTF-8
+  dependencies:
+    - validate_1c_structure
+  rules:
+    - if: $CI_PIPELINE_SOURCE == "schedule"
+    - if: $SONAR_FULL_ANALYSIS == "true"
+    - if: $SONAR_INCLUSIONS && $CI_PIPELINE_SOURCE == "api"
+      when: never
+    - if: $CI_PIPELINE_SOURCE == "push"
+    - if: $CI_PIPELINE_SOURCE == "api"
+"""
+    
+    def create_pipeline_schedule(self, project_id: int, cron: str, ref: str = "main",
+                                description: str = "", variables: Dict[str, str] = None) -> bool:
+        """Создание расписания пайплайна"""
+        correlation_id = log_operation_start("gitlab_client", "create_pipeline_schedule", 
+                                           {"project_id": project_id, "cron": cron})
+        
+        try:
+            # Проверка существования расписания с тем же описанием
+            response = self._make_request('GET', f'/projects/{project_id}/pipeline_schedules')
+            response.raise_for_status()
+            
+            for schedule in response.json():
+                if schedule.get('description') == description:
+                    self.logger.info("Pipeline schedule already exists", 
+                                   component="pipeline_schedule",
+                                   details={"project_id": project_id, "schedule_id": schedule['id']})
+                    log_operation_success("gitlab_client", "create_pipeline_schedule", correlation_id)
+                    return True
+            
+            response = self._make_request(
+                'POST',
+                f'/projects/{project_id}/pipeline_schedules',
+                data={
+                    'description': description,
+                    'ref': ref,
+                    'cron': cron,
+                    'active': True
+                }
+            )
+            response.raise_for_status()
+            schedule_id = response.json()['id']
+            
+            for key, value in (variables or {}).items():
+                self._make_request(
+                    'POST',
+                    f'/projects/{project_id}/pipeline_schedules/{schedule_id}/variables',
+                    data={'key': key, 'value': value}
+                )
+            
+            log_operation_success("gitlab_client", "create_pipeline_schedule", correlation_id,
+                                {"schedule_id": schedule_id})
+            return True
+            
+        except Exception as e:
+            log_operation_error("gitlab_client", "create_pipeline_schedule", correlation_id, e)
+            return False
+    
     def setup_project_ci_pipeline(self, project_id: int, pipeline_type: str = "main") -> bool:
         """Настройка CI/CD пайплайна для проекта"""
         correlation_id = log_operation_start("gitlab_client", "setup_ci_pipeline", 
@@ -574,6 +741,15 @@ notify_redmine_external:
             # 2. Настройка CI/CD пайплайна
             self.setup_project_ci_pipeline(project_id, pipeline_type)
             
+            # Полный анализ SonarQube по расписанию для инкрементального режима
+            if pipeline_type == "main" and os.getenv('SONAR_ANALYSIS_MODE', 'full').lower() == "incremental":
+                self.create_pipeline_schedule(
+                    project_id,
+                    cron=os.getenv('SONAR_FULL_ANALYSIS_CRON', '0 2 * * *'),
+                    description="Full SonarQube analysis",
+                    variables={'SONAR_FULL_ANALYSIS': 'true'}
+                )
+            
             # 3. Создание переменных окружения
             variables = {
                 'SONARQUBE_URL': os.getenv('SONARQUBE_URL', 'http://sonarqube:9000'),
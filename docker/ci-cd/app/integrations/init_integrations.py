@@ -12,6 +12,7 @@ from typing import Dict, Any, List
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.probes import Probe, ProbeRunner
 from integrations.postgres_client import get_postgres_client
 from integrations.gitlab_client import get_gitlab_client
 from integrations.sonarqube_client import get_sonarqube_client
@@ -114,11 +115,27 @@ class SystemInitializer:
                 ('sonarqube', f"{os.getenv('SONARQUBE_URL', 'http://sonarqube:9000')}/api/system/status")
             ]
             
+            # Сервисы ожидаются параллельно, каждый не дольше своего timeout из конфигурации
+            delay = 10
+            probes = []
             for service_name, check_url in services_to_check:
-                if not self.wait_for_service_ready(service_name, check_url):
-                    self.logger.error(f"Service {service_name} failed to start", 
-                                    component="service_readiness")
-                    return False
+                timeout = self.services_config[service_name]['timeout']
+                
+                def wait(service_name=service_name, check_url=check_url, timeout=timeout):
+                    ready = self.wait_for_service_ready(service_name, check_url,
+                                                        max_attempts=max(1, timeout // delay), delay=delay)
+                    return {"status": "healthy" if ready else "unhealthy"}
+                
+                probes.append(Probe(service_name, wait, timeout=timeout + delay))
+            
+            runner = ProbeRunner(probes, deadline=max(probe.timeout for probe in probes))
+            failed = [name for name, result in runner.run().items() if result["status"] != "healthy"]
+            
+            for service_name in failed:
+                self.logger.error(f"Service {service_name} failed to start", 
+                                component="service_readiness")
+            if failed:
+                return False
             
             log_operation_success("system_initializer", "wait_for_all_services", correlation_id)
             return True
@@ -153,7 +170,8 @@ class SystemInitializer:
                 ('redmine', 'main_project_identifier', 'ut103-ci'),
                 ('sonarqube', 'base_url', os.getenv('SONARQUBE_URL', 'http://sonarqube:9000')),
                 ('sonarqube', 'main_project_key', 'ut103-ci'),
-                ('sonarqube', 'external_files_project_key', 'ut103-external-files')
+                ('sonarqube', 'external_files_project_key', 'ut103-external-files'),
+                ('sonarqube', 'changes_project_key', os.getenv('SONAR_CHANGES_PROJECT_KEY', 'ut103-ci-changes'))
             ]
             
             for service_name, config_key, config_value in config_items:
@@ -250,6 +268,11 @@ class SystemInitializer:
             if self.sonarqube_client.setup_full_project("ut103-external-files", "1C External Files Project"):
                 self.logger.info("External files SonarQube project created", component="sonarqube_init")
             
+            # Проект инкрементального анализа измененных объектов
+            changes_project_key = os.getenv('SONAR_CHANGES_PROJECT_KEY', 'ut103-ci-changes')
+            if self.sonarqube_client.setup_full_project(changes_project_key, "1C UT 10.3 Changed Objects"):
+                self.logger.info("Changed objects SonarQube project created", component="sonarqube_init")
+            
             log_operation_success("system_initializer", "initialize_sonarqube", correlation_id)
             return True
             
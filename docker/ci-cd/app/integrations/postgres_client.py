@@ -2,10 +2,11 @@
 PostgreSQL Client для управления данными интеграции CI/CD системы
 """
 import os
+import re
 import sys
+import time
 import psycopg2
 import psycopg2.extras
-from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional, Union
 import json
 
@@ -13,6 +14,24 @@ import json
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.metrics import DB_QUERY_SECONDS
+from shared.ids import ulid
+
+
+# Вид запроса и первая таблица: метка запроса в метриках ("INSERT pipelines")
+_STATEMENT_RE = re.compile(r'^\s*(\w+)\s+(?:([\w.]+)\s+SET\b|.*?\b(?:FROM|INTO)\s+([\w.]+))?',
+                           re.IGNORECASE | re.DOTALL)
+
+# Длина столбца pipelines.pipeline_id
+PIPELINE_ID_LENGTH = 100
+
+
+def _statement_label(query: str) -> str:
+    match = _STATEMENT_RE.match(query)
+    if not match:
+        return "other"
+    verb, table = match.group(1).upper(), match.group(2) or match.group(3)
+    return f"{verb} {table.lower()}" if table else verb
 
 
 class PostgreSQLClient:
@@ -190,6 +209,44 @@ class PostgreSQLClient:
                     )
                 """)
                 
+                # Создание таблицы входящих webhook'ов: тело сохраняется без изменений,
+                # повторная доставка с тем же delivery_id не добавляет строку
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS webhook_inbox (
+                        id BIGSERIAL PRIMARY KEY,
+                        source VARCHAR(50) NOT NULL,
+                        delivery_id VARCHAR(200) NOT NULL,
+                        event_type VARCHAR(100),
+                        headers JSONB,
+                        body BYTEA NOT NULL,
+                        received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        status VARCHAR(20) DEFAULT 'pending',
+                        attempts INTEGER DEFAULT 0,
+                        claimed_at TIMESTAMP WITH TIME ZONE,
+                        processed_at TIMESTAMP WITH TIME ZONE,
+                        error_message TEXT,
+                        UNIQUE(source, delivery_id)
+                    )
+                """)
+                
+                # Создание таблиц аренды шардов мониторинга пайплайнов экземплярами pipeline-coordinator
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS coordinator_instances (
+                        instance_id VARCHAR(100) PRIMARY KEY,
+                        started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                """)
+                
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS coordinator_shards (
+                        shard INTEGER PRIMARY KEY,
+                        owner VARCHAR(100),
+                        claimed_at TIMESTAMP WITH TIME ZONE,
+                        lease_expires_at TIMESTAMP WITH TIME ZONE
+                    )
+                """)
+                
                 # Создание индексов для производительности
                 cursor.execute("""
                     CREATE INDEX IF NOT EXISTS idx_integration_config_service 
@@ -232,6 +289,11 @@ class PostgreSQLClient:
                     ON redmine_notifications(notification_status)
                 """)
                 
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_webhook_inbox_unprocessed 
+                    ON webhook_inbox(id) WHERE status IN ('pending', 'processing')
+                """)
+                
                 self.logger.info("Database schema created successfully", component="schema")
                 
         except Exception as e:
@@ -260,7 +322,11 @@ class PostgreSQLClient:
             self._ensure_connection()
             
             with self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                cursor.execute(query, params)
+                started = time.monotonic()
+                try:
+                    cursor.execute(query, params)
+                finally:
+                    DB_QUERY_SECONDS.labels(statement=_statement_label(query)).observe(time.monotonic() - started)
                 
                 if fetch:
                     result = [dict(row) for row in cursor.fetchall()]
@@ -289,8 +355,9 @@ class PostgreSQLClient:
         RETURNING id
         """
         
-        # Генерация уникального pipeline_id
-        pipeline_id = f"{pipeline_type}_{project_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Генерация уникального pipeline_id: ULID упорядочен по времени запуска
+        # и не повторяется при нескольких запусках проекта в одну секунду
+        pipeline_id = f"{pipeline_type}_{project_name}"[:PIPELINE_ID_LENGTH - 27] + "_" + ulid()
         
         params = (
             pipeline_type, project_name, commit_hash, branch_name,
@@ -347,6 +414,34 @@ class PostgreSQLClient:
                             "duration_seconds": duration_seconds
                         })
     
+    def complete_pipeline(self, pipeline_db_id: int, status: str, duration_seconds: int = None,
+                          metadata: Dict = None) -> bool:
+        """
+        Перевод пайплайна в итоговый статус, если он еще не завершен
+        
+        Returns:
+            bool: True если статус изменен этим вызовом; False если результат
+            уже обработан (другим экземпляром координатора)
+        """
+        query = """
+        UPDATE pipelines 
+        SET status = %s,
+            completed_at = NOW(),
+            duration_seconds = %s,
+            metadata = COALESCE(metadata, '{}'::jsonb) || COALESCE(%s::jsonb, '{}'::jsonb)
+        WHERE id = %s AND status IN ('pending', 'running')
+        RETURNING id
+        """
+        
+        params = (status, duration_seconds, json.dumps(metadata) if metadata else None, pipeline_db_id)
+        completed = bool(self.execute_query(query, params, fetch=True))
+        
+        self.logger.info("Pipeline completed" if completed else "Pipeline already completed",
+                        component="pipeline_management",
+                        details={"pipeline_id": pipeline_db_id, "status": status,
+                                 "duration_seconds": duration_seconds})
+        return completed
+    
     def get_pipeline_info(self, pipeline_id: Union[int, str]) -> Optional[Dict]:
         """Получение информации о пайплайне"""
         if isinstance(pipeline_id, int):
@@ -380,6 +475,16 @@ class PostgreSQLClient:
         
         return self.execute_query(query, tuple(params), fetch=True)
     
+    def get_running_pipelines(self) -> List[Dict]:
+        """Запущенные в GitLab пайплайны, результат которых еще не обработан"""
+        query = """
+        SELECT id, pipeline_id, pipeline_type, triggered_at, metadata FROM pipelines
+        WHERE status = 'running' AND metadata ? 'gitlab_pipeline_id'
+        ORDER BY id
+        """
+        
+        return self.execute_query(query, fetch=True) or []
+    
     # === Управление анализом SonarQube ===
     
     def save_sonar_analysis(self, pipeline_id: int, project_key: str, analysis_key: str,
@@ -596,6 +701,171 @@ class PostgreSQLClient:
         
         return self.execute_query(query, (limit,), fetch=True)
     
+    # === Входящие webhook'и ===
+    
+    def append_webhooks(self, webhooks: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        Добавление webhook'ов в webhook_inbox одним многострочным INSERT
+        
+        Args:
+            webhooks: Записи с полями source, delivery_id, event_type, headers, body (bytes)
+        
+        Returns:
+            List[tuple]: (source, delivery_id) добавленных записей; повторные доставки не добавляются
+        """
+        query = """
+        INSERT INTO webhook_inbox (source, delivery_id, event_type, headers, body)
+        VALUES %s
+        ON CONFLICT (source, delivery_id) DO NOTHING
+        RETURNING source, delivery_id
+        """
+        rows = [(webhook["source"], webhook["delivery_id"], webhook.get("event_type"),
+                 json.dumps(webhook.get("headers") or {}), psycopg2.Binary(webhook["body"]))
+                for webhook in webhooks]
+        
+        self._ensure_connection()
+        with self.connection.cursor() as cursor:
+            started = time.monotonic()
+            try:
+                inserted = psycopg2.extras.execute_values(cursor, query, rows,
+                                                          template="(%s, %s, %s, %s::jsonb, %s)",
+                                                          page_size=len(rows), fetch=True)
+            finally:
+                DB_QUERY_SECONDS.labels(statement="INSERT webhook_inbox").observe(time.monotonic() - started)
+        
+        return [tuple(row) for row in inserted]
+    
+    def claim_webhooks(self, limit: int = 100, reclaim_after_seconds: int = 300) -> List[Dict]:
+        """
+        Выбор необработанных webhook'ов для обработки
+        
+        Записи, взятые в обработку и не завершенные за reclaim_after_seconds
+        (обработчик остановился), выбираются повторно. SKIP LOCKED позволяет
+        нескольким обработчикам не выбирать одни и те же записи.
+        """
+        query = """
+        UPDATE webhook_inbox
+        SET status = 'processing', attempts = attempts + 1, claimed_at = NOW()
+        WHERE id IN (
+            SELECT id FROM webhook_inbox
+            WHERE status = 'pending'
+               OR (status = 'processing' AND claimed_at < NOW() - %s * INTERVAL '1 second')
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, source, delivery_id, event_type, headers, body, attempts, received_at
+        """
+        
+        webhooks = self.execute_query(query, (reclaim_after_seconds, limit), fetch=True) or []
+        for webhook in webhooks:
+            webhook["body"] = bytes(webhook["body"])
+        return sorted(webhooks, key=lambda webhook: webhook["id"])
+    
+    def complete_webhook(self, webhook_id: int, status: str, error_message: str = None):
+        """Завершение обработки webhook'а: done, ignored, failed или pending для повтора"""
+        query = """
+        UPDATE webhook_inbox
+        SET status = %s,
+            processed_at = CASE WHEN %s = 'pending' THEN NULL ELSE NOW() END,
+            error_message = %s
+        WHERE id = %s
+        """
+        
+        self.execute_query(query, (status, status, error_message, webhook_id))
+    
+    # === Аренда шардов мониторинга пайплайнов ===
+    
+    def init_coordinator_shards(self, shard_count: int):
+        """Создание записей шардов 0..shard_count-1"""
+        query = """
+        INSERT INTO coordinator_shards (shard)
+        SELECT generate_series(0, %s - 1)
+        ON CONFLICT (shard) DO NOTHING
+        """
+        
+        self.execute_query(query, (shard_count,))
+    
+    def heartbeat_coordinator_instance(self, instance_id: str, lease_ttl: int) -> int:
+        """
+        Отметка экземпляра координатора и подсчет живых экземпляров
+        
+        Экземпляры без отметки дольше lease_ttl считаются остановленными,
+        их записи удаляются.
+        """
+        self.execute_query("""
+        INSERT INTO coordinator_instances (instance_id) VALUES (%s)
+        ON CONFLICT (instance_id) DO UPDATE SET heartbeat_at = NOW()
+        """, (instance_id,))
+        
+        self.execute_query("""
+        DELETE FROM coordinator_instances WHERE heartbeat_at < NOW() - %s * INTERVAL '1 second'
+        """, (lease_ttl,))
+        
+        result = self.execute_query("SELECT COUNT(*) AS count FROM coordinator_instances", fetch=True)
+        return result[0]['count'] if result else 1
+    
+    def renew_shard_leases(self, instance_id: str, lease_ttl: int) -> List[int]:
+        """Продление аренды шардов экземпляра; возвращает шарды, которыми он владеет"""
+        query = """
+        UPDATE coordinator_shards
+        SET lease_expires_at = NOW() + %s * INTERVAL '1 second'
+        WHERE owner = %s
+        RETURNING shard
+        """
+        
+        return [row['shard'] for row in self.execute_query(query, (lease_ttl, instance_id), fetch=True) or []]
+    
+    def claim_shard_leases(self, instance_id: str, lease_ttl: int, limit: int) -> List[int]:
+        """Захват свободных шардов и шардов с истекшей арендой"""
+        query = """
+        UPDATE coordinator_shards
+        SET owner = %s, claimed_at = NOW(), lease_expires_at = NOW() + %s * INTERVAL '1 second'
+        WHERE shard IN (
+            SELECT shard FROM coordinator_shards
+            WHERE owner IS NULL OR lease_expires_at < NOW()
+            ORDER BY shard
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING shard
+        """
+        
+        rows = self.execute_query(query, (instance_id, lease_ttl, limit), fetch=True) or []
+        return [row['shard'] for row in rows]
+    
+    def release_shard_leases(self, instance_id: str, shards: List[int] = None):
+        """Освобождение шардов экземпляра (всех, если shards не задан)"""
+        if shards is None:
+            self.execute_query("""
+            UPDATE coordinator_shards SET owner = NULL, lease_expires_at = NULL WHERE owner = %s
+            """, (instance_id,))
+        elif shards:
+            self.execute_query("""
+            UPDATE coordinator_shards SET owner = NULL, lease_expires_at = NULL
+            WHERE owner = %s AND shard = ANY(%s)
+            """, (instance_id, list(shards)))
+    
+    def remove_coordinator_instance(self, instance_id: str):
+        """Удаление записи остановленного экземпляра координатора"""
+        self.execute_query("DELETE FROM coordinator_instances WHERE instance_id = %s", (instance_id,))
+    
+    def notify(self, channel: str, payload: str):
+        """Уведомление слушателей канала LISTEN"""
+        self.execute_query("SELECT pg_notify(%s, %s)", (channel, payload))
+    
+    def listen(self, channel: str):
+        """
+        Отдельное соединение, подписанное на канал LISTEN
+        
+        Уведомления читаются через connection.poll() и connection.notifies.
+        """
+        connection = psycopg2.connect(**self.connection_params)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {channel}")
+        return connection
+    
     # === Управление конфигурацией ===
     
     def get_config_value(self, service_name: str, config_key: str) -> Optional[str]:
@@ -13,6 +13,7 @@ import json
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.metrics import DOWNLOAD_BYTES, HTTP_REQUEST_SECONDS, endpoint_label
 
 
 class RedmineClient:
@@ -53,6 +54,7 @@ class RedmineClient:
         """Выполнение HTTP запроса к Redmine API"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         
+        started = time.monotonic()
         try:
             response = self.session.request(
                 method=method,
@@ -82,6 +84,9 @@ class RedmineClient:
                                 "error": str(e)
                             })
             raise
+        finally:
+            HTTP_REQUEST_SECONDS.labels(upstream="redmine", method=method,
+                                        endpoint=endpoint_label(endpoint)).observe(time.monotonic() - started)
     
     def wait_for_redmine_ready(self, max_attempts: int = 30, delay: int = 10) -> bool:
         """Ожидание готовности Redmine"""
@@ -175,6 +180,23 @@ class RedmineClient:
             log_operation_error("redmine_client", "create_project", correlation_id, e)
             return None
     
+    def check_health(self, timeout: int = 5) -> Dict[str, Any]:
+        """
+        Однократная проверка доступности Redmine без повторов
+        
+        Returns:
+            Dict[str, Any]: Статус и число проектов
+        """
+        try:
+            response = self._make_request('GET', '/projects.json', params={'limit': 1}, timeout=timeout)
+            if response.status_code != 200:
+                return {"status": "error", "error": f"HTTP {response.status_code}"}
+            
+            return {"status": "healthy", "projects_count": response.json().get('total_count', 0)}
+        
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
     def get_project_by_identifier(self, identifier: str) -> Optional[Dict[str, Any]]:
         """Получение проекта по идентификатору"""
         try:
@@ -441,8 +463,15 @@ class RedmineClient:
                 raise Exception("Content URL not found in attachment info")
             
             # Скачивание файла
-            download_response = self.session.get(f"{self.base_url}{content_url}", timeout=120)
+            started = time.monotonic()
+            try:
+                download_response = self.session.get(f"{self.base_url}{content_url}", timeout=120)
+            finally:
+                # Имя файла в пути не входит в метку endpoint
+                HTTP_REQUEST_SECONDS.labels(upstream="redmine", method="GET",
+                                            endpoint="/attachments/download").observe(time.monotonic() - started)
             download_response.raise_for_status()
+            DOWNLOAD_BYTES.labels(service="redmine_client").inc(len(download_response.content))
             
             # Создание директории если не существует
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
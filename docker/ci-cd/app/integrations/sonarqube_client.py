@@ -14,6 +14,7 @@ import json
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.metrics import HTTP_REQUEST_SECONDS, endpoint_label
 
 
 class SonarQubeClient:
@@ -49,6 +50,7 @@ class SonarQubeClient:
         """Выполнение HTTP запроса к SonarQube API"""
         url = f"{self.base_url}/api/{endpoint.lstrip('/')}"
         
+        started = time.monotonic()
         try:
             response = self.session.request(
                 method=method,
@@ -78,6 +80,9 @@ class SonarQubeClient:
                                 "error": str(e)
                             })
             raise
+        finally:
+            HTTP_REQUEST_SECONDS.labels(upstream="sonarqube", method=method,
+                                        endpoint=endpoint_label(endpoint)).observe(time.monotonic() - started)
     
     def wait_for_sonarqube_ready(self, max_attempts: int = 30, delay: int = 10) -> bool:
         """Ожидание готовности SonarQube"""
@@ -105,6 +110,27 @@ class SonarQubeClient:
                           Exception(f"SonarQube not ready after {max_attempts} attempts"))
         return False
     
+    def check_health(self, timeout: int = 5) -> Dict[str, Any]:
+        """
+        Однократная проверка готовности SonarQube без повторов
+        
+        Returns:
+            Dict[str, Any]: Статус (healthy при статусе системы UP) и статус системы SonarQube
+        """
+        try:
+            response = self._make_request('GET', 'system/status', timeout=timeout)
+            if response.status_code != 200:
+                return {"status": "error", "error": f"HTTP {response.status_code}"}
+            
+            system_status = response.json().get('status', 'UNKNOWN')
+            return {
+                "status": "healthy" if system_status == 'UP' else "not_ready",
+                "system_status": system_status
+            }
+        
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
     def change_default_password(self, new_password: str = "sonar_admin_password") -> bool:
         """Изменение пароля по умолчанию"""
         correlation_id = log_operation_start("sonarqube_client", "change_default_password")
@@ -12,10 +12,16 @@ from typing import Dict, Any, List, Optional
 sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from shared.metrics import ACTIVE_PIPELINES, PIPELINE_DURATION_SECONDS
 from integrations import (
     get_postgres_client, get_gitlab_client, 
     get_sonarqube_client, get_redmine_client
 )
+from gitsync.change_set import build_sonar_inclusions
+
+
+# Проект SonarQube с результатами анализа внешних файлов
+EXTERNAL_FILES_PROJECT_KEY = "ut103-external-files"
 
 
 class PipelineCoordinator:
@@ -35,14 +41,27 @@ class PipelineCoordinator:
         
         # Конфигурация
         self.monitoring_interval = int(os.getenv('PIPELINE_MONITORING_INTERVAL', '30'))  # 30 секунд
+        self.sonar_analysis_mode = os.getenv('SONAR_ANALYSIS_MODE', 'full').lower()
+        self.sonar_incremental_max_objects = int(os.getenv('SONAR_INCREMENTAL_MAX_OBJECTS', '200'))
+        self.sonar_project_key = "ut103-ci"
+        self.sonar_changes_project_key = os.getenv('SONAR_CHANGES_PROJECT_KEY', 'ut103-ci-changes')
         
         self.logger.info("Pipeline coordinator initialized", 
                         component="init",
                         details={"monitoring_interval": self.monitoring_interval})
     
     def trigger_gitsync_pipeline(self, commit_hash: str, changes_info: List[Dict], 
-                                project_name: str = "ut103-ci") -> Optional[int]:
-        """Запуск пайплайна после GitSync"""
+                                project_name: str = "ut103-ci",
+                                change_summary: Dict[str, Any] = None) -> Optional[int]:
+        """
+        Запуск пайплайна после GitSync
+        
+        Args:
+            commit_hash: Отправленный коммит
+            changes_info: Измененные объекты метаданных ({"type", "name", "files", ...})
+            project_name: Имя проекта
+            change_summary: Итоги изменений (base_commit, files_changed, lines_added, ...)
+        """
         correlation_id = log_operation_start("pipeline_coordinator", "trigger_gitsync_pipeline",
                                            {"commit_hash": commit_hash, "project": project_name})
         
@@ -55,7 +74,8 @@ class PipelineCoordinator:
                 triggered_by="gitsync_service",
                 metadata={
                     "changes_count": len(changes_info),
-                    "changes": changes_info[:10]  # Ограничиваем количество для логов
+                    "changes": changes_info[:10],  # Ограничиваем количество для логов
+                    "change_summary": change_summary or {}
                 }
             )
             
@@ -72,6 +92,21 @@ class PipelineCoordinator:
                 'DB_PIPELINE_ID': str(pipeline_db_id)
             }
             
+            # Проект SonarQube с результатами анализа этого пайплайна
+            sonar_project_key = self.sonar_project_key
+            
+            if change_summary and change_summary.get('base_commit'):
+                pipeline_variables['BASE_COMMIT_HASH'] = change_summary['base_commit']
+                
+                # Область инкрементального анализа SonarQube - в отдельном проекте;
+                # в режиме full .gitlab-ci.yml анализирует основной проект целиком
+                if self.sonar_analysis_mode == 'incremental':
+                    sonar_inclusions = build_sonar_inclusions(changes_info, self.sonar_incremental_max_objects)
+                    if sonar_inclusions:
+                        pipeline_variables['SONAR_INCLUSIONS'] = sonar_inclusions
+                        pipeline_variables['SONAR_CHANGES_PROJECT_KEY'] = self.sonar_changes_project_key
+                        sonar_project_key = self.sonar_changes_project_key
+            
             gitlab_pipeline = self.gitlab_client.trigger_pipeline(
                 project_id=int(gitlab_project_id),
                 ref='main',
@@ -84,8 +119,10 @@ class PipelineCoordinator:
                     pipeline_db_id, 
                     "running",
                     metadata={
+                        "gitlab_project_id": int(gitlab_project_id),
                         "gitlab_pipeline_id": gitlab_pipeline['id'],
-                        "gitlab_pipeline_url": gitlab_pipeline.get('web_url')
+                        "gitlab_pipeline_url": gitlab_pipeline.get('web_url'),
+                        "sonar_project_key": sonar_project_key
                     }
                 )
                 
@@ -94,6 +131,7 @@ class PipelineCoordinator:
                     "gitlab_project_id": int(gitlab_project_id),
                     "gitlab_pipeline_id": gitlab_pipeline['id'],
                     "type": "gitsync",
+                    "sonar_project_key": sonar_project_key,
                     "started_at": datetime.now(timezone.utc)
                 }
                 
@@ -160,6 +198,7 @@ class PipelineCoordinator:
                     pipeline_db_id, 
                     "running",
                     metadata={
+                        "gitlab_project_id": int(gitlab_project_id),
                         "gitlab_pipeline_id": gitlab_pipeline['id'],
                         "gitlab_pipeline_url": gitlab_pipeline.get('web_url'),
                         "redmine_issue_id": redmine_issue_id,
@@ -202,6 +241,20 @@ class PipelineCoordinator:
             
             return None
     
+    def update_active_gauge(self):
+        """
+        Число отслеживаемых пайплайнов процесса по типам
+        
+        Вызывается только там, где пайплайны снимаются с отслеживания после
+        завершения (мониторинг, AsyncPipelineCoordinator): процессы gitsync и
+        precommit1c запускают пайплайны, но не отслеживают их, и их доля
+        ci_cd_active_pipelines только росла бы.
+        """
+        for pipeline_type in ("gitsync", "precommit1c"):
+            ACTIVE_PIPELINES.labels(pipeline_type=pipeline_type).set(
+                sum(1 for info in self.active_pipelines.values() if info["type"] == pipeline_type)
+            )
+    
     def monitor_active_pipelines(self):
         """Мониторинг активных пайплайнов"""
         correlation_id = log_operation_start("pipeline_coordinator", "monitor_pipelines")
@@ -230,6 +283,7 @@ class PipelineCoordinator:
             # Удаление завершенных пайплайнов из активных
             for pipeline_db_id in completed_pipelines:
                 del self.active_pipelines[pipeline_db_id]
+            self.update_active_gauge()
             
             if completed_pipelines:
                 log_operation_success("pipeline_coordinator", "monitor_pipelines", correlation_id,
@@ -238,6 +292,32 @@ class PipelineCoordinator:
         except Exception as e:
             log_operation_error("pipeline_coordinator", "monitor_pipelines", correlation_id, e)
     
+    def handle_pipeline_event(self, gitlab_pipeline_id: int) -> bool:
+        """
+        Проверка пайплайна по событию GitLab (webhook) без ожидания цикла мониторинга
+        
+        Статус запрашивается у GitLab: содержимое webhook'а не считается
+        достоверным.
+        
+        Returns:
+            bool: True если пайплайн отслеживается координатором
+        """
+        for pipeline_db_id, pipeline_info in list(self.active_pipelines.items()):
+            if pipeline_info["gitlab_pipeline_id"] != gitlab_pipeline_id:
+                continue
+            
+            gitlab_status = self.gitlab_client.get_pipeline_status(
+                pipeline_info["gitlab_project_id"],
+                pipeline_info["gitlab_pipeline_id"]
+            )
+            if gitlab_status and gitlab_status.get('status') in ['success', 'failed', 'canceled']:
+                self.handle_pipeline_completion(pipeline_db_id, pipeline_info, gitlab_status)
+                del self.active_pipelines[pipeline_db_id]
+                self.update_active_gauge()
+            return True
+        
+        return False
+    
     def handle_pipeline_completion(self, pipeline_db_id: int, pipeline_info: Dict, gitlab_status: Dict):
         """Обработка завершения пайплайна"""
         correlation_id = log_operation_start("pipeline_coordinator", "handle_completion",
@@ -247,28 +327,66 @@ class PipelineCoordinator:
             status = gitlab_status.get('status')
             duration = gitlab_status.get('duration')
             
-            # Обновление статуса в базе данных
-            self.postgres_client.update_pipeline_status(
-                pipeline_db_id, 
-                status,
-                duration_seconds=duration,
-                metadata={
-                    "gitlab_status": gitlab_status,
-                    "completed_at": datetime.now(timezone.utc).isoformat()
-                }
-            )
+            if not self.record_completion(pipeline_db_id, gitlab_status):
+                log_operation_success("pipeline_coordinator", "handle_completion", correlation_id,
+                                    {"status": status, "already_completed": True})
+                return
             
             if pipeline_info["type"] == "gitsync":
                 self.handle_gitsync_completion(pipeline_db_id, pipeline_info, gitlab_status)
             elif pipeline_info["type"] == "precommit1c":
                 self.handle_precommit_completion(pipeline_db_id, pipeline_info, gitlab_status)
             
+            self.observe_duration(pipeline_info, status)
+            
             log_operation_success("pipeline_coordinator", "handle_completion", correlation_id,
                                 {"status": status, "duration": duration})
             
         except Exception as e:
             log_operation_error("pipeline_coordinator", "handle_completion", correlation_id, e)
     
+    def record_completion(self, pipeline_db_id: int, gitlab_status: Dict) -> bool:
+        """
+        Сохранение итогового статуса пайплайна GitLab в базе данных
+        
+        Returns:
+            bool: False если завершение уже записано (другим экземпляром
+            координатора) - уведомления по нему не отправляются повторно
+        """
+        return self.postgres_client.complete_pipeline(
+            pipeline_db_id, 
+            gitlab_status.get('status'),
+            duration_seconds=gitlab_status.get('duration'),
+            metadata={
+                "gitlab_status": gitlab_status,
+                "completed_at": datetime.now(timezone.utc).isoformat()
+            }
+        )
+    
+    def observe_duration(self, pipeline_info: Dict, status: str):
+        """Время от запуска пайплайна до обработки его результата"""
+        PIPELINE_DURATION_SECONDS.labels(pipeline_type=pipeline_info["type"], status=status).observe(
+            (datetime.now(timezone.utc) - pipeline_info["started_at"]).total_seconds()
+        )
+    
+    def save_sonar_results(self, pipeline_db_id: int, project_key: str, sonar_status: Dict,
+                           sonar_measures: Dict) -> Optional[int]:
+        """Сохранение результатов анализа SonarQube пайплайна"""
+        return self.postgres_client.save_sonar_analysis(
+            pipeline_id=pipeline_db_id,
+            project_key=project_key,
+            analysis_key=sonar_status.get('projectStatus', {}).get('analysisId', ''),
+            quality_gate_status=sonar_status.get('projectStatus', {}).get('status', 'UNKNOWN'),
+            bugs=sonar_measures.get('bugs', 0),
+            vulnerabilities=sonar_measures.get('vulnerabilities', 0),
+            code_smells=sonar_measures.get('code_smells', 0),
+            coverage_percent=sonar_measures.get('coverage'),
+            duplicated_lines_percent=sonar_measures.get('duplicated_lines_density'),
+            lines_of_code=sonar_measures.get('ncloc'),
+            technical_debt_minutes=sonar_measures.get('sqale_index'),
+            dashboard_url=f"{self.sonarqube_client.base_url}/dashboard?id={project_key}"
+        )
+    
     def handle_gitsync_completion(self, pipeline_db_id: int, pipeline_info: Dict, gitlab_status: Dict):
         """Обработка завершения GitSync пайплайна"""
         correlation_id = log_operation_start("pipeline_coordinator", "handle_gitsync_completion",
@@ -278,30 +396,20 @@ class PipelineCoordinator:
             status = gitlab_status.get('status')
             
             if status == 'success':
-                # Получение результатов анализа SonarQube
+                # Получение результатов анализа SonarQube: инкрементальный анализ
+                # публикуется в отдельный проект измененных объектов
+                sonar_project_key = pipeline_info.get("sonar_project_key", self.sonar_project_key)
                 try:
-                    sonar_status = self.sonarqube_client.get_project_analysis_status("ut103-ci")
-                    sonar_measures = self.sonarqube_client.get_project_measures("ut103-ci")
+                    sonar_status = self.sonarqube_client.get_project_analysis_status(sonar_project_key)
+                    sonar_measures = self.sonarqube_client.get_project_measures(sonar_project_key)
                     
                     if sonar_status and sonar_measures:
                         # Сохранение результатов анализа
-                        analysis_id = self.postgres_client.save_sonar_analysis(
-                            pipeline_id=pipeline_db_id,
-                            project_key="ut103-ci",
-                            analysis_key=sonar_status.get('projectStatus', {}).get('analysisId', ''),
-                            quality_gate_status=sonar_status.get('projectStatus', {}).get('status', 'UNKNOWN'),
-                            bugs=sonar_measures.get('bugs', 0),
-                            vulnerabilities=sonar_measures.get('vulnerabilities', 0),
-                            code_smells=sonar_measures.get('code_smells', 0),
-                            coverage_percent=sonar_measures.get('coverage'),
-                            duplicated_lines_percent=sonar_measures.get('duplicated_lines_density'),
-                            lines_of_code=sonar_measures.get('ncloc'),
-                            technical_debt_minutes=sonar_measures.get('sqale_index'),
-                            dashboard_url=f"{self.sonarqube_client.base_url}/dashboard?id=ut103-ci"
-                        )
+                        self.save_sonar_results(pipeline_db_id, sonar_project_key, sonar_status, sonar_measures)
                         
                         # Создание уведомления в Redmine
-                        self.create_gitsync_notification(pipeline_db_id, sonar_status, sonar_measures)
+                        self.create_gitsync_notification(pipeline_db_id, sonar_status, sonar_measures,
+                                                         sonar_project_key)
                         
                 except Exception as e:
                     self.logger.error("Failed to process SonarQube results", 
@@ -334,25 +442,13 @@ class PipelineCoordinator:
             if status == 'success':
                 # Получение результатов анализа SonarQube для внешних файлов
                 try:
-                    sonar_status = self.sonarqube_client.get_project_analysis_status("ut103-external-files")
-                    sonar_measures = self.sonarqube_client.get_project_measures("ut103-external-files")
+                    sonar_status = self.sonarqube_client.get_project_analysis_status(EXTERNAL_FILES_PROJECT_KEY)
+                    sonar_measures = self.sonarqube_client.get_project_measures(EXTERNAL_FILES_PROJECT_KEY)
                     
                     if sonar_status and sonar_measures:
                         # Сохранение результатов анализа
-                        analysis_id = self.postgres_client.save_sonar_analysis(
-                            pipeline_id=pipeline_db_id,
-                            project_key="ut103-external-files",
-                            analysis_key=sonar_status.get('projectStatus', {}).get('analysisId', ''),
-                            quality_gate_status=sonar_status.get('projectStatus', {}).get('status', 'UNKNOWN'),
-                            bugs=sonar_measures.get('bugs', 0),
-                            vulnerabilities=sonar_measures.get('vulnerabilities', 0),
-                            code_smells=sonar_measures.get('code_smells', 0),
-                            coverage_percent=sonar_measures.get('coverage'),
-                            duplicated_lines_percent=sonar_measures.get('duplicated_lines_density'),
-                            lines_of_code=sonar_measures.get('ncloc'),
-                            technical_debt_minutes=sonar_measures.get('sqale_index'),
-                            dashboard_url=f"{self.sonarqube_client.base_url}/dashboard?id=ut103-external-files"
-                        )
+                        analysis_id = self.save_sonar_results(pipeline_db_id, EXTERNAL_FILES_PROJECT_KEY,
+                                                              sonar_status, sonar_measures)
                         
                         # Обновление внешнего файла с результатами анализа
                         self.postgres_client.update_external_file_status(
@@ -378,7 +474,8 @@ class PipelineCoordinator:
         except Exception as e:
             log_operation_error("pipeline_coordinator", "handle_precommit_completion", correlation_id, e)
     
-    def create_gitsync_notification(self, pipeline_db_id: int, sonar_status: Dict, sonar_measures: Dict):
+    def create_gitsync_notification(self, pipeline_db_id: int, sonar_status: Dict, sonar_measures: Dict,
+                                    sonar_project_key: str = "ut103-ci"):
         """Создание уведомления о результатах GitSync анализа"""
         try:
             pipeline_info = self.postgres_client.get_pipeline_info(pipeline_db_id)
@@ -390,6 +487,12 @@ class PipelineCoordinator:
             
             message_title = f"Анализ кода - {pipeline_info['commit_hash'][:8]} {status_emoji}"
             
+            # Метрики инкрементального анализа относятся только к измененным объектам
+            if sonar_project_key == self.sonar_changes_project_key:
+                analysis_scope = "измененные объекты (инкрементальный анализ)"
+            else:
+                analysis_scope = "вся конфигурация"
+            
             message_body = f"""## Результаты автоматического анализа кода
 
 **Коммит**: `{pipeline_info['commit_hash']}`
@@ -397,6 +500,7 @@ class PipelineCoordinator:
 **Пайплайн**: [#{pipeline_info['pipeline_id']}]({pipeline_info.get('metadata', {}).get('gitlab_pipeline_url', '#')})
 
 ### Метрики качества кода:
+- **Область анализа**: {analysis_scope}
 - **Статус Quality Gate**: {quality_gate_status} {status_emoji}
 - **Ошибки**: {sonar_measures.get('bugs', 0)}
 - **Уязвимости**: {sonar_measures.get('vulnerabilities', 0)}
@@ -405,7 +509,7 @@ class PipelineCoordinator:
 - **Дублирование кода**: {sonar_measures.get('duplicated_lines_density', 'N/A')}%
 - **Строк кода**: {sonar_measures.get('ncloc', 0)}
 
-[📊 Подробный отчет в SonarQube]({self.sonarqube_client.base_url}/dashboard?id=ut103-ci)
+[📊 Подробный отчет в SonarQube]({self.sonarqube_client.base_url}/dashboard?id={sonar_project_key})
 """
             
             # Создание системной задачи в Redmine
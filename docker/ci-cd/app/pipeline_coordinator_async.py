@@ -0,0 +1,455 @@
+"""
+Async Pipeline Coordinator - событийный цикл процесса pipeline-coordinator (asyncio)
+
+Каждый отслеживаемый пайплайн - отдельная задача: она запрашивает статус
+в GitLab раз в PIPELINE_MONITORING_INTERVAL секунд или сразу по событию
+webhook'а и после завершения обрабатывает результат. Запросы результатов
+SonarQube выполняются одновременно, обработка одного пайплайна не задерживает
+остальные. Клиенты сервисов синхронные, поэтому их вызовы выполняются в пуле
+потоков, а число одновременных вызовов каждого сервиса ограничивает семафор
+(COORDINATOR_<СЕРВИС>_CONCURRENCY).
+
+Пайплайны запускают процессы gitsync и precommit1c; цикл находит их по
+записям pipelines в статусе running раз в COORDINATOR_DISCOVERY_INTERVAL
+секунд или сразу, если пришел webhook неизвестного пайплайна.
+
+Экземпляров pipeline-coordinator может быть несколько: каждый отслеживает
+пайплайны арендованных шардов (pipeline_shards.py). Webhook пайплайна
+другого экземпляра передается ему уведомлением Postgres (NOTIFY).
+"""
+import asyncio
+import functools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+# Добавление пути к shared модулям
+sys.path.append('/app')
+
+from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
+from pipeline_coordinator import EXTERNAL_FILES_PROJECT_KEY, PipelineCoordinator
+from pipeline_shards import ShardLeaseManager
+
+
+logger = get_logger("pipeline_coordinator_async")
+
+# Статусы пайплайна GitLab, после которых обрабатывается результат
+FINISHED_STATUSES = ('success', 'failed', 'canceled')
+
+# Одновременных вызовов каждого сервиса по умолчанию
+DEFAULT_CONCURRENCY = {"gitlab": 8, "sonarqube": 4, "redmine": 4, "postgres": 4}
+
+# Параметр конфигурации с ID проекта GitLab по типу пайплайна
+_PROJECT_CONFIG_KEYS = {"gitsync": "main_project_id", "precommit1c": "external_project_id"}
+
+# Канал LISTEN/NOTIFY событий пайплайнов между экземплярами
+PIPELINE_EVENTS_CHANNEL = "pipeline_events"
+
+
+class AsyncPipelineCoordinator:
+    """Координация пайплайнов в событийном цикле asyncio"""
+    
+    def __init__(self, coordinator: PipelineCoordinator, inbox_processor=None,
+                 concurrency: Optional[Dict[str, int]] = None, shards: Optional[ShardLeaseManager] = None):
+        self.coordinator = coordinator
+        self.inbox_processor = inbox_processor
+        # Без аренды шардов экземпляр отслеживает все пайплайны
+        self.shards = shards
+        self.concurrency = concurrency or {
+            upstream: int(os.getenv(f'COORDINATOR_{upstream.upper()}_CONCURRENCY', str(default)))
+            for upstream, default in DEFAULT_CONCURRENCY.items()
+        }
+        self.poll_interval = coordinator.monitoring_interval
+        self.discovery_interval = float(os.getenv('COORDINATOR_DISCOVERY_INTERVAL', '5'))
+        self.inbox_interval = float(os.getenv('COORDINATOR_INBOX_INTERVAL', '0.5'))
+        self.stop_timeout = float(os.getenv('COORDINATOR_STOP_TIMEOUT', '30'))
+        
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stopping: Optional[asyncio.Event] = None
+        self._discover_now: Optional[asyncio.Event] = None
+        self._stop_requested = False
+        self._listener = None
+        
+        # Задачи пайплайнов и события их немедленной проверки
+        self._watchers: Dict[int, asyncio.Future] = {}
+        self._wakeups: Dict[int, asyncio.Event] = {}
+        self._completing: Set[int] = set()
+        # Обработанные пайплайны, которые еще могут быть в выборке running, начатой до их завершения
+        self._finished: Set[int] = set()
+        # ID пайплайна GitLab -> ID записи; читается из потоков пула
+        self._by_gitlab_id: Dict[int, int] = {}
+        self._project_ids: Dict[str, int] = {}
+    
+    @property
+    def active_pipelines(self) -> Dict[int, Dict[str, Any]]:
+        return self.coordinator.active_pipelines
+    
+    async def call(self, upstream: str, func, *args, **kwargs):
+        """Блокирующий вызов клиента сервиса в пуле потоков с ограничением одновременности"""
+        async with self._semaphores[upstream]:
+            return await self._loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    # === Запуск и остановка ===
+    
+    def run(self):
+        """Выполнение цикла до вызова stop()"""
+        # Потоков столько, сколько допускают семафоры: ожидание идет в семафоре, а не в очереди пула
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.concurrency.values()),
+                                            thread_name_prefix="coordinator")
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            self._executor.shutdown(wait=False)
+            loop.close()
+    
+    def stop(self):
+        """Остановка цикла; можно вызывать из обработчика сигнала и других потоков"""
+        self._stop_requested = True
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+    
+    async def _main(self):
+        self._loop = asyncio.get_event_loop()
+        self._semaphores = {upstream: asyncio.Semaphore(limit) for upstream, limit in self.concurrency.items()}
+        self._stopping = asyncio.Event()
+        self._discover_now = asyncio.Event()
+        if self._stop_requested:
+            self._stopping.set()
+        
+        logger.info("Async pipeline coordinator started",
+                   component="main",
+                   details={"concurrency": self.concurrency, "poll_interval": self.poll_interval})
+        
+        loops = [asyncio.ensure_future(self._discovery_loop())]
+        if self.shards is not None:
+            loops.append(asyncio.ensure_future(self._lease_loop()))
+        if self.inbox_processor is not None:
+            loops.append(asyncio.ensure_future(self._inbox_loop()))
+        
+        await self._stopping.wait()
+        
+        # Ожидающие задачи отменяются, обработка завершившихся пайплайнов дорабатывает
+        for task in loops:
+            task.cancel()
+        for pipeline_db_id, watcher in list(self._watchers.items()):
+            if pipeline_db_id not in self._completing:
+                watcher.cancel()
+        pending = loops + list(self._watchers.values())
+        if pending:
+            await asyncio.wait(pending, timeout=self.stop_timeout)
+        
+        self._close_listener()
+        if self.shards is not None:
+            try:
+                await self.call("postgres", self.shards.release)
+            except Exception as e:
+                logger.error("Failed to release shard leases",
+                            component="shard_leases",
+                            details={"error": str(e)})
+        
+        logger.info("Async pipeline coordinator stopped",
+                   component="main",
+                   details={"unfinished_completions": len(self._completing)})
+    
+    # === Обнаружение пайплайнов ===
+    
+    async def _discovery_loop(self):
+        while True:
+            self._discover_now.clear()
+            try:
+                await self.discover()
+            except Exception as e:
+                logger.error("Failed to discover running pipelines",
+                            component="pipeline_discovery",
+                            details={"error": str(e)})
+            try:
+                await asyncio.wait_for(self._discover_now.wait(), self.discovery_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def discover(self):
+        """Начало отслеживания запущенных пайплайнов, еще не отслеживаемых циклом"""
+        rows = await self.call("postgres", self.coordinator.postgres_client.get_running_pipelines)
+        self._finished.intersection_update(row["id"] for row in rows)
+        for row in rows:
+            if row["id"] in self.active_pipelines or row["id"] in self._finished:
+                continue
+            if self.shards is not None and not self.shards.owns(row["pipeline_id"]):
+                continue
+            info = await self._pipeline_info(row)
+            if info is not None:
+                self.track(row["id"], info)
+    
+    async def _pipeline_info(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Описание пайплайна в формате active_pipelines по записи pipelines"""
+        metadata = row.get("metadata") or {}
+        pipeline_type = row["pipeline_type"]
+        
+        gitlab_project_id = metadata.get("gitlab_project_id") or self._project_ids.get(pipeline_type)
+        if gitlab_project_id is None and pipeline_type in _PROJECT_CONFIG_KEYS:
+            # Записи, созданные до сохранения ID проекта в metadata
+            value = await self.call("postgres", self.coordinator.postgres_client.get_config_value,
+                                    'gitlab', _PROJECT_CONFIG_KEYS[pipeline_type])
+            if value:
+                gitlab_project_id = self._project_ids[pipeline_type] = int(value)
+        if gitlab_project_id is None:
+            logger.warning("GitLab project of pipeline is unknown",
+                          component="pipeline_discovery",
+                          details={"pipeline_db_id": row["id"], "pipeline_type": pipeline_type})
+            return None
+        
+        info = {
+            "pipeline_id": row["pipeline_id"],
+            "gitlab_project_id": int(gitlab_project_id),
+            "gitlab_pipeline_id": int(metadata["gitlab_pipeline_id"]),
+            "type": pipeline_type,
+            "started_at": row.get("triggered_at") or datetime.now(timezone.utc)
+        }
+        if pipeline_type == "gitsync":
+            info["sonar_project_key"] = metadata.get("sonar_project_key", self.coordinator.sonar_project_key)
+        elif pipeline_type == "precommit1c":
+            info["redmine_issue_id"] = metadata.get("redmine_issue_id")
+            info["external_file_id"] = metadata.get("external_file_id")
+        return info
+    
+    def track(self, pipeline_db_id: int, info: Dict[str, Any]):
+        """Запуск задачи отслеживания пайплайна"""
+        self.active_pipelines[pipeline_db_id] = info
+        self._by_gitlab_id[info["gitlab_pipeline_id"]] = pipeline_db_id
+        self._wakeups[pipeline_db_id] = asyncio.Event()
+        self._watchers[pipeline_db_id] = asyncio.ensure_future(self._watch(pipeline_db_id, info))
+        self.coordinator.update_active_gauge()
+    
+    def _untrack(self, pipeline_db_id: int, info: Dict[str, Any]):
+        self.active_pipelines.pop(pipeline_db_id, None)
+        self._by_gitlab_id.pop(info["gitlab_pipeline_id"], None)
+        self._wakeups.pop(pipeline_db_id, None)
+        self._watchers.pop(pipeline_db_id, None)
+        self._completing.discard(pipeline_db_id)
+        self.coordinator.update_active_gauge()
+    
+    # === Шарды ===
+    
+    async def _lease_loop(self):
+        while True:
+            before = self.shards.owned
+            try:
+                owned = await self.call("postgres", self.shards.heartbeat)
+            except Exception as e:
+                logger.error("Failed to renew shard leases",
+                            component="shard_leases",
+                            details={"instance_id": self.shards.instance_id, "error": str(e)})
+                owned = before
+            
+            if owned - before:
+                self._discover_now.set()
+            # Шарды отданы другим экземплярам или аренда истекла без продления
+            self._drop_unowned()
+            
+            if self._listener is None:
+                await self._listen()
+            await asyncio.sleep(self.shards.heartbeat_interval)
+    
+    def _drop_unowned(self):
+        """Отмена отслеживания пайплайнов чужих шардов; начатая обработка результата дорабатывает"""
+        for pipeline_db_id, info in list(self.active_pipelines.items()):
+            watcher = self._watchers.get(pipeline_db_id)
+            if watcher is None or pipeline_db_id in self._completing:
+                continue
+            if not self.shards.owns(info["pipeline_id"]):
+                watcher.cancel()
+    
+    async def _listen(self):
+        try:
+            self._listener = await self.call("postgres", self.coordinator.postgres_client.listen,
+                                             PIPELINE_EVENTS_CHANNEL)
+            self._loop.add_reader(self._listener.fileno(), self._on_notify)
+        except Exception as e:
+            # Без подписки webhook'и чужих пайплайнов дожидаются опроса GitLab
+            logger.warning("Failed to listen for pipeline events",
+                          component="shard_leases",
+                          details={"error": str(e)})
+            self._close_listener()
+    
+    def _on_notify(self):
+        try:
+            self._listener.poll()
+        except Exception as e:
+            logger.warning("Pipeline events connection lost",
+                          component="shard_leases",
+                          details={"error": str(e)})
+            self._close_listener()
+            return
+        
+        while self._listener.notifies:
+            notify = self._listener.notifies.pop(0)
+            pipeline_db_id = self._by_gitlab_id.get(int(notify.payload))
+            wakeup = self._wakeups.get(pipeline_db_id) if pipeline_db_id is not None else None
+            if wakeup is not None:
+                wakeup.set()
+    
+    def _close_listener(self):
+        if self._listener is None:
+            return
+        try:
+            self._loop.remove_reader(self._listener.fileno())
+        except Exception:
+            pass
+        try:
+            self._listener.close()
+        except Exception:
+            pass
+        self._listener = None
+    
+    # === События webhook'ов ===
+    
+    async def _inbox_loop(self):
+        while True:
+            try:
+                counts = await self.call("postgres", self.inbox_processor.process_pending)
+            except Exception as e:
+                logger.error("Failed to process webhook inbox",
+                            component="webhook_inbox",
+                            details={"error": str(e)})
+                counts = None
+            # Пока в webhook_inbox есть записи, следующая пачка выбирается без паузы
+            if not counts:
+                await asyncio.sleep(self.inbox_interval)
+    
+    def handle_pipeline_event(self, gitlab_pipeline_id: int) -> bool:
+        """
+        Событие пайплайна из webhook'а: немедленная проверка его статуса
+        
+        Вызывается обработчиком webhook_inbox в потоке пула.
+        
+        Returns:
+            bool: True если пайплайн отслеживается этим экземпляром или
+            событие передано остальным экземплярам
+        """
+        pipeline_db_id = self._by_gitlab_id.get(gitlab_pipeline_id)
+        wakeup = self._wakeups.get(pipeline_db_id) if pipeline_db_id is not None else None
+        if wakeup is None:
+            # Пайплайн мог быть запущен после последнего обнаружения
+            self._loop.call_soon_threadsafe(self._discover_now.set)
+            if self.shards is None:
+                return False
+            # Пайплайн может отслеживать экземпляр, арендующий его шард
+            self.coordinator.postgres_client.notify(PIPELINE_EVENTS_CHANNEL, str(gitlab_pipeline_id))
+            return True
+        self._loop.call_soon_threadsafe(wakeup.set)
+        return True
+    
+    # === Отслеживание и завершение пайплайна ===
+    
+    async def _watch(self, pipeline_db_id: int, info: Dict[str, Any]):
+        wakeup = self._wakeups[pipeline_db_id]
+        try:
+            while True:
+                wakeup.clear()
+                try:
+                    gitlab_status = await self.call("gitlab", self.coordinator.gitlab_client.get_pipeline_status,
+                                                    info["gitlab_project_id"], info["gitlab_pipeline_id"])
+                except Exception as e:
+                    self.coordinator.logger.error("Error monitoring pipeline",
+                                                component="pipeline_monitoring",
+                                                details={"pipeline_db_id": pipeline_db_id, "error": str(e)})
+                    gitlab_status = None
+                
+                if gitlab_status and gitlab_status.get('status') in FINISHED_STATUSES:
+                    self._completing.add(pipeline_db_id)
+                    await self.complete(pipeline_db_id, info, gitlab_status)
+                    self._finished.add(pipeline_db_id)
+                    return
+                
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._untrack(pipeline_db_id, info)
+    
+    async def complete(self, pipeline_db_id: int, info: Dict[str, Any], gitlab_status: Dict[str, Any]):
+        """Обработка завершения пайплайна"""
+        correlation_id = log_operation_start("pipeline_coordinator", "handle_completion",
+                                           {"pipeline_db_id": pipeline_db_id})
+        status = gitlab_status.get('status')
+        
+        try:
+            if not await self.call("postgres", self.coordinator.record_completion, pipeline_db_id, gitlab_status):
+                # Результат уже обработан экземпляром, получившим шард пайплайна
+                log_operation_success("pipeline_coordinator", "handle_completion", correlation_id,
+                                    {"status": status, "already_completed": True})
+                return
+            
+            if info["type"] == "gitsync":
+                await self._complete_gitsync(pipeline_db_id, info, gitlab_status)
+            elif info["type"] == "precommit1c":
+                await self._complete_precommit(pipeline_db_id, info, gitlab_status)
+            
+            self.coordinator.observe_duration(info, status)
+            
+            log_operation_success("pipeline_coordinator", "handle_completion", correlation_id,
+                                {"status": status, "duration": gitlab_status.get('duration')})
+        
+        except Exception as e:
+            log_operation_error("pipeline_coordinator", "handle_completion", correlation_id, e)
+    
+    async def _fetch_sonar(self, project_key: str) -> tuple:
+        """Статус Quality Gate и метрики проекта SonarQube - одновременными запросами"""
+        sonarqube = self.coordinator.sonarqube_client
+        return tuple(await asyncio.gather(
+            self.call("sonarqube", sonarqube.get_project_analysis_status, project_key),
+            self.call("sonarqube", sonarqube.get_project_measures, project_key)
+        ))
+    
+    async def _complete_gitsync(self, pipeline_db_id: int, info: Dict[str, Any], gitlab_status: Dict[str, Any]):
+        if gitlab_status.get('status') != 'success':
+            return
+        
+        # Инкрементальный анализ публикуется в отдельный проект измененных объектов
+        project_key = info.get("sonar_project_key", self.coordinator.sonar_project_key)
+        try:
+            sonar_status, sonar_measures = await self._fetch_sonar(project_key)
+            if sonar_status and sonar_measures:
+                await self.call("postgres", self.coordinator.save_sonar_results,
+                                pipeline_db_id, project_key, sonar_status, sonar_measures)
+                await self.call("redmine", self.coordinator.create_gitsync_notification,
+                                pipeline_db_id, sonar_status, sonar_measures, project_key)
+        except Exception as e:
+            self.coordinator.logger.error("Failed to process SonarQube results",
+                                        component="gitsync_completion",
+                                        details={"pipeline_db_id": pipeline_db_id, "error": str(e)})
+    
+    async def _complete_precommit(self, pipeline_db_id: int, info: Dict[str, Any], gitlab_status: Dict[str, Any]):
+        status = gitlab_status.get('status')
+        redmine_issue_id = info.get("redmine_issue_id")
+        external_file_id = info.get("external_file_id")
+        file_status = "completed" if status == "success" else "failed"
+        
+        await self.call("postgres", self.coordinator.postgres_client.update_external_file_status,
+                        external_file_id, file_status, pipeline_id=pipeline_db_id)
+        
+        if status != 'success':
+            await self.call("redmine", self.coordinator.create_precommit_error_notification,
+                            redmine_issue_id, pipeline_db_id, gitlab_status)
+            return
+        
+        try:
+            sonar_status, sonar_measures = await self._fetch_sonar(EXTERNAL_FILES_PROJECT_KEY)
+            if sonar_status and sonar_measures:
+                analysis_id = await self.call("postgres", self.coordinator.save_sonar_results,
+                                              pipeline_db_id, EXTERNAL_FILES_PROJECT_KEY, sonar_status, sonar_measures)
+                await self.call("postgres", self.coordinator.postgres_client.update_external_file_status,
+                                external_file_id, file_status, sonar_analysis_id=analysis_id)
+                await self.call("redmine", self.coordinator.create_precommit_notification,
+                                redmine_issue_id, pipeline_db_id, sonar_status, sonar_measures, gitlab_status)
+        except Exception as e:
+            self.coordinator.logger.error("Failed to process SonarQube results for external file",
+                                        component="precommit_completion",
+                                        details={"pipeline_db_id": pipeline_db_id, "error": str(e)})
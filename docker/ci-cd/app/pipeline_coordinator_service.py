@@ -12,6 +12,9 @@ sys.path.append('/app')
 
 from shared.logger import get_logger
 from pipeline_coordinator import get_pipeline_coordinator
+from pipeline_coordinator_async import AsyncPipelineCoordinator
+from pipeline_shards import ShardLeaseManager
+from webhook_inbox import WebhookInboxProcessor
 
 
 class PipelineCoordinatorService:
@@ -20,6 +23,10 @@ class PipelineCoordinatorService:
     def __init__(self):
         self.logger = get_logger("pipeline_coordinator_service")
         self.coordinator = get_pipeline_coordinator()
+        # Пайплайны распределяются между экземплярами сервиса по шардам
+        self.runtime = AsyncPipelineCoordinator(self.coordinator, shards=ShardLeaseManager())
+        # События пайплайнов из webhook'ов передаются задачам событийного цикла
+        self.runtime.inbox_processor = WebhookInboxProcessor(self.runtime)
         self.running = True
         
         # Настройка обработчиков сигналов
@@ -33,6 +40,7 @@ class PipelineCoordinatorService:
         self.logger.info(f"Received signal {signum}, shutting down gracefully", 
                         component="signal_handler")
         self.running = False
+        self.runtime.stop()
     
     def run(self):
         """Основной цикл работы сервиса"""
@@ -40,14 +48,8 @@ class PipelineCoordinatorService:
         
         while self.running:
             try:
-                # Мониторинг активных пайплайнов
-                self.coordinator.monitor_active_pipelines()
-                
-                # Ожидание до следующего цикла
-                for _ in range(self.coordinator.monitoring_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                # Мониторинг пайплайнов и обработка webhook'ов в событийном цикле до остановки
+                self.runtime.run()
                     
             except KeyboardInterrupt:
                 self.logger.info("Received keyboard interrupt", component="main")
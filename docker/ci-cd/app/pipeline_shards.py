@@ -0,0 +1,116 @@
+"""
+Pipeline Shards - распределение мониторинга пайплайнов между экземплярами pipeline-coordinator
+
+Пайплайн относится к шарду crc32(pipeline_id) % COORDINATOR_SHARD_COUNT.
+Экземпляр отслеживает только пайплайны шардов, которые он арендует в
+таблице coordinator_shards. Раз в COORDINATOR_LEASE_HEARTBEAT секунд
+экземпляр:
+- отмечается в coordinator_instances и считает живые экземпляры;
+- продлевает аренду своих шардов на COORDINATOR_LEASE_TTL секунд;
+- освобождает шарды сверх своей доли (ceil(шардов / экземпляров)) -
+  их забирают новые экземпляры;
+- захватывает свободные шарды и шарды с истекшей арендой до своей доли -
+  так шарды остановленного экземпляра переходят к остальным.
+
+Число шардов должно совпадать у всех экземпляров. Если за время переноса
+шарда пайплайн завершился в двух экземплярах, результат обрабатывает один:
+PostgreSQLClient.complete_pipeline меняет статус только у незавершенного
+пайплайна.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+from typing import FrozenSet, List
+
+# Добавление пути к shared модулям
+sys.path.append('/app')
+
+from shared.logger import get_logger
+from integrations import get_postgres_client
+
+
+logger = get_logger("pipeline_shards")
+
+
+def shard_of(pipeline_id: str, shard_count: int) -> int:
+    """Шард пайплайна; одинаков во всех процессах (в отличие от hash())"""
+    return zlib.crc32(pipeline_id.encode('utf-8')) % shard_count
+
+
+class ShardLeaseManager:
+    """Аренда шардов пайплайнов экземпляром координатора"""
+    
+    def __init__(self, instance_id: str = None, shard_count: int = None, lease_ttl: int = None,
+                 heartbeat_interval: float = None):
+        self.instance_id = instance_id or os.getenv('COORDINATOR_INSTANCE_ID') or \
+            f"{socket.gethostname()}-{os.getpid()}"
+        self.shard_count = shard_count or int(os.getenv('COORDINATOR_SHARD_COUNT', '16'))
+        self.lease_ttl = lease_ttl or int(os.getenv('COORDINATOR_LEASE_TTL', '20'))
+        self.heartbeat_interval = heartbeat_interval or float(os.getenv('COORDINATOR_LEASE_HEARTBEAT', '5'))
+        self.postgres_client = get_postgres_client()
+        
+        # Заменяется целиком: owns() читается без блокировки
+        self.owned: FrozenSet[int] = frozenset()
+        self._renewed_at = 0.0
+        self._initialized = False
+        self._lock = threading.Lock()
+    
+    def owns(self, pipeline_id: str) -> bool:
+        """Пайплайн относится к шарду, аренда которого не истекла"""
+        if time.monotonic() - self._renewed_at > self.lease_ttl:
+            return False
+        return shard_of(pipeline_id, self.shard_count) in self.owned
+    
+    def heartbeat(self) -> FrozenSet[int]:
+        """
+        Продление аренды и перераспределение шардов
+        
+        Returns:
+            FrozenSet[int]: Шарды экземпляра после перераспределения
+        """
+        with self._lock:
+            started = time.monotonic()
+            if not self._initialized:
+                self.postgres_client.init_coordinator_shards(self.shard_count)
+                self._initialized = True
+            
+            instances = self.postgres_client.heartbeat_coordinator_instance(self.instance_id, self.lease_ttl)
+            owned = set(self.postgres_client.renew_shard_leases(self.instance_id, self.lease_ttl))
+            target = -(-self.shard_count // max(instances, 1))
+            
+            if len(owned) > target:
+                released = sorted(owned)[target:]
+                self.postgres_client.release_shard_leases(self.instance_id, released)
+                owned.difference_update(released)
+            elif len(owned) < target:
+                owned.update(self.postgres_client.claim_shard_leases(self.instance_id, self.lease_ttl,
+                                                                     target - len(owned)))
+            
+            self._log_changes(owned, instances)
+            self.owned = frozenset(owned)
+            # Аренда отсчитывается от начала запроса: БД продлила ее не раньше
+            self._renewed_at = started
+            return self.owned
+    
+    def release(self):
+        """Освобождение всех шардов при остановке: остальные экземпляры забирают их сразу"""
+        with self._lock:
+            self.owned = frozenset()
+            self.postgres_client.release_shard_leases(self.instance_id)
+            self.postgres_client.remove_coordinator_instance(self.instance_id)
+        
+        logger.info("Shard leases released",
+                   component="shard_leases",
+                   details={"instance_id": self.instance_id})
+    
+    def _log_changes(self, owned: set, instances: int):
+        gained: List[int] = sorted(owned - self.owned)
+        lost: List[int] = sorted(self.owned - owned)
+        if gained or lost:
+            logger.info("Shard leases changed",
+                       component="shard_leases",
+                       details={"instance_id": self.instance_id, "instances": instances,
+                                "owned": len(owned), "gained": gained, "lost": lost})
@@ -7,6 +7,7 @@ import signal
 import sys
 import requests
 import subprocess
+import tempfile
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List, Optional
@@ -17,6 +18,9 @@ sys.path.append('/app')
 
 from shared.logger import get_logger, log_operation_start, log_operation_success, log_operation_error
 from shared.git_lock import get_git_coordinator
+from shared.metrics import (DECOMPILE_SECONDS, DOWNLOAD_BYTES, HTTP_REQUEST_SECONDS, REDMINE_POLL_BACKLOG,
+                            endpoint_label)
+from shared.process_runner import ProcessRunner
 
 
 class PreCommit1CService:
@@ -25,6 +29,7 @@ class PreCommit1CService:
     def __init__(self):
         self.logger = get_logger("precommit1c")
         self.git_coordinator = get_git_coordinator()
+        self.process_runner = ProcessRunner("precommit1c")
         self.running = True
         
         # Конфигурация из переменных окружения
@@ -33,11 +38,23 @@ class PreCommit1CService:
         self.redmine_password = self._get_secret('REDMINE_PASSWORD')
         self.check_interval = int(os.getenv('CHECK_INTERVAL', '300'))  # 5 минут
         self.workspace_path = os.getenv('WORKSPACE_PATH', '/workspace')
-        self.external_files_path = os.getenv('EXTERNAL_FILES_PATH', '/workspace/external-files')
+        # Рабочее дерево файлов задач отдельно от рабочего дерева master, которое переписывает gitsync
+        self.work_tree = os.getenv('PRECOMMIT_WORK_TREE', '/precommit-worktree')
+        self.external_files_path = os.getenv('EXTERNAL_FILES_PATH',
+                                             os.path.join(self.work_tree, 'external-files'))
+        
+        # Пакетная отправка веток external-file-* в GitLab
+        self.push_flush_window = int(os.getenv('GIT_PUSH_FLUSH_WINDOW', '30'))  # секунды
+        self.push_batch_size = int(os.getenv('GIT_PUSH_BATCH_SIZE', '20'))
+        self.push_atomic = os.getenv('GIT_PUSH_ATOMIC', 'true').lower() == 'true'
+        self.push_max_attempts = int(os.getenv('GIT_PUSH_MAX_ATTEMPTS', '5'))
         
         # Отслеживание обработанных файлов
         self.processed_attachments = set()
         
+        # Коммиты, ожидающие пакетной отправки в remote
+        self.pending_pushes: List[Dict[str, Any]] = []
+        
         # Настройка обработчиков сигналов
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -49,7 +66,10 @@ class PreCommit1CService:
                             "redmine_username": self.redmine_username,
                             "check_interval": self.check_interval,
                             "workspace_path": self.workspace_path,
-                            "external_files_path": self.external_files_path
+                            "work_tree": self.work_tree,
+                            "external_files_path": self.external_files_path,
+                            "push_flush_window": self.push_flush_window,
+                            "push_batch_size": self.push_batch_size
                         })
     
     def _get_secret(self, env_var: str) -> str:
@@ -89,10 +109,19 @@ class PreCommit1CService:
         else:
             return {"Content-Type": "application/json"}
     
+    def _redmine_get(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+        """GET запрос к Redmine с учетом времени ответа по endpoint"""
+        started = time.monotonic()
+        try:
+            return requests.get(url, **kwargs)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(upstream="redmine", method="GET",
+                                        endpoint=endpoint).observe(time.monotonic() - started)
+    
     def _check_redmine_connectivity(self) -> bool:
         """Проверка доступности Redmine"""
         try:
-            response = requests.get(self.redmine_url, timeout=10)
+            response = self._redmine_get(self.redmine_url, "/", timeout=10)
             return response.status_code < 400
         except Exception as e:
             self.logger.warning("Redmine connectivity check failed", 
@@ -112,7 +141,7 @@ class PreCommit1CService:
                 "limit": 100
             }
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self._redmine_get(url, "/issues.json", headers=headers, params=params, timeout=30)
             response.raise_for_status()
             
             data = response.json()
@@ -122,7 +151,7 @@ class PreCommit1CService:
                                 {"issues_count": len(issues)})
             
             return issues
-            
+        
         except Exception as e:
             log_operation_error("precommit1c", "get_redmine_issues", correlation_id, e)
             return []
@@ -134,14 +163,15 @@ class PreCommit1CService:
             url = urljoin(self.redmine_url, f"/issues/{issue_id}.json")
             params = {"include": "attachments"}
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self._redmine_get(url, endpoint_label(f"/issues/{issue_id}.json"),
+                                         headers=headers, params=params, timeout=30)
             response.raise_for_status()
             
             data = response.json()
             attachments = data.get("issue", {}).get("attachments", [])
             
             return attachments
-            
+        
         except Exception as e:
             self.logger.error("Failed to get issue attachments", 
                             component="redmine_api",
@@ -172,8 +202,10 @@ class PreCommit1CService:
             # Полный URL для скачивания
             download_url = urljoin(self.redmine_url, content_url)
             
-            response = requests.get(download_url, headers=headers, timeout=120)
+            # Имя файла в пути не входит в метку endpoint
+            response = self._redmine_get(download_url, "/attachments/download", headers=headers, timeout=120)
             response.raise_for_status()
+            DOWNLOAD_BYTES.labels(service="precommit1c").inc(len(response.content))
             
             # Создание директории если не существует
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -186,7 +218,7 @@ class PreCommit1CService:
                                 {"output_path": output_path, "size": len(response.content)})
             
             return True
-            
+        
         except Exception as e:
             log_operation_error("precommit1c", "download_attachment", correlation_id, e)
             return False
@@ -204,6 +236,8 @@ class PreCommit1CService:
         """Разбор файла 1С с помощью PreCommit1C"""
         correlation_id = log_operation_start("precommit1c", "decomp_1c_file", 
                                            {"file_path": file_path})
+        started = time.monotonic()
+        outcome = "error"
         
         try:
             # Создание директории для разобранных файлов
@@ -218,106 +252,341 @@ class PreCommit1CService:
                            details={"command": ' '.join(cmd)},
                            correlation_id=correlation_id)
             
-            result = subprocess.run(
+            result = self.process_runner.run(
                 cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=300  # 5 минут таймаут
+                run_name="decompile",
+                timeout=300,  # 5 минут таймаут
+                correlation_id=correlation_id
             )
             
-            if result.returncode == 0:
+            if result["timed_out"]:
+                outcome = "timeout"
+                self.logger.error("Decompilation timed out", 
+                                component="decomp",
+                                details={
+                                    "output_tail": result["output_tail"],
+                                    "log_file": result["log_file"]
+                                },
+                                correlation_id=correlation_id)
+                return False
+            
+            if result["exit_code"] == 0:
+                outcome = "success"
                 log_operation_success("precommit1c", "decomp_1c_file", correlation_id, 
-                                    {"output_dir": decompiled_dir})
+                                    {"output_dir": decompiled_dir, "duration": result["duration"]})
                 return True
             else:
+                outcome = "failed"
                 self.logger.error("Failed to decompile 1C file", 
                                 component="decomp",
                                 details={
-                                    "exit_code": result.returncode,
-                                    "stderr": result.stderr,
-                                    "stdout": result.stdout
+                                    "exit_code": result["exit_code"],
+                                    "output_tail": result["output_tail"],
+                                    "log_file": result["log_file"]
                                 },
                                 correlation_id=correlation_id)
                 return False
-                
-        except subprocess.TimeoutExpired:
-            self.logger.error("Decompilation timed out", 
-                            component="decomp",
-                            correlation_id=correlation_id)
-            return False
-            
+        
         except Exception as e:
             log_operation_error("precommit1c", "decomp_1c_file", correlation_id, e)
             return False
+        
+        finally:
+            DECOMPILE_SECONDS.labels(outcome=outcome).observe(time.monotonic() - started)
+    
+    def _run_git(self, args: List[str], env: Dict[str, str] = None, timeout: int = 30,
+                 work_tree: str = None) -> str:
+        """
+        Выполнение git команды в репозитории, возвращает stdout
+        
+        Args:
+            work_tree: Рабочее дерево вместо рабочего дерева репозитория (master)
+        """
+        cmd = ['git']
+        cwd = self.workspace_path
+        if work_tree:
+            cmd += [f'--git-dir={os.path.join(os.path.abspath(self.workspace_path), ".git")}',
+                    f'--work-tree={work_tree}']
+            cwd = work_tree
+        
+        result = subprocess.run(cmd + args, cwd=cwd, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=timeout, check=True)
+        return result.stdout.strip()
     
-    def _commit_to_git(self, file_path: str, issue_id: int) -> Optional[str]:
-        """Коммит обработанного файла в Git"""
+    def _resolve_commit(self, ref: str) -> Optional[str]:
+        """Хеш коммита ветки или None, если ветки нет"""
+        try:
+            return self._run_git(['rev-parse', '--verify', '-q', f'{ref}^{{commit}}']) or None
+        except subprocess.CalledProcessError:
+            return None
+    
+    def _commit_to_git(self, file_path: str, issue_id: int, lease=None) -> Optional[str]:
+        """
+        Коммит обработанного файла в ветку задачи
+        
+        Коммит собирается во временном индексе без checkout из отдельного
+        рабочего дерева PRECOMMIT_WORK_TREE: рабочее дерево, индекс и HEAD
+        репозитория остаются за синхронизацией master, а файлы задач не
+        попадают в master как неотслеживаемые. Поэтому коммиту достаточно
+        блокировки своей ветки. Ветка обновляется через update-ref
+        с проверкой прежнего значения.
+        
+        Перед обновлением ветки проверяется аренда блокировки lease: если
+        блокировку перехватили, коммит остается недостижимым и не публикуется.
+        """
         correlation_id = log_operation_start("precommit1c", "commit_to_git", 
                                            {"issue_id": issue_id})
         
         try:
-            os.chdir(self.workspace_path)
-            
-            # Создание ветки для внешнего файла
             branch_name = f"external-file-{issue_id}"
+            branch_ref = f"refs/heads/{branch_name}"
+            task_dir = os.path.join(self.external_files_path, f"task-{issue_id}")
+            git_path = os.path.relpath(task_dir, self.work_tree) + '/'
             
-            # Проверка существования ветки
-            result = subprocess.run(['git', 'branch', '--list', branch_name], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
-            
-            if not result.stdout.strip():
-                # Создание новой ветки
-                subprocess.run(['git', 'checkout', '-b', branch_name], check=True, timeout=30)
-            else:
-                # Переключение на существующую ветку
-                subprocess.run(['git', 'checkout', branch_name], check=True, timeout=30)
+            # Новая ветка создается от master
+            branch_commit = self._resolve_commit(branch_ref)
+            parent = branch_commit or self._resolve_commit('refs/heads/master')
             
-            # Добавление файлов в Git
-            git_path = f"external-files/task-{issue_id}/"
-            subprocess.run(['git', 'add', git_path], check=True, timeout=30)
+            with tempfile.TemporaryDirectory(prefix="precommit-index-") as index_dir:
+                env = dict(os.environ, GIT_INDEX_FILE=os.path.join(index_dir, 'index'))
+                
+                if parent:
+                    self._run_git(['read-tree', parent], env=env)
+                else:
+                    self._run_git(['read-tree', '--empty'], env=env)
+                
+                # Добавление файлов задачи во временный индекс
+                self._run_git(['add', '--', git_path], env=env, work_tree=self.work_tree)
+                tree = self._run_git(['write-tree'], env=env)
             
             # Проверка наличия изменений
-            result = subprocess.run(['git', 'status', '--porcelain'], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
-            
-            if not result.stdout.strip():
+            if parent and tree == self._run_git(['rev-parse', f'{parent}^{{tree}}']):
                 self.logger.info("No changes to commit", 
                                component="git_commit",
                                correlation_id=correlation_id)
-                # Получение текущего коммита
-                result = subprocess.run(['git', 'rev-parse', 'HEAD'], 
-                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
-                return result.stdout.strip() if result.returncode == 0 else None
+                if not branch_commit:
+                    self._run_git(['update-ref', branch_ref, parent, ''])
+                return parent
             
             # Создание коммита
             commit_message = f"[#{issue_id}] Added external file: {os.path.basename(file_path)}"
-            subprocess.run(['git', 'commit', '-m', commit_message], 
-                         check=True, timeout=30)
+            commit_cmd = ['commit-tree', tree, '-m', commit_message]
+            if parent:
+                commit_cmd += ['-p', parent]
+            commit_hash = self._run_git(commit_cmd)
+            
+            # Пустое прежнее значение - ветка не должна существовать
+            if lease:
+                lease.check()
+            self._run_git(['update-ref', '-m', commit_message, branch_ref, commit_hash, branch_commit or ''])
+            
+            # Отправка в remote выполняется пакетно в _flush_pending_pushes
+            log_operation_success("precommit1c", "commit_to_git", correlation_id, 
+                                {"commit_message": commit_message, "commit_hash": commit_hash})
+            return commit_hash
+        
+        except Exception as e:
+            log_operation_error("precommit1c", "commit_to_git", correlation_id, e)
+            return None
+    
+    def _queue_push(self, entry: Dict[str, Any]):
+        """Постановка коммита в очередь пакетной отправки"""
+        entry["queued_at"] = time.time()
+        self.pending_pushes.append(entry)
+        
+        self.logger.debug("Commit queued for batch push", 
+                         component="git_push",
+                         details={
+                             "branch": entry["branch"],
+                             "commit_hash": entry["commit_hash"],
+                             "pending_count": len(self.pending_pushes)
+                         },
+                         correlation_id=entry.get("correlation_id"))
+    
+    def _should_flush_pushes(self) -> bool:
+        """Проверка необходимости отправки накопленных коммитов"""
+        if not self.pending_pushes:
+            return False
+        
+        if len(self.pending_pushes) >= self.push_batch_size:
+            return True
+        
+        oldest = min(entry["queued_at"] for entry in self.pending_pushes)
+        return time.time() - oldest >= self.push_flush_window
+    
+    def _push_timeout(self, branches: List[str]) -> int:
+        """Таймаут git push; вместе с запасом укладывается в GIT_LOCK_MAX_HOLD"""
+        return min(60 + 10 * len(branches), 180)
+    
+    def _push_locked(self, branches: List[str]) -> bool:
+        """Отправка веток под их блокировкой"""
+        # push не сообщает о продвижении: аренда рассчитана на всю отправку
+        max_hold = self._push_timeout(branches) + 30
+        with self.git_coordinator.acquire_lock("precommit1c", timeout=300, refs=branches,
+                                               max_hold=max_hold, lease_ttl=max_hold) as lease:
+            return self._push_branches(branches, lease)
+    
+    def _push_branches(self, branches: List[str], lease=None) -> bool:
+        """Отправка нескольких веток в remote одной командой git push"""
+        correlation_id = log_operation_start("precommit1c", "batch_push", 
+                                           {"branches": branches})
+        
+        try:
+            os.chdir(self.workspace_path)
+            
+            # Ветки не отправляются, если блокировку перехватили
+            if lease:
+                lease.check()
             
-            # Получение хеша коммита
-            result = subprocess.run(['git', 'rev-parse', 'HEAD'], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
-            commit_hash = result.stdout.strip() if result.returncode == 0 else None
+            push_cmd = ['git', 'push']
+            if self.push_atomic:
+                push_cmd.append('--atomic')
+            push_cmd += ['origin'] + branches
+            
+            result = subprocess.run(
+                push_cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                timeout=self._push_timeout(branches)
+            )
             
-            # Отправка в remote (если настроен)
+            if result.returncode == 0:
+                log_operation_success("precommit1c", "batch_push", correlation_id, 
+                                    {"branches_count": len(branches)})
+                return True
+            
+            self.logger.warning("Failed to push branches to remote, commits kept locally", 
+                              component="git_push",
+                              details={
+                                  "exit_code": result.returncode,
+                                  "stderr": result.stderr,
+                                  "branches": branches
+                              },
+                              correlation_id=correlation_id)
+            return False
+        
+        except Exception as e:
+            log_operation_error("precommit1c", "batch_push", correlation_id, e)
+            return False
+    
+    def _flush_pending_pushes(self):
+        """
+        Пакетная отправка накопленных коммитов и запуск пайплайнов
+        
+        Если пакет отклонен целиком (--atomic и одна отклоненная ветка),
+        ветки отправляются по одной: отклоненная ветка не задерживает
+        остальные задачи. Коммиты неотправленной ветки остаются в очереди
+        до GIT_PUSH_MAX_ATTEMPTS попыток, после чего файл помечается failed.
+        """
+        if not self.pending_pushes:
+            return
+        
+        batch = list(self.pending_pushes)
+        # Порядок веток сохраняется, дубликаты (несколько файлов одной задачи) схлопываются
+        branches = list(dict.fromkeys(entry["branch"] for entry in batch))
+        
+        # Повторы по одной ветке берут отдельные блокировки: суммарное время
+        # отправки не растягивает удержание сверх max_hold
+        if self._push_locked(branches):
+            pushed = set(branches)
+        elif len(branches) > 1:
+            pushed = {branch for branch in branches if self._push_locked([branch])}
+        else:
+            pushed = set()
+        
+        # Записи, добавленные во время отправки, остаются в очереди
+        self.pending_pushes = self.pending_pushes[len(batch):]
+        
+        for entry in batch:
+            if entry["branch"] in pushed:
+                self._complete_pushed_file(entry)
+                continue
+            
+            entry["push_attempts"] = entry.get("push_attempts", 0) + 1
+            if entry["push_attempts"] < self.push_max_attempts:
+                self.pending_pushes.append(entry)
+            else:
+                self._drop_pending_push(entry)
+    
+    def _drop_pending_push(self, entry: Dict[str, Any]):
+        """Отказ от отправки ветки после исчерпания попыток"""
+        self.logger.error("Giving up pushing branch to remote", 
+                        component="git_push",
+                        details={
+                            "branch": entry["branch"],
+                            "commit_hash": entry["commit_hash"],
+                            "attempts": entry["push_attempts"]
+                        },
+                        correlation_id=entry.get("correlation_id"))
+        
+        # Файл не обрабатывается повторно до перезапуска сервиса, коммит остается в локальной ветке
+        self.processed_attachments.add(entry["file_info"].get("attachment_id"))
+        
+        try:
+            from integrations import get_postgres_client
+            get_postgres_client().update_external_file_status(entry["external_file_id"], "failed")
+        except Exception as e:
+            self.logger.error("Failed to update external file status", 
+                            component="git_push",
+                            details={"error": str(e)},
+                            correlation_id=entry.get("correlation_id"))
+    
+    def _is_pending_push(self, attachment_id: int) -> bool:
+        """Файл обработан и ожидает отправки ветки"""
+        return any(entry["file_info"].get("attachment_id") == attachment_id for entry in self.pending_pushes)
+    
+    def _complete_pushed_file(self, entry: Dict[str, Any]):
+        """Завершение обработки файла после успешной отправки ветки"""
+        correlation_id = entry.get("correlation_id")
+        external_file_id = entry["external_file_id"]
+        issue_id = entry["issue_id"]
+        
+        # Отметка файла как обработанного только после отправки ветки
+        self.processed_attachments.add(entry["file_info"].get("attachment_id"))
+        
+        try:
+            from integrations import get_postgres_client
+            postgres_client = get_postgres_client()
+            
+            # Обновление записи с информацией о коммите
+            postgres_client.update_external_file_status(
+                external_file_id,
+                "completed",
+                decompiled_path=entry["decompiled_path"],
+                git_commit_hash=entry["commit_hash"],
+                git_branch=entry["branch"]
+            )
+            
+            # Запуск пайплайна через Pipeline Coordinator
             try:
-                subprocess.run(['git', 'push', 'origin', branch_name], 
-                             check=True, timeout=60)
-                
-                log_operation_success("precommit1c", "commit_to_git", correlation_id, 
-                                    {"commit_message": commit_message, "commit_hash": commit_hash})
-                return commit_hash
+                from pipeline_coordinator import get_pipeline_coordinator
+                coordinator = get_pipeline_coordinator()
                 
-            except subprocess.CalledProcessError:
-                self.logger.warning("Failed to push to remote, commit created locally", 
-                                  component="git_commit",
-                                  correlation_id=correlation_id)
-                return commit_hash
+                pipeline_id = coordinator.trigger_precommit_pipeline(
+                    redmine_issue_id=issue_id,
+                    file_info=entry["file_info"],
+                    external_file_id=external_file_id
+                )
                 
+                if pipeline_id:
+                    self.logger.info("Pipeline triggered successfully", 
+                                   component="file_processing",
+                                   details={"pipeline_id": pipeline_id},
+                                   correlation_id=correlation_id)
+            
+            except Exception as e:
+                self.logger.error("Failed to trigger pipeline", 
+                                component="file_processing",
+                                details={"error": str(e)},
+                                correlation_id=correlation_id)
+            
+            log_operation_success("precommit1c", "process_external_file", 
+                                correlation_id, {"filename": entry["file_info"].get("filename")})
+        
         except Exception as e:
-            log_operation_error("precommit1c", "commit_to_git", correlation_id, e)
-            return None
+            log_operation_error("precommit1c", "process_external_file", correlation_id, e)
     
     def _process_external_file(self, attachment: Dict[str, Any], issue_id: int):
         """Обработка внешнего файла 1С"""
@@ -352,7 +621,7 @@ class PreCommit1CService:
                     file_type=file_type,
                     file_size_bytes=file_size
                 )
-                
+            
             except Exception as e:
                 self.logger.error("Failed to create external file record", 
                                 component="file_processing",
@@ -390,60 +659,33 @@ class PreCommit1CService:
                                 correlation_id=correlation_id)
                 return
             
-            # Коммит в Git с блокировкой
-            with self.git_coordinator.acquire_lock("precommit1c", timeout=300):
-                commit_hash = self._commit_to_git(file_path, issue_id)
-                if commit_hash:
-                    # Обновление записи с информацией о коммите
-                    postgres_client.update_external_file_status(
-                        external_file_id,
-                        "completed",
-                        decompiled_path=decompiled_path,
-                        git_commit_hash=commit_hash,
-                        git_branch=f"external-file-{issue_id}"
-                    )
-                    
-                    # Запуск пайплайна через Pipeline Coordinator
-                    try:
-                        from pipeline_coordinator import get_pipeline_coordinator
-                        coordinator = get_pipeline_coordinator()
-                        
-                        file_info = {
-                            "filename": filename,
-                            "file_type": file_type,
-                            "file_size": file_size,
-                            "attachment_id": attachment_id
-                        }
-                        
-                        pipeline_id = coordinator.trigger_precommit_pipeline(
-                            redmine_issue_id=issue_id,
-                            file_info=file_info,
-                            external_file_id=external_file_id
-                        )
-                        
-                        if pipeline_id:
-                            self.logger.info("Pipeline triggered successfully", 
-                                           component="file_processing",
-                                           details={"pipeline_id": pipeline_id},
-                                           correlation_id=correlation_id)
-                        
-                    except Exception as e:
-                        self.logger.error("Failed to trigger pipeline", 
-                                        component="file_processing",
-                                        details={"error": str(e)},
-                                        correlation_id=correlation_id)
-                    
-                    # Отметка файла как обработанного
-                    self.processed_attachments.add(attachment_id)
-                    
-                    log_operation_success("precommit1c", "process_external_file", 
-                                        correlation_id, {"filename": filename})
-                else:
-                    postgres_client.update_external_file_status(external_file_id, "failed")
-                    self.logger.error("Failed to commit to Git", 
-                                    component="file_processing",
-                                    correlation_id=correlation_id)
-                    
+            # Коммит в Git с блокировкой ветки задачи, отправка в remote выполняется пакетно
+            with self.git_coordinator.acquire_lock("precommit1c", timeout=300,
+                                                   refs=[f"external-file-{issue_id}"],
+                                                   max_hold=120, lease_ttl=120) as lease:
+                commit_hash = self._commit_to_git(file_path, issue_id, lease)
+            
+            if commit_hash:
+                self._queue_push({
+                    "branch": f"external-file-{issue_id}",
+                    "commit_hash": commit_hash,
+                    "issue_id": issue_id,
+                    "external_file_id": external_file_id,
+                    "decompiled_path": decompiled_path,
+                    "file_info": {
+                        "filename": filename,
+                        "file_type": file_type,
+                        "file_size": file_size,
+                        "attachment_id": attachment_id
+                    },
+                    "correlation_id": correlation_id
+                })
+            else:
+                postgres_client.update_external_file_status(external_file_id, "failed")
+                self.logger.error("Failed to commit to Git", 
+                                component="file_processing",
+                                correlation_id=correlation_id)
+        
         except Exception as e:
             log_operation_error("precommit1c", "process_external_file", correlation_id, e)
     
@@ -464,6 +706,8 @@ class PreCommit1CService:
             
             processed_files_count = 0
             
+            # Новые файлы 1С всех задач: их число - очередь опроса Redmine
+            backlog = []
             for issue in issues:
                 issue_id = issue.get("id")
                 if not issue_id:
@@ -476,20 +720,32 @@ class PreCommit1CService:
                     attachment_id = attachment.get("id")
                     filename = attachment.get("filename", "")
                     
-                    # Проверка, что файл еще не обработан
-                    if attachment_id in self.processed_attachments:
+                    # Проверка, что файл еще не обработан и не ожидает отправки
+                    if attachment_id in self.processed_attachments or self._is_pending_push(attachment_id):
                         continue
                     
                     # Проверка, что это файл 1С
                     if self._is_1c_file(filename):
-                        self._process_external_file(attachment, issue_id)
-                        processed_files_count += 1
+                        backlog.append((attachment, issue_id))
+            
+            REDMINE_POLL_BACKLOG.set(len(backlog))
+            for attachment, issue_id in backlog:
+                self._process_external_file(attachment, issue_id)
+                processed_files_count += 1
+                REDMINE_POLL_BACKLOG.dec()
+                
+                if self._should_flush_pushes():
+                    self._flush_pending_pushes()
+            
+            # Отправка оставшихся коммитов цикла одним git push
+            self._flush_pending_pushes()
             
             log_operation_success("precommit1c", "monitor_cycle", cycle_id, {
                 "issues_checked": len(issues),
-                "files_processed": processed_files_count
+                "files_processed": processed_files_count,
+                "pending_pushes": len(self.pending_pushes)
             })
-            
+        
         except Exception as e:
             log_operation_error("precommit1c", "monitor_cycle", cycle_id, e)
     
@@ -514,7 +770,7 @@ class PreCommit1CService:
                     if not self.running:
                         break
                     time.sleep(1)
-                    
+            
             except KeyboardInterrupt:
                 self.logger.info("Received keyboard interrupt", component="main")
                 break
@@ -524,6 +780,14 @@ class PreCommit1CService:
                                 exc_info=True)
                 time.sleep(60)  # Ожидание перед повторной попыткой
         
+        # Отправка коммитов, накопленных до остановки
+        try:
+            self._flush_pending_pushes()
+        except Exception as e:
+            self.logger.error("Failed to flush pending pushes on shutdown", 
+                            component="main",
+                            details={"error": str(e), "pending_count": len(self.pending_pushes)})
+        
         self.logger.info("PreCommit1C service stopped", component="main")
         return 0
 
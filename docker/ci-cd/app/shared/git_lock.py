@@ -2,137 +2,1254 @@
 Git Lock Coordinator - координация доступа к Git репозиторию между сервисами
 """
 import fcntl
+import glob
+import json
+import re
+import socket
+import threading
+import zlib
 import time
 import os
 from contextlib import contextmanager
-from typing import Generator
+from typing import Any, Callable, Dict, Generator, IO, List, Optional, Tuple
+import psycopg2
+import psycopg2.errors
 from shared.logger import get_logger
+from shared.metrics import GIT_LOCK_WAIT_SECONDS, GIT_LOCK_HOLD_SECONDS
+
+
+# Содержимое узла очереди, покинувшего очередь по таймауту
+_ABANDONED = "abandoned"
+
+# Символы имени ветки, недопустимые в имени файла блокировки
+_REF_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_-]')
+
+# Имена блокировок: репозиторий целиком и отдельные ветки
+REPOSITORY_LOCK = "repository"
+_REF_PREFIX = "ref:"
+
+# Пространство ключей advisory locks Git координатора (первый аргумент pg_advisory_lock)
+_ADVISORY_NAMESPACE = 0x4749
+
+
+def _advisory_key(name: str) -> int:
+    """Второй ключ advisory lock: неотрицательный int4 по имени блокировки"""
+    return zlib.crc32(name.encode('utf-8')) & 0x7fffffff
+
+
+class GitLockLostError(RuntimeError):
+    """Аренда блокировки истекла или перехвачена - изменять репозиторий нельзя"""
+
+
+def _lease_expired(lease: Dict[str, Any], lease_ttl: int, now: float = None) -> bool:
+    """
+    Истечение аренды держателя
+    
+    Аренда истекает, если держатель не продлевал ее дольше lease_ttl
+    (операция перестала продвигаться или процесс остановлен) или держит
+    блокировку дольше заявленного max_hold. Срок, заданный при захвате,
+    важнее общего lease_ttl.
+    """
+    now = time.time() if now is None else now
+    if now - lease.get("heartbeat_at", now) > (lease.get("lease_ttl") or lease_ttl):
+        return True
+    max_hold = lease.get("max_hold")
+    return bool(max_hold) and now - lease.get("acquired_at", now) > max_hold
+
+
+class _FileLockHandle:
+    """Полученная файловая блокировка: файл, узел очереди, аренда"""
+    
+    def __init__(self, ticket: int, shared: bool, lock_file: IO, node: Optional[IO],
+                 lease_path: str, lease_file: IO, lease: Dict[str, Any]):
+        self.ticket = ticket
+        self.shared = shared
+        self.lock_file = lock_file
+        self.node = node
+        self.lease_path = lease_path
+        self.lease_file = lease_file
+        self.lease = lease
+
+
+class _QueuedFileLock:
+    """
+    Файл блокировки с FIFO-очередью ожидающих и арендой держателей
+    
+    Ожидающие обслуживаются в порядке очереди билетов: каждый ожидающий
+    держит flock на своем узле очереди (<lock>.q<билет>) и блокирующе ждет
+    flock узла предшественника. Освобождение предшественника (или его падение -
+    ядро снимает flock) будит следующего сразу, без опроса. Узел, покинувший
+    очередь по таймауту, помечается и пропускается преемником.
+    
+    Читатель отпускает свой узел сразу после получения разделяемой блокировки,
+    поэтому идущие подряд читатели работают параллельно, а писатель за ними
+    ждет их завершения и не пропускает вперед более поздних читателей.
+    
+    Держатель записывает аренду (<lock>.lease.<билет>) и продлевает ее по мере
+    продвижения операции (GitLockLease.renew), а не по таймеру: живой, но
+    зависший процесс перестает продлевать аренду и теряет блокировку.
+    Первый в очереди периодически проверяет аренды мешающих ему держателей;
+    если все они истекли, он поднимает fencing token (<lock>.fence) выше их
+    билетов и удаляет файл блокировки - зависший держатель остается с flock
+    на удаленном файле и при проверке токена узнает, что блокировка потеряна.
+    """
+    
+    def __init__(self, lock_file_path: str, lease_ttl: int = 60, check_interval: float = 5):
+        self.lock_file_path = lock_file_path
+        self.ticket_file_path = f"{lock_file_path}.ticket"
+        self.fence_file_path = f"{lock_file_path}.fence"
+        self.lease_ttl = lease_ttl
+        self.check_interval = check_interval
+        self.logger = get_logger("git-coordinator")
+    
+    def _node_path(self, ticket: int) -> str:
+        return f"{self.lock_file_path}.q{ticket}"
+    
+    def _lease_path(self, ticket: int) -> str:
+        return f"{self.lock_file_path}.lease.{ticket}"
+    
+    def _flock_with_deadline(self, path: str, deadline: float, create: bool = True, shared: bool = False,
+                             should_stop: Callable[[IO], bool] = None) -> Tuple[Optional[IO], bool]:
+        """
+        Блокирующий flock в потоке ожидания с ограничением по времени
+        
+        Args:
+            path: Путь к файлу блокировки
+            deadline: Момент time.monotonic(), после которого ожидание прекращается
+            create: Создавать файл, если он отсутствует (иначе FileNotFoundError)
+            shared: Разделяемая блокировка (LOCK_SH) вместо исключительной
+            should_stop: Проверка каждые check_interval секунд; True прекращает ожидание
+        
+        Returns:
+            Tuple[Optional[IO], bool]: Файл с полученной блокировкой (None, если
+            не получена) и признак остановки ожидания проверкой should_stop
+        """
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        lock_file = open(path, 'a+' if create else 'r')
+        try:
+            fcntl.flock(lock_file.fileno(), operation | fcntl.LOCK_NB)
+            return lock_file, False
+        except BlockingIOError:
+            pass
+        
+        acquired = threading.Event()
+        state_lock = threading.Lock()
+        abandoned = False
+        
+        def waiter():
+            try:
+                fcntl.flock(lock_file.fileno(), operation)
+            except (OSError, ValueError):
+                return
+            
+            with state_lock:
+                if abandoned:
+                    # Ожидающий ушел - блокировка сразу отдается дальше
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    lock_file.close()
+                    return
+                acquired.set()
+        
+        threading.Thread(target=waiter, name="git-lock-waiter", daemon=True).start()
+        
+        stopped = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if acquired.wait(max(0.0, min(remaining, self.check_interval))) or remaining <= 0:
+                break
+            if should_stop and should_stop(lock_file):
+                stopped = True
+                break
+        
+        with state_lock:
+            if acquired.is_set():
+                return lock_file, False
+            abandoned = True
+        return None, stopped
+    
+    def _enqueue(self, service_name: str) -> Tuple[int, IO]:
+        """Получение билета и захват собственного узла очереди"""
+        with open(self.ticket_file_path, 'a+') as ticket_file:
+            fcntl.flock(ticket_file.fileno(), fcntl.LOCK_EX)
+            ticket_file.seek(0)
+            content = ticket_file.read().strip()
+            ticket = int(content) if content.isdigit() else 0
+            
+            ticket_file.seek(0)
+            ticket_file.truncate()
+            ticket_file.write(str(ticket + 1))
+            ticket_file.flush()
+            
+            # Узел захватывается до выдачи следующего билета,
+            # иначе преемник может застать его свободным
+            node = open(self._node_path(ticket), 'w')
+            fcntl.flock(node.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            node.write(f"{service_name}:{os.getpid()}")
+            node.flush()
+        
+        return ticket, node
+    
+    def read_fence(self) -> int:
+        """Текущий fencing token: держатели с меньшим билетом лишены блокировки"""
+        try:
+            with open(self.fence_file_path, 'r') as f:
+                content = f.read().strip()
+                return int(content) if content.isdigit() else 0
+        except FileNotFoundError:
+            return 0
+    
+    def _raise_fence(self, token: int):
+        """Поднятие fencing token, значение только растет"""
+        with open(self.fence_file_path, 'a+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            content = f.read().strip()
+            if content.isdigit() and int(content) >= token:
+                return
+            f.seek(0)
+            f.truncate()
+            f.write(str(token))
+            f.flush()
+    
+    def leases(self) -> List[Dict[str, Any]]:
+        """
+        Аренды текущих держателей
+        
+        Аренда без flock осталась от упавшего процесса и удаляется;
+        отозванные (билет ниже fencing token) помечаются revoked.
+        """
+        fence = self.read_fence()
+        result = []
+        for path in glob.glob(f"{glob.escape(self.lock_file_path)}.lease.*"):
+            try:
+                with open(path, 'r') as f:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+                        # Держатель завершился, не удалив аренду
+                        os.remove(path)
+                        continue
+                    except BlockingIOError:
+                        pass
+                    lease = json.loads(f.read())
+            except (OSError, ValueError):
+                # Аренда удалена или переписывается продлением в этот момент
+                continue
+            
+            lease["revoked"] = lease.get("ticket", 0) < fence
+            lease["expired"] = lease["revoked"] or _lease_expired(lease, self.lease_ttl)
+            result.append(lease)
+        return result
+    
+    def _holder_expired(self, ticket: int) -> bool:
+        """Предшественник в очереди - держатель, чья аренда истекла или отозвана"""
+        if ticket < self.read_fence():
+            return True
+        for lease in self.leases():
+            if lease.get("ticket") == ticket:
+                return lease["expired"]
+        return False
+    
+    def _wait_for_turn(self, ticket: int, deadline: float) -> bool:
+        """Ожидание освобождения ближайшего активного предшественника"""
+        predecessor = ticket - 1
+        while predecessor >= 0:
+            path = self._node_path(predecessor)
+            try:
+                node, stopped = self._flock_with_deadline(
+                    path, deadline, create=False,
+                    should_stop=lambda _, p=predecessor: self._holder_expired(p)
+                )
+            except FileNotFoundError:
+                return True
+            
+            if stopped:
+                # Держатель с истекшей арендой: блокировка перехватывается на следующем шаге
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return True
+            if node is None:
+                return False
+            
+            node.seek(0)
+            content = node.read().strip()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(node.fileno(), fcntl.LOCK_UN)
+            node.close()
+            
+            if content != _ABANDONED:
+                return True
+            predecessor -= 1
+        return True
+    
+    def _is_current(self, lock_file: IO) -> bool:
+        """Файл блокировки не удален перехватом и не заменен новым"""
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(self.lock_file_path).st_ino
+        except FileNotFoundError:
+            return False
+    
+    def _expired_holders(self, shared: bool) -> List[Dict[str, Any]]:
+        """
+        Мешающие держатели, если аренды всех истекли; иначе пустой список
+        
+        Читателю мешают только писатели. Блокировка без записей аренды
+        (держатель еще не записал ее) перехвату не подлежит.
+        """
+        holders = [lease for lease in self.leases()
+                   if not lease["revoked"] and not (shared and lease.get("mode") == "shared")]
+        if holders and all(lease["expired"] for lease in holders):
+            return holders
+        return []
+    
+    def break_holders(self, holders: List[Dict[str, Any]], breaker: str):
+        """
+        Отзыв блокировки у держателей
+        
+        fencing token поднимается выше их билетов, аренды удаляются, файл
+        блокировки удаляется - следующий захват получает новый файл.
+        """
+        self._raise_fence(max(lease.get("ticket", 0) for lease in holders) + 1)
+        for lease in holders:
+            try:
+                os.remove(self._lease_path(lease.get("ticket", 0)))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(self.lock_file_path)
+        except FileNotFoundError:
+            pass
+        
+        now = time.time()
+        self.logger.warning("Git lock taken over from stale holders",
+                          component="lock_coordinator",
+                          details={
+                              "lock": self.lock_file_path,
+                              "breaker": breaker,
+                              "holders": [{
+                                  "service": lease.get("service"),
+                                  "host": lease.get("host"),
+                                  "pid": lease.get("pid"),
+                                  "ticket": lease.get("ticket"),
+                                  "held_seconds": round(now - lease.get("acquired_at", now), 1)
+                              } for lease in holders]
+                          })
+    
+    def _acquire_lock_file(self, service_name: str, deadline: float, shared: bool) -> Optional[IO]:
+        """Захват файла блокировки с перехватом у держателей с истекшей арендой"""
+        def should_stop(lock_file: IO) -> bool:
+            return not self._is_current(lock_file) or bool(self._expired_holders(shared))
+        
+        while True:
+            lock_file, stopped = self._flock_with_deadline(self.lock_file_path, deadline,
+                                                           shared=shared, should_stop=should_stop)
+            if lock_file is not None:
+                if self._is_current(lock_file):
+                    return lock_file
+                # Захвачен файл, удаленный при перехвате - повтор с новым файлом
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+                continue
+            
+            if not stopped:
+                return None
+            
+            holders = self._expired_holders(shared)
+            if holders:
+                self.break_holders(holders, service_name)
+    
+    def _leave_queue(self, node: IO, abandoned: bool):
+        """Освобождение узла очереди - преемник просыпается сразу"""
+        try:
+            if abandoned:
+                node.seek(0)
+                node.truncate()
+                node.write(_ABANDONED)
+                node.flush()
+            fcntl.flock(node.fileno(), fcntl.LOCK_UN)
+        finally:
+            node.close()
+    
+    def _publish_lease(self, handle: _FileLockHandle):
+        """
+        Публикация аренды без окна, в котором ее можно принять за брошенную
+        
+        Аренда пишется во временный файл (не попадает под шаблон leases()),
+        который flock-ается до переименования на место - leases() никогда не
+        видит файл аренды без flock живого держателя.
+        """
+        tmp_path = f"{self.lock_file_path}.newlease.{handle.ticket}"
+        lease_file = open(tmp_path, 'w')
+        try:
+            fcntl.flock(lease_file.fileno(), fcntl.LOCK_EX)
+            lease_file.write(json.dumps(handle.lease))
+            lease_file.flush()
+            os.rename(tmp_path, handle.lease_path)
+        except Exception:
+            lease_file.close()
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        previous, handle.lease_file = handle.lease_file, lease_file
+        if previous:
+            previous.close()
+    
+    def acquire(self, service_name: str, deadline: float, shared: bool = False,
+                max_hold: int = None, lease_ttl: int = None) -> Optional[_FileLockHandle]:
+        """
+        Получение блокировки в порядке очереди
+        
+        Returns:
+            Optional[_FileLockHandle]: Полученная блокировка или None по таймауту
+        """
+        ticket, node = self._enqueue(service_name)
+        
+        try:
+            lock_file = None
+            if self._wait_for_turn(ticket, deadline):
+                # Предшественник уже отпустил блокировку - обычно она свободна;
+                # ожидание нужно для читателей и процессов, не использующих очередь
+                lock_file = self._acquire_lock_file(service_name, deadline, shared)
+        except Exception:
+            self._leave_queue(node, abandoned=True)
+            raise
+        
+        if lock_file is None:
+            self._leave_queue(node, abandoned=True)
+            return None
+        
+        if not shared:
+            # Последующие проверки отзывают держателей с меньшим билетом
+            self._raise_fence(ticket)
+        
+        # Аренда держателя: flock на файле аренды показывает, что процесс жив
+        now = time.time()
+        handle = _FileLockHandle(ticket, shared, lock_file, node, self._lease_path(ticket), None, {
+            "ticket": ticket,
+            "service": service_name,
+            "mode": "shared" if shared else "exclusive",
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "acquired_at": now,
+            "heartbeat_at": now,
+            "max_hold": max_hold,
+            "lease_ttl": lease_ttl
+        })
+        self._publish_lease(handle)
+        
+        if shared:
+            self._leave_queue(node, abandoned=False)
+            handle.node = None
+        
+        return handle
+    
+    def renew(self, handle: _FileLockHandle) -> bool:
+        """Продление аренды; отозванная блокировка не продлевается"""
+        if not self.is_valid(handle):
+            return False
+        handle.lease["heartbeat_at"] = time.time()
+        self._publish_lease(handle)
+        return True
+    
+    def is_valid(self, handle: _FileLockHandle) -> bool:
+        """Блокировка не отозвана: fencing token не поднят выше билета держателя"""
+        return self.read_fence() <= handle.ticket and os.path.exists(handle.lease_path)
+    
+    def release(self, handle: _FileLockHandle):
+        """
+        Освобождение аренды и блокировки, затем узла очереди - порядок важен:
+        преемник должен застать блокировку свободной
+        """
+        try:
+            if self.is_valid(handle):
+                try:
+                    os.remove(handle.lease_path)
+                except FileNotFoundError:
+                    pass
+            handle.lease_file.close()
+            fcntl.flock(handle.lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            handle.lock_file.close()
+            if handle.node:
+                self._leave_queue(handle.node, abandoned=False)
+    
+    def queue_depth(self) -> int:
+        """Число занятых узлов очереди (писатель-владелец и ожидающие)"""
+        depth = 0
+        for path in glob.glob(f"{glob.escape(self.lock_file_path)}.q*"):
+            try:
+                with open(path, 'r') as node:
+                    fcntl.flock(node.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                depth += 1
+            except OSError:
+                continue
+        return depth
+    
+    def status(self) -> dict:
+        """Состояние блокировки: режим, держатели с возрастом аренды и глубина очереди"""
+        status = {"locked": False, "mode": None, "owner": None, "timestamp": None,
+                  "queue_depth": 0, "fencing_token": self.read_fence(), "holders": []}
+        if not os.path.exists(self.lock_file_path):
+            return status
+        
+        with open(self.lock_file_path, 'r') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Блокировка свободна
+                status["queue_depth"] = self.queue_depth()
+                return status
+            except BlockingIOError:
+                pass
+            
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+                status["mode"] = "shared"
+            except BlockingIOError:
+                status["mode"] = "exclusive"
+        
+        now = time.time()
+        status["locked"] = True
+        status["holders"] = [{
+            "service": lease.get("service"),
+            "mode": lease.get("mode"),
+            "host": lease.get("host"),
+            "pid": lease.get("pid"),
+            "ticket": lease.get("ticket"),
+            "age_seconds": round(now - lease.get("acquired_at", now), 1),
+            "heartbeat_age_seconds": round(now - lease.get("heartbeat_at", now), 1),
+            "max_hold": lease.get("max_hold"),
+            "lease_ttl": lease.get("lease_ttl"),
+            "expired": lease["expired"],
+            "revoked": lease["revoked"]
+        } for lease in sorted(self.leases(), key=lambda l: l.get("ticket", 0))]
+        
+        # Писатель держит узел очереди до освобождения - он не входит в глубину очереди
+        depth = self.queue_depth()
+        if status["mode"] == "exclusive":
+            depth -= 1
+            writers = [h for h in status["holders"] if h["mode"] == "exclusive" and not h["revoked"]]
+            if writers:
+                status["owner"] = writers[-1]["service"]
+                status["timestamp"] = int(now - writers[-1]["age_seconds"])
+                status["age_seconds"] = writers[-1]["age_seconds"]
+            else:
+                status["owner"] = "unknown"
+        status["queue_depth"] = max(0, depth)
+        return status
+
+
+class _FileLockSession:
+    """Набор блокировок одного захвата в файловом бэкенде"""
+    
+    def __init__(self, backend: '_FileLockBackend', service_name: str, max_hold: int = None,
+                 lease_ttl: int = None):
+        self.backend = backend
+        self.service_name = service_name
+        self.max_hold = max_hold
+        self.lease_ttl = lease_ttl
+        self.lost = False
+        self._held: List[Tuple[_QueuedFileLock, _FileLockHandle]] = []
+    
+    def lock(self, name: str, shared: bool, deadline: float) -> bool:
+        lock = self.backend.make_lock(name)
+        handle = lock.acquire(self.service_name, deadline, shared=shared, max_hold=self.max_hold,
+                              lease_ttl=self.lease_ttl)
+        if handle is None:
+            return False
+        self._held.append((lock, handle))
+        return True
+    
+    @property
+    def tokens(self) -> Dict[str, int]:
+        return {lock.lock_file_path: handle.ticket for lock, handle in self._held}
+    
+    def check(self) -> bool:
+        if not self.lost and not all(lock.is_valid(handle) for lock, handle in self._held):
+            self.lost = True
+        return not self.lost
+    
+    def renew(self) -> bool:
+        if not self.check():
+            return False
+        for lock, handle in self._held:
+            try:
+                if not lock.renew(handle):
+                    self.lost = True
+            except OSError as e:
+                self.backend.logger.warning("Failed to renew Git lock lease",
+                                          component="lock_coordinator",
+                                          details={"service": self.service_name, "error": str(e)})
+        return not self.lost
+    
+    def close(self):
+        while self._held:
+            lock, handle = self._held.pop()
+            lock.release(handle)
+
+
+class _FileLockBackend:
+    """
+    Блокировки на flock - координация процессов одного контейнера
+    
+    Репозиторий - /tmp/git.lock, ветки - /tmp/git.lock.ref.<ветка>.
+    """
+    
+    name = "file"
+    
+    def __init__(self, lock_file_path: str, lease_ttl: int, heartbeat_interval: float):
+        self.lock_file_path = lock_file_path
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = get_logger("git-coordinator")
+    
+    def lock_path(self, name: str) -> str:
+        if name == REPOSITORY_LOCK:
+            return self.lock_file_path
+        safe_name = _REF_UNSAFE_CHARS.sub('_', name[len(_REF_PREFIX):])
+        return f"{self.lock_file_path}.ref.{safe_name}"
+    
+    def make_lock(self, name: str) -> _QueuedFileLock:
+        return _QueuedFileLock(self.lock_path(name), lease_ttl=self.lease_ttl,
+                               check_interval=self.heartbeat_interval)
+    
+    def open_session(self, service_name: str, max_hold: int = None,
+                     lease_ttl: int = None) -> _FileLockSession:
+        os.makedirs(os.path.dirname(self.lock_file_path), exist_ok=True)
+        return _FileLockSession(self, service_name, max_hold=max_hold, lease_ttl=lease_ttl)
+    
+    def status(self) -> dict:
+        status = self.make_lock(REPOSITORY_LOCK).status()
+        
+        refs = {}
+        prefix = f"{self.lock_file_path}.ref."
+        for path in glob.glob(f"{glob.escape(prefix)}*"):
+            name = path[len(prefix):]
+            if '.' in name:
+                # Узлы очереди, аренды и счетчики блокировок веток
+                continue
+            ref_status = self.make_lock(f"{_REF_PREFIX}{name}").status()
+            if ref_status["locked"] or ref_status["queue_depth"]:
+                refs[name] = ref_status
+        status["refs"] = refs
+        return status
+    
+    def force_unlock(self, breaker: str) -> bool:
+        """Отзыв блокировки репозитория у всех держателей через fencing token"""
+        lock = self.make_lock(REPOSITORY_LOCK)
+        holders = [lease for lease in lock.leases() if not lease["revoked"]]
+        if not holders:
+            return False
+        lock.break_holders(holders, breaker)
+        return True
+
+
+class _PostgresLockSession:
+    """
+    Набор advisory-блокировок одного захвата на отдельном соединении
+    
+    Блокировки сессионные: закрытие соединения или падение процесса
+    (обрыв определяется TCP keepalive) освобождает их на сервере.
+    """
+    
+    def __init__(self, backend: '_PostgresLockBackend', service_name: str, max_hold: int = None,
+                 lease_ttl: int = None):
+        self.backend = backend
+        self.service_name = service_name
+        self.max_hold = max_hold
+        self.lease_ttl = lease_ttl
+        self.lost = False
+        self._tokens: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._connection = backend.connect(service_name)
+    
+    def lock(self, name: str, shared: bool, deadline: float) -> bool:
+        key = _advisory_key(name)
+        suffix = '_shared' if shared else ''
+        
+        with self._connection.cursor() as cursor:
+            # Быстрый путь; при наличии ожидающих писателей читатель тоже встает в очередь
+            cursor.execute(f"SELECT pg_try_advisory_lock{suffix}(%s, %s)", (_ADVISORY_NAMESPACE, key))
+            acquired = cursor.fetchone()[0]
+            
+            if not acquired:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                
+                # Одно ожидание в очереди блокировок PostgreSQL до дедлайна: запрос
+                # не отменяется и сохраняет место в очереди. Аренды держателей
+                # проверяет отдельный поток на своем соединении
+                stop_watch = self.backend.watch_expired_holders(key, shared, self.service_name)
+                cursor.execute("SELECT set_config('lock_timeout', %s, false)",
+                             (f"{max(1, int(remaining * 1000))}ms",))
+                try:
+                    cursor.execute(f"SELECT pg_advisory_lock{suffix}(%s, %s)", (_ADVISORY_NAMESPACE, key))
+                except psycopg2.errors.LockNotAvailable:
+                    return False
+                finally:
+                    stop_watch.set()
+                    if not self._connection.closed:
+                        cursor.execute("SELECT set_config('lock_timeout', '0', false)")
+            
+            cursor.execute("SELECT nextval('git_lock_token_seq')")
+            token = cursor.fetchone()[0]
+            if not shared:
+                # Последующие проверки отзывают держателей с меньшим токеном
+                cursor.execute("""
+                    INSERT INTO git_lock_fences (lock_key, token) VALUES (%s, %s)
+                    ON CONFLICT (lock_key) DO UPDATE SET token = GREATEST(git_lock_fences.token, EXCLUDED.token)
+                """, (key, token))
+            
+            cursor.execute("""
+                INSERT INTO git_lock_leases
+                    (backend_pid, lock_key, lock_name, lock_mode, service_name, host, pid,
+                     token, max_hold, lease_ttl, acquired_at, heartbeat_at)
+                VALUES (pg_backend_pid(), %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+                ON CONFLICT (backend_pid, lock_key) DO UPDATE SET
+                    lock_name = EXCLUDED.lock_name, lock_mode = EXCLUDED.lock_mode,
+                    service_name = EXCLUDED.service_name, host = EXCLUDED.host, pid = EXCLUDED.pid,
+                    token = EXCLUDED.token, max_hold = EXCLUDED.max_hold, lease_ttl = EXCLUDED.lease_ttl,
+                    acquired_at = NOW(), heartbeat_at = NOW()
+            """, (key, name, 'shared' if shared else 'exclusive', self.service_name,
+                  socket.gethostname(), os.getpid(), token, self.max_hold, self.lease_ttl))
+        
+        self._tokens[key] = token
+        self._names[key] = name
+        return True
+    
+    @property
+    def tokens(self) -> Dict[str, int]:
+        return {self._names[key]: token for key, token in self._tokens.items()}
+    
+    def check(self) -> bool:
+        if self.lost:
+            return False
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT lock_key, token FROM git_lock_fences WHERE lock_key = ANY(%s)",
+                             (list(self._tokens),))
+                fences = dict(cursor.fetchall())
+        except Exception:
+            # Соединение потеряно - сервер уже освободил блокировки
+            self.lost = True
+            return False
+        
+        if any(fences.get(key, 0) > token for key, token in self._tokens.items()):
+            self.lost = True
+        return not self.lost
+    
+    def renew(self) -> bool:
+        """Продление аренды; заодно проверяет, что соединение с блокировками живо"""
+        if not self.check():
+            return False
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("UPDATE git_lock_leases SET heartbeat_at = NOW() "
+                             "WHERE backend_pid = pg_backend_pid()")
+        except Exception as e:
+            self.lost = True
+            self.backend.logger.error("Git lock lease lost",
+                                    component="lock_coordinator",
+                                    details={"service": self.service_name, "error": str(e)})
+        return not self.lost
+    
+    def close(self):
+        try:
+            if not self._connection.closed:
+                with self._connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM git_lock_leases WHERE backend_pid = pg_backend_pid()")
+                    cursor.execute("SELECT pg_advisory_unlock_all()")
+        finally:
+            # Закрытие соединения освобождает блокировки даже при ошибке выше
+            self._connection.close()
+
+
+class _PostgresLockBackend:
+    """
+    Распределенные блокировки на advisory locks PostgreSQL
+    
+    Координирует контейнеры и узлы, подключенные к общей базе cicd.
+    Очередь ожидающих и справедливость обеспечивает менеджер блокировок
+    PostgreSQL, сведения о держателях хранятся в таблице git_lock_leases,
+    fencing tokens - в git_lock_fences.
+    """
+    
+    name = "postgres"
+    
+    def __init__(self, lease_ttl: int, heartbeat_interval: float, connection_params: Dict[str, Any] = None):
+        self.connection_params = connection_params or {
+            'host': os.getenv('POSTGRES_HOST', 'postgres'),
+            'port': int(os.getenv('POSTGRES_PORT', '5432')),
+            'database': os.getenv('POSTGRES_DB', 'cicd'),
+            'user': os.getenv('POSTGRES_USER', 'cicd_service'),
+            'password': os.getenv('POSTGRES_PASSWORD', 'cicd_service_password')
+        }
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = get_logger("git-coordinator")
+        self._schema_ready = False
+    
+    def connect(self, service_name: str):
+        """Соединение для сессии блокировок с keepalive в обе стороны"""
+        connection = psycopg2.connect(
+            application_name=f"git-lock:{service_name}"[:63],
+            connect_timeout=10,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            **self.connection_params
+        )
+        connection.autocommit = True
+        
+        try:
+            with connection.cursor() as cursor:
+                # Сервер освобождает блокировки упавшего клиента, не дожидаясь системного keepalive
+                cursor.execute("SET tcp_keepalives_idle = 30")
+                cursor.execute("SET tcp_keepalives_interval = 10")
+                cursor.execute("SET tcp_keepalives_count = 3")
+                
+                if not self._schema_ready:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS git_lock_leases (
+                            backend_pid INTEGER NOT NULL,
+                            lock_key BIGINT NOT NULL,
+                            lock_name VARCHAR(255) NOT NULL,
+                            lock_mode VARCHAR(20) NOT NULL,
+                            service_name VARCHAR(50) NOT NULL,
+                            host VARCHAR(255),
+                            pid INTEGER,
+                            token BIGINT,
+                            max_hold INTEGER,
+                            lease_ttl INTEGER,
+                            acquired_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                            heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                            PRIMARY KEY (backend_pid, lock_key)
+                        )
+                    """)
+                    cursor.execute("ALTER TABLE git_lock_leases ADD COLUMN IF NOT EXISTS token BIGINT")
+                    cursor.execute("ALTER TABLE git_lock_leases ADD COLUMN IF NOT EXISTS max_hold INTEGER")
+                    cursor.execute("ALTER TABLE git_lock_leases ADD COLUMN IF NOT EXISTS lease_ttl INTEGER")
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS git_lock_fences (
+                            lock_key BIGINT PRIMARY KEY,
+                            token BIGINT NOT NULL
+                        )
+                    """)
+                    cursor.execute("CREATE SEQUENCE IF NOT EXISTS git_lock_token_seq")
+                    self._schema_ready = True
+        except Exception:
+            connection.close()
+            raise
+        
+        return connection
+    
+    def open_session(self, service_name: str, max_hold: int = None,
+                     lease_ttl: int = None) -> _PostgresLockSession:
+        return _PostgresLockSession(self, service_name, max_hold=max_hold, lease_ttl=lease_ttl)
+    
+    def _revoke(self, cursor, key: int, backend_pids: List[int]):
+        """Подъем fencing token и завершение сессий-держателей"""
+        cursor.execute("""
+            INSERT INTO git_lock_fences (lock_key, token) VALUES (%s, nextval('git_lock_token_seq'))
+            ON CONFLICT (lock_key) DO UPDATE SET token = EXCLUDED.token
+        """, (key,))
+        cursor.execute("SELECT pg_terminate_backend(pid) FROM unnest(%s::int[]) AS pid", (backend_pids,))
+    
+    def watch_expired_holders(self, key: int, shared: bool, breaker: str) -> threading.Event:
+        """
+        Проверка аренд держателей каждые heartbeat_interval секунд, пока ждет блокировка
+        
+        Returns:
+            threading.Event: Установка события прекращает проверки
+        """
+        stop = threading.Event()
+        
+        def watch():
+            connection = None
+            try:
+                while not stop.wait(self.heartbeat_interval):
+                    # Соединение открывается только при первой проверке
+                    connection = connection or self.connect(f"{breaker}:watch")
+                    with connection.cursor() as cursor:
+                        self.break_expired_holders(cursor, key, shared, breaker)
+            except Exception as e:
+                self.logger.warning("Git lock holders check failed",
+                                  component="lock_coordinator",
+                                  details={"lock_key": key, "service": breaker, "error": str(e)})
+            finally:
+                if connection:
+                    connection.close()
+        
+        threading.Thread(target=watch, name="git-lock-watch", daemon=True).start()
+        return stop
+    
+    def break_expired_holders(self, cursor, key: int, shared: bool, breaker: str) -> bool:
+        """
+        Перехват блокировки у держателей, чьи аренды истекли
+        
+        Перехват выполняется, только если истекли аренды всех мешающих
+        держателей; держатель без записи аренды считается живым.
+        """
+        cursor.execute("""
+            SELECT l.pid, l.mode, g.service_name, g.host, g.pid,
+                   EXTRACT(EPOCH FROM g.acquired_at), EXTRACT(EPOCH FROM g.heartbeat_at),
+                   g.max_hold, g.lease_ttl
+            FROM pg_locks l
+            LEFT JOIN git_lock_leases g
+                ON g.backend_pid = l.pid AND g.lock_key = l.objid::bigint
+            WHERE l.locktype = 'advisory' AND l.classid = %s AND l.objsubid = 2
+              AND l.objid::bigint = %s AND l.granted AND l.pid <> pg_backend_pid()
+        """, (_ADVISORY_NAMESPACE, key))
+        
+        holders = []
+        now = time.time()
+        for (backend_pid, mode, service, host, pid,
+             acquired_at, heartbeat_at, max_hold, lease_ttl) in cursor.fetchall():
+            if shared and mode == 'ShareLock':
+                continue
+            if acquired_at is None:
+                return False
+            lease = {"acquired_at": float(acquired_at), "heartbeat_at": float(heartbeat_at),
+                     "max_hold": max_hold, "lease_ttl": lease_ttl}
+            if not _lease_expired(lease, self.lease_ttl, now):
+                return False
+            holders.append({"backend_pid": backend_pid, "service": service, "host": host, "pid": pid,
+                            "held_seconds": round(now - lease["acquired_at"], 1)})
+        
+        if not holders:
+            return False
+        
+        self._revoke(cursor, key, [holder["backend_pid"] for holder in holders])
+        self.logger.warning("Git lock taken over from stale holders",
+                          component="lock_coordinator",
+                          details={"lock_key": key, "breaker": breaker, "holders": holders})
+        return True
+    
+    def _query_locks(self) -> List[tuple]:
+        connection = self.connect("status")
+        try:
+            with connection.cursor() as cursor:
+                # Записи аренд без живой сессии (после падения держателя) не учитываются:
+                # соединение с pg_locks идет по pid серверного процесса
+                cursor.execute("""
+                    SELECT l.objid::bigint, l.mode, l.granted, l.pid,
+                           g.lock_name, g.service_name, g.host, g.pid,
+                           EXTRACT(EPOCH FROM g.acquired_at)::bigint,
+                           EXTRACT(EPOCH FROM NOW() - g.acquired_at),
+                           EXTRACT(EPOCH FROM NOW() - g.heartbeat_at),
+                           g.token, g.max_hold, g.lease_ttl
+                    FROM pg_locks l
+                    LEFT JOIN git_lock_leases g
+                        ON g.backend_pid = l.pid AND g.lock_key = l.objid::bigint
+                    WHERE l.locktype = 'advisory' AND l.classid = %s AND l.objsubid = 2
+                """, (_ADVISORY_NAMESPACE,))
+                return cursor.fetchall()
+        finally:
+            connection.close()
+    
+    def status(self) -> dict:
+        locks: Dict[int, dict] = {}
+        for (key, mode, granted, backend_pid, lock_name, service, host, pid,
+             acquired_at, age, heartbeat_age, token, max_hold, lease_ttl) in self._query_locks():
+            entry = locks.setdefault(key, {
+                "locked": False, "mode": None, "owner": None, "timestamp": None,
+                "queue_depth": 0, "holders": [], "name": None
+            })
+            if not granted:
+                entry["queue_depth"] += 1
+                continue
+            
+            entry["locked"] = True
+            entry["mode"] = "shared" if mode == "ShareLock" else "exclusive"
+            entry["name"] = entry["name"] or lock_name
+            holder = {
+                "service": service,
+                "host": host,
+                "pid": pid,
+                "backend_pid": backend_pid,
+                "token": token,
+                "max_hold": max_hold,
+                "lease_ttl": lease_ttl,
+                "age_seconds": round(float(age), 1) if age is not None else None,
+                "heartbeat_age_seconds": round(float(heartbeat_age), 1) if heartbeat_age is not None else None
+            }
+            holder["expired"] = age is not None and _lease_expired(
+                {"acquired_at": -float(age), "heartbeat_at": -float(heartbeat_age),
+                 "max_hold": max_hold, "lease_ttl": lease_ttl},
+                self.lease_ttl, now=0.0
+            )
+            entry["holders"].append(holder)
+            if entry["mode"] == "exclusive":
+                entry["owner"] = service or "unknown"
+                entry["timestamp"] = acquired_at
+                entry["age_seconds"] = holder["age_seconds"]
+        
+        empty = {"locked": False, "mode": None, "owner": None, "timestamp": None, "queue_depth": 0}
+        status = locks.pop(_advisory_key(REPOSITORY_LOCK), empty)
+        status.pop("name", None)
+        status["refs"] = {}
+        for entry in locks.values():
+            name = entry.pop("name")
+            if name:
+                status["refs"][name[len(_REF_PREFIX):]] = entry
+            else:
+                status["refs"].setdefault("unknown", entry)
+        return status
+    
+    def force_unlock(self, breaker: str) -> bool:
+        """Отзыв блокировки репозитория: подъем fencing token и завершение сессий-держателей"""
+        key = _advisory_key(REPOSITORY_LOCK)
+        connection = self.connect("force-unlock")
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT l.pid FROM pg_locks l
+                    WHERE l.locktype = 'advisory' AND l.classid = %s AND l.objsubid = 2
+                      AND l.objid::bigint = %s AND l.granted
+                """, (_ADVISORY_NAMESPACE, key))
+                backend_pids = [row[0] for row in cursor.fetchall()]
+                if not backend_pids:
+                    return False
+                self._revoke(cursor, key, backend_pids)
+                return True
+        finally:
+            connection.close()
+
+
+class GitLockLease:
+    """
+    Полученная блокировка, передается в Git операции
+    
+    Операция продлевает аренду вызовом renew() по мере продвижения (строки
+    вывода процесса, завершение шагов). Перед изменением репозитория (push,
+    update-ref) операция вызывает check(): если блокировку перехватили после
+    истечения аренды, fencing token уже поднят и операция прерывается,
+    не затирая работу нового держателя.
+    """
+    
+    def __init__(self, session, service_name: str, renew_interval: float = 0):
+        self._session = session
+        self.service_name = service_name
+        self.renew_interval = renew_interval
+        self._renewed_at = time.monotonic()
+    
+    @property
+    def tokens(self) -> Dict[str, int]:
+        """fencing tokens полученных блокировок"""
+        return self._session.tokens
+    
+    @property
+    def token(self) -> int:
+        """Наибольший fencing token захвата - для логов и передачи в операции"""
+        return max(self.tokens.values(), default=0)
+    
+    def is_valid(self) -> bool:
+        return self._session.check()
+    
+    def renew(self) -> bool:
+        """
+        Продление аренды - операция сообщает, что продвигается
+        
+        Вызовы чаще renew_interval не обращаются к бэкенду, поэтому renew()
+        можно вызывать на каждую строку вывода процесса.
+        
+        Returns:
+            bool: Блокировка все еще удерживается
+        """
+        now = time.monotonic()
+        if now - self._renewed_at < self.renew_interval:
+            return not self._session.lost
+        self._renewed_at = now
+        return self._session.renew()
+    
+    def check(self):
+        """
+        Raises:
+            GitLockLostError: Блокировка отозвана или соединение с ней потеряно
+        """
+        if not self._session.check():
+            raise GitLockLostError(f"Git lock of {self.service_name} was revoked (token {self.token})")
 
 
 class GitLockCoordinator:
-    """Координатор блокировок Git операций"""
+    """
+    Координатор блокировок Git операций
+    
+    Две ступени блокировок:
+    - блокировка репозитория: исключительная для операций над рабочим
+      деревом и всем репозиторием, разделяемая - для чтения и для операций,
+      ограниченных отдельными ветками;
+    - блокировки веток: всегда исключительные.
+    
+    Порядок захвата фиксирован - сначала репозиторий, затем ветки
+    по возрастанию имени; освобождение в обратном порядке. Поэтому
+    синхронизация master и коммиты в разные ветки external-file-*
+    выполняются параллельно без взаимных блокировок.
+    
+    Держатель получает аренду и продлевает ее по мере продвижения операции
+    (GitLockLease.renew). Аренда истекает, если операция не продвигалась
+    дольше lease_ttl или блокировка удерживается дольше max_hold; тогда
+    ожидающий перехватывает блокировку, не дожидаясь таймаута. Поэтому
+    GIT_LOCK_MAX_HOLD должен быть меньше таймаутов ожидания (300 с):
+    ожидающие дожидаются перехвата у зависшего держателя.
     
-    def __init__(self, lock_file_path: str = "/tmp/git.lock"):
+    Бэкенд выбирается GIT_LOCK_BACKEND: file - flock внутри контейнера,
+    postgres - advisory locks для сервисов в разных контейнерах.
+    """
+    
+    def __init__(self, lock_file_path: str = "/tmp/git.lock", backend: str = None,
+                 lease_ttl: int = None, heartbeat_interval: float = None, max_hold: int = None):
         self.lock_file_path = lock_file_path
         self.logger = get_logger("git-coordinator")
+        
+        lease_ttl = lease_ttl or int(os.getenv('GIT_LOCK_LEASE_TTL', '60'))
+        heartbeat_interval = heartbeat_interval or float(os.getenv('GIT_LOCK_HEARTBEAT_INTERVAL', '15'))
+        self.heartbeat_interval = heartbeat_interval
+        self.max_hold = max_hold or int(os.getenv('GIT_LOCK_MAX_HOLD', '240'))
+        
+        backend = backend or os.getenv('GIT_LOCK_BACKEND', 'file')
+        if backend == 'postgres':
+            self.backend = _PostgresLockBackend(lease_ttl, heartbeat_interval)
+        elif backend == 'file':
+            self.backend = _FileLockBackend(lock_file_path, lease_ttl, heartbeat_interval)
+        else:
+            raise ValueError(f"Unknown git lock backend: {backend}")
     
     @contextmanager
-    def acquire_lock(self, service_name: str, timeout: int = 300) -> Generator[None, None, None]:
+    def acquire_lock(self, service_name: str, timeout: int = 300, refs: Optional[List[str]] = None,
+                     shared: bool = False, max_hold: int = None,
+                     lease_ttl: int = None) -> Generator[GitLockLease, None, None]:
         """
         Получение блокировки Git репозитория
         
         Args:
             service_name: Имя сервиса, запрашивающего блокировку
             timeout: Таймаут ожидания блокировки в секундах
+            refs: Ветки, изменяемые операцией; если заданы - репозиторий
+                блокируется разделяемо, а ветки - исключительно
+            shared: Разделяемая блокировка репозитория для операций только чтения
+            max_hold: Наибольшая ожидаемая длительность операции в секундах,
+                после которой блокировку могут перехватить; не больше GIT_LOCK_MAX_HOLD
+            lease_ttl: Наибольший перерыв между продлениями аренды для операций,
+                которые не могут сообщать о продвижении (по умолчанию GIT_LOCK_LEASE_TTL)
         
         Yields:
-            None: Блокировка получена
+            GitLockLease: Аренда полученной блокировки с fencing token
         
         Raises:
             TimeoutError: Не удалось получить блокировку в течение таймаута
         """
-        lock_file = None
-        start_time = time.time()
+        start_time = time.monotonic()
+        deadline = start_time + timeout
+        ref_names = sorted(set(refs or []))
+        repo_shared = shared or bool(ref_names)
+        
+        # Порядок захвата: репозиторий, затем ветки по возрастанию имени
+        locks = [(REPOSITORY_LOCK, repo_shared)]
+        locks += [(f"{_REF_PREFIX}{ref}", False) for ref in ref_names]
         
+        self.logger.info(f"Attempting to acquire Git lock",
+                       component="lock_coordinator",
+                       details={
+                           "service": service_name,
+                           "timeout": timeout,
+                           "backend": self.backend.name,
+                           "mode": "shared" if repo_shared else "exclusive",
+                           "refs": ref_names
+                       })
+        
+        session = None
+        blocked_on = None
         try:
-            # Создание файла блокировки если не существует
-            os.makedirs(os.path.dirname(self.lock_file_path), exist_ok=True)
-            lock_file = open(self.lock_file_path, 'w')
-            
-            self.logger.info(f"Attempting to acquire Git lock", 
-                           component="lock_coordinator",
-                           details={"service": service_name, "timeout": timeout})
-            
-            # Попытка получения блокировки с таймаутом
-            while time.time() - start_time < timeout:
-                try:
-                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-                    
-                    # Запись информации о владельце блокировки
-                    lock_file.write(f"{service_name}:{int(time.time())}")
-                    lock_file.flush()
-                    
-                    self.logger.info(f"Git lock acquired successfully", 
-                                   component="lock_coordinator",
-                                   details={
-                                       "service": service_name, 
-                                       "wait_time": time.time() - start_time
-                                   })
-                    
-                    yield
-                    return
-                    
-                except IOError:
-                    # Блокировка занята, ждем
-                    time.sleep(1)
-            
-            # Таймаут истек
-            elapsed_time = time.time() - start_time
-            self.logger.error(f"Failed to acquire Git lock within timeout", 
+            session = self.backend.open_session(service_name, max_hold=min(max_hold or self.max_hold, self.max_hold),
+                                                lease_ttl=lease_ttl)
+            for name, lock_shared in locks:
+                if not session.lock(name, lock_shared, deadline):
+                    blocked_on = name
+                    break
+        
+        except Exception as e:
+            if session:
+                session.close()
+            self.logger.error(f"Error acquiring Git lock",
+                            component="lock_coordinator",
+                            details={"service": service_name, "error": str(e)},
+                            exc_info=True)
+            raise
+        
+        wait_time = time.monotonic() - start_time
+        GIT_LOCK_WAIT_SECONDS.labels(service=service_name).observe(wait_time)
+        
+        if blocked_on:
+            session.close()
+            self.logger.error(f"Failed to acquire Git lock within timeout",
                             component="lock_coordinator",
                             details={
-                                "service": service_name, 
+                                "service": service_name,
                                 "timeout": timeout,
-                                "elapsed_time": elapsed_time
+                                "elapsed_time": wait_time,
+                                "blocked_on": blocked_on
                             })
-            
             raise TimeoutError(f"Could not acquire Git lock for {service_name} within {timeout} seconds")
+        
+        acquired_at = time.monotonic()
+        lease = GitLockLease(session, service_name, renew_interval=self.heartbeat_interval)
+        self.logger.info(f"Git lock acquired successfully",
+                       component="lock_coordinator",
+                       details={
+                           "service": service_name,
+                           "wait_time": wait_time,
+                           "refs": ref_names,
+                           "tokens": lease.tokens
+                       })
+        
+        try:
+            yield lease
+        
+        finally:
+            hold_time = time.monotonic() - acquired_at
+            GIT_LOCK_HOLD_SECONDS.labels(service=service_name).observe(hold_time)
             
-        except Exception as e:
-            self.logger.error(f"Error acquiring Git lock", 
-                            component="lock_coordinator",
-                            details={"service": service_name, "error": str(e)},
-                            exc_info=True)
-            raise
+            if session.lost:
+                self.logger.error(f"Git lock lease was lost before release",
+                                component="lock_coordinator",
+                                details={"service": service_name, "hold_time": hold_time})
             
-        finally:
-            if lock_file:
-                try:
-                    # Освобождение блокировки
-                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                    lock_file.close()
-                    
-                    self.logger.info(f"Git lock released", 
-                                   component="lock_coordinator",
-                                   details={"service": service_name})
-                    
-                except Exception as e:
-                    self.logger.error(f"Error releasing Git lock", 
-                                    component="lock_coordinator",
-                                    details={"service": service_name, "error": str(e)})
+            try:
+                session.close()
+                
+                self.logger.info(f"Git lock released",
+                               component="lock_coordinator",
+                               details={"service": service_name, "hold_time": hold_time})
+            
+            except Exception as e:
+                self.logger.error(f"Error releasing Git lock",
+                                component="lock_coordinator",
+                                details={"service": service_name, "error": str(e)})
     
     def get_lock_status(self) -> dict:
         """
         Получение статуса блокировки
         
         Returns:
-            dict: Информация о текущей блокировке
+            dict: Информация о текущей блокировке репозитория и занятых ветках
         """
         try:
-            if not os.path.exists(self.lock_file_path):
-                return {"locked": False, "owner": None, "timestamp": None}
-            
-            # Попытка получения неблокирующей блокировки для проверки статуса
-            with open(self.lock_file_path, 'r') as f:
-                try:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-                    # Блокировка свободна
-                    return {"locked": False, "owner": None, "timestamp": None}
-                except IOError:
-                    # Блокировка занята, читаем информацию о владельце
-                    content = f.read().strip()
-                    if ':' in content:
-                        owner, timestamp = content.split(':', 1)
-                        return {
-                            "locked": True, 
-                            "owner": owner, 
-                            "timestamp": int(timestamp)
-                        }
-                    else:
-                        return {"locked": True, "owner": "unknown", "timestamp": None}
+            status = self.backend.status()
+            status["backend"] = self.backend.name
+            return status
         
         except Exception as e:
-            self.logger.error(f"Error checking lock status", 
+            self.logger.error(f"Error checking lock status",
                             component="lock_coordinator",
                             details={"error": str(e)})
             return {"locked": "unknown", "owner": None, "timestamp": None, "error": str(e)}
@@ -141,6 +1258,10 @@ class GitLockCoordinator:
         """
         Принудительное освобождение блокировки (использовать с осторожностью)
         
+        Блокировка отзывается у держателей через fencing token: их последующие
+        проверки check() завершаются GitLockLostError, а ожидающие получают
+        блокировку сразу.
+        
         Args:
             service_name: Имя сервиса, выполняющего принудительное освобождение
         
@@ -148,21 +1269,19 @@ class GitLockCoordinator:
             bool: True если блокировка была освобождена
         """
         try:
-            if os.path.exists(self.lock_file_path):
-                os.remove(self.lock_file_path)
-                
-                self.logger.warning(f"Git lock forcefully removed", 
+            if self.backend.force_unlock(service_name):
+                self.logger.warning(f"Git lock forcefully revoked",
                                   component="lock_coordinator",
-                                  details={"service": service_name})
+                                  details={"service": service_name, "backend": self.backend.name})
                 return True
             else:
-                self.logger.info(f"No lock file to remove", 
+                self.logger.info(f"No Git lock to release",
                                component="lock_coordinator",
                                details={"service": service_name})
                 return False
-                
+        
         except Exception as e:
-            self.logger.error(f"Error force unlocking", 
+            self.logger.error(f"Error force unlocking",
                             component="lock_coordinator",
                             details={"service": service_name, "error": str(e)})
             return False
@@ -177,4 +1296,4 @@ def get_git_coordinator() -> GitLockCoordinator:
     global _git_coordinator
     if _git_coordinator is None:
         _git_coordinator = GitLockCoordinator()
-    return _git_coordinator
\ No newline at end of file
+    return _git_coordinator
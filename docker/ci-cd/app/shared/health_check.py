@@ -5,19 +5,29 @@ import os
 import time
 import requests
 import subprocess
+import threading
 import psutil
 from datetime import datetime
 from flask import Flask, jsonify
-from typing import Dict, Any
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from typing import Any, Callable, Dict, Tuple
 import sys
 sys.path.append('/app')
 
 from shared.logger import get_logger
 from shared.git_lock import get_git_coordinator
+from shared.metrics import render_metrics
+from shared.probes import Probe, ProbeRunner
+from shared.wsgi import install_request_timing, on_worker_start, run
 
 
 app = Flask(__name__)
 logger = get_logger("health-check")
+install_request_timing(app, "health-check")
+
+# Программы supervisord, состояние которых входит в общий статус
+SUPERVISED_PROGRAMS = {"gitsync": "GitSync", "precommit1c": "PreCommit1C"}
 
 
 class HealthChecker:
@@ -26,70 +36,49 @@ class HealthChecker:
     def __init__(self):
         self.start_time = time.time()
         self.git_coordinator = get_git_coordinator()
+        # Первый вызов без интервала возвращает 0.0 и только начинает период измерения
+        psutil.cpu_percent(interval=None)
     
-    def check_gitsync_health(self) -> Dict[str, Any]:
-        """Проверка состояния GitSync сервиса"""
+    def check_supervisor_programs(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Проверка состояния сервисов через supervisord
+        
+        Один вызов supervisorctl status на все отслеживаемые программы.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Результат проверки по имени программы
+        """
         try:
-            # Проверка процесса через supervisord
             result = subprocess.run(
-                ['supervisorctl', 'status', 'gitsync'],
+                ['supervisorctl', 'status'] + list(SUPERVISED_PROGRAMS),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 universal_newlines=True,
                 timeout=10
             )
-            
-            if result.returncode == 0 and 'RUNNING' in result.stdout:
-                return {
-                    "status": "healthy",
-                    "message": "GitSync service is running",
-                    "details": {"supervisor_status": result.stdout.strip()}
-                }
-            else:
-                return {
-                    "status": "unhealthy",
-                    "message": "GitSync service is not running",
-                    "details": {"supervisor_status": result.stdout.strip()}
-                }
+            # Код возврата ненулевой, если хотя бы одна программа не запущена - разбирается вывод
+            lines = {line.split()[0]: line.strip() for line in result.stdout.splitlines() if line.strip()}
         
         except Exception as e:
             return {
-                "status": "unhealthy",
-                "message": f"Error checking GitSync: {str(e)}",
-                "details": {"error": str(e)}
-            }
-    
-    def check_precommit1c_health(self) -> Dict[str, Any]:
-        """Проверка состояния PreCommit1C сервиса"""
-        try:
-            # Проверка процесса через supervisord
-            result = subprocess.run(
-                ['supervisorctl', 'status', 'precommit1c'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0 and 'RUNNING' in result.stdout:
-                return {
-                    "status": "healthy",
-                    "message": "PreCommit1C service is running",
-                    "details": {"supervisor_status": result.stdout.strip()}
-                }
-            else:
-                return {
+                name: {
                     "status": "unhealthy",
-                    "message": "PreCommit1C service is not running",
-                    "details": {"supervisor_status": result.stdout.strip()}
+                    "message": f"Error checking {title}: {str(e)}",
+                    "details": {"error": str(e)}
                 }
+                for name, title in SUPERVISED_PROGRAMS.items()
+            }
         
-        except Exception as e:
-            return {
-                "status": "unhealthy",
-                "message": f"Error checking PreCommit1C: {str(e)}",
-                "details": {"error": str(e)}
+        programs = {}
+        for name, title in SUPERVISED_PROGRAMS.items():
+            line = lines.get(name, "")
+            running = len(line.split()) > 1 and line.split()[1] == 'RUNNING'
+            programs[name] = {
+                "status": "healthy" if running else "unhealthy",
+                "message": f"{title} service is {'running' if running else 'not running'}",
+                "details": {"supervisor_status": line}
             }
+        return programs
     
     def check_gitlab_connectivity(self) -> Dict[str, Any]:
         """Проверка доступности GitLab"""
@@ -204,8 +193,8 @@ class HealthChecker:
     def get_system_metrics(self) -> Dict[str, Any]:
         """Получение системных метрик"""
         try:
-            # CPU и память
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # Загрузка CPU с предыдущего вызова: без ожидания, период задает интервал обновления снимка
+            cpu_percent = psutil.cpu_percent(interval=None)
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/workspace')
             
@@ -231,14 +220,73 @@ class HealthChecker:
         return self.git_coordinator.get_lock_status()
 
 
-# Глобальный экземпляр health checker
-health_checker = HealthChecker()
-
-
-@app.route('/health')
-def health_check():
-    """Основной endpoint для проверки здоровья"""
-    try:
+class HealthSnapshot:
+    """
+    Снимок состояния системы, обновляемый в фоне
+    
+    Каждая проверка выполняется в своем потоке со своим интервалом через
+    ProbeRunner с таймаутом HEALTH_PROBE_TIMEOUT, /health и /metrics отдают
+    последний результат без ожидания. Результат проверки содержит время
+    выполнения (checked_at), возраст (age_seconds) и признак устаревания
+    (stale): проверка не обновлялась дольше трех интервалов.
+    """
+    
+    STALE_INTERVALS = 3
+    
+    def __init__(self, checker: HealthChecker):
+        self.checker = checker
+        services_interval = float(os.getenv('HEALTH_SERVICES_INTERVAL', '10'))
+        external_interval = float(os.getenv('HEALTH_EXTERNAL_INTERVAL', '30'))
+        system_interval = float(os.getenv('HEALTH_SYSTEM_INTERVAL', '5'))
+        # Имя проверки -> (функция, интервал обновления в секундах)
+        self.probes: Dict[str, Tuple[Callable[[], Dict[str, Any]], float]] = {
+            "supervisor": (checker.check_supervisor_programs, services_interval),
+            "gitlab": (checker.check_gitlab_connectivity, external_interval),
+            "redmine": (checker.check_redmine_connectivity, external_interval),
+            "1c_storage": (checker.check_1c_storage_access, services_interval),
+            "system": (checker.get_system_metrics, system_interval),
+            "git_lock": (checker.get_git_lock_status, services_interval)
+        }
+        probe_timeout = float(os.getenv('HEALTH_PROBE_TIMEOUT', '15'))
+        self.runner = ProbeRunner(Probe(name, check, timeout=probe_timeout)
+                                  for name, (check, _) in self.probes.items())
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = False
+    
+    def start(self):
+        """Запуск потоков обновления; повторный вызов ничего не делает"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for name, (_, interval) in self.probes.items():
+            threading.Thread(target=self._run, args=(name, interval),
+                             name=f"health-{name}", daemon=True).start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self, name: str, interval: float):
+        while not self._stop.is_set():
+            self.refresh(name)
+            self._stop.wait(interval)
+    
+    def refresh(self, name: str):
+        """Выполнение проверки и сохранение результата в снимке"""
+        checked_at = time.time()
+        result = self.runner.run([name])[name]
+        
+        with self._lock:
+            self._results[name] = {
+                "result": result,
+                "checked_at": checked_at,
+                "duration": round(time.time() - checked_at, 3)
+            }
+    
+    def status(self) -> Dict[str, Any]:
+        """Состояние системы в формате /health"""
         status = {
             "status": "healthy",
             "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -248,28 +296,100 @@ def health_check():
             "git_lock": {}
         }
         
-        # Проверка сервисов
-        status["services"]["gitsync"] = health_checker.check_gitsync_health()
-        status["services"]["precommit1c"] = health_checker.check_precommit1c_health()
-        
-        # Проверка внешних сервисов
-        status["external"]["gitlab"] = health_checker.check_gitlab_connectivity()
-        status["external"]["redmine"] = health_checker.check_redmine_connectivity()
-        status["external"]["1c_storage"] = health_checker.check_1c_storage_access()
+        # Состояние сервисов
+        programs, stamp = self.result("supervisor")
+        for program in SUPERVISED_PROGRAMS:
+            # Сбой или таймаут проверки относится ко всем программам
+            result = programs if "status" in programs else programs.get(program, {"status": "unknown"})
+            status["services"][program] = dict(result, **stamp)
         
-        # Системные метрики
-        status["system"] = health_checker.get_system_metrics()
+        # Внешние сервисы
+        for name in ("gitlab", "redmine", "1c_storage"):
+            result, stamp = self.result(name)
+            status["external"][name] = dict(result, **stamp)
         
-        # Статус Git блокировки
-        status["git_lock"] = health_checker.get_git_lock_status()
+        # Системные метрики и статус Git блокировки
+        for name in ("system", "git_lock"):
+            result, stamp = self.result(name)
+            status[name] = dict(result, **stamp)
         
-        # Определение общего статуса
-        service_statuses = [s.get("status") for s in status["services"].values()]
-        if "unhealthy" in service_statuses:
+        # Определение общего статуса: устаревший результат не подтверждает работу сервиса
+        services = status["services"].values()
+        if any(s.get("status") == "unhealthy" for s in services):
             status["status"] = "unhealthy"
-        elif "unknown" in service_statuses:
+        elif any(s.get("status") == "unknown" or s.get("stale") for s in services):
             status["status"] = "degraded"
         
+        return status
+    
+    def result(self, name: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Результат проверки и отметки времени его выполнения"""
+        _, interval = self.probes[name]
+        with self._lock:
+            entry = self._results.get(name)
+        if entry is None:
+            return {"status": "unknown", "message": "Not checked yet"}, {"checked_at": None, "stale": True}
+        
+        age = time.time() - entry["checked_at"]
+        return entry["result"], {
+            "checked_at": datetime.utcfromtimestamp(entry["checked_at"]).isoformat() + "Z",
+            "age_seconds": round(age, 3),
+            "stale": age > interval * self.STALE_INTERVALS,
+            "duration_seconds": entry["duration"]
+        }
+
+
+class SnapshotCollector:
+    """Системные метрики и состояние проверок из снимка для реестра /metrics"""
+    
+    # Системная метрика -> (поле результата get_system_metrics, описание)
+    SYSTEM_GAUGES = {
+        "ci_cd_uptime_seconds": ("uptime_seconds", "Container uptime in seconds"),
+        "ci_cd_cpu_usage_percent": ("cpu_usage_percent", "CPU usage percentage"),
+        "ci_cd_memory_usage_percent": ("memory_usage_percent", "Memory usage percentage"),
+        "ci_cd_disk_usage_percent": ("disk_usage_percent", "Disk usage percentage")
+    }
+    
+    def __init__(self, snapshot: HealthSnapshot):
+        self.snapshot = snapshot
+    
+    def collect(self):
+        system, _ = self.snapshot.result("system")
+        for name, (field, documentation) in self.SYSTEM_GAUGES.items():
+            if isinstance(system.get(field), (int, float)):
+                yield GaugeMetricFamily(name, documentation, value=system[field])
+        
+        age = GaugeMetricFamily('ci_cd_health_probe_age_seconds',
+                                'Age of the last health probe result', labels=['probe'])
+        for name in self.snapshot.probes:
+            _, stamp = self.snapshot.result(name)
+            if stamp.get("age_seconds") is not None:
+                age.add_metric([name], stamp["age_seconds"])
+        yield age
+        
+        healthy = GaugeMetricFamily('ci_cd_health_check_healthy',
+                                    'Whether the service passed its last health check', labels=['check'])
+        status = self.snapshot.status()
+        for section in ("services", "external"):
+            for name, result in status[section].items():
+                healthy.add_metric([name], 1.0 if result.get("status") == "healthy" else 0.0)
+        yield healthy
+
+
+# Глобальный экземпляр health checker и снимка его проверок
+health_checker = HealthChecker()
+health_snapshot = HealthSnapshot(health_checker)
+on_worker_start(app, health_snapshot.start)
+
+
+@app.route('/health')
+def health_check():
+    """Основной endpoint для проверки здоровья: последний снимок без выполнения проверок"""
+    try:
+        # Обновление запускается в процессе, обслуживающем запросы (в том числе под WSGI сервером)
+        health_snapshot.start()
+        status = health_snapshot.status()
+        
         # Логирование health check
         logger.debug("Health check completed", 
                     component="health_endpoint",
@@ -293,27 +413,9 @@ def health_check():
 def metrics():
     """Endpoint для Prometheus метрик"""
     try:
-        system_metrics = health_checker.get_system_metrics()
-        
-        # Простой формат метрик для Prometheus
-        metrics_text = f"""# HELP ci_cd_uptime_seconds Container uptime in seconds
-# TYPE ci_cd_uptime_seconds counter
-ci_cd_uptime_seconds {system_metrics.get('uptime_seconds', 0)}
-
-# HELP ci_cd_cpu_usage_percent CPU usage percentage
-# TYPE ci_cd_cpu_usage_percent gauge
-ci_cd_cpu_usage_percent {system_metrics.get('cpu_usage_percent', 0)}
-
-# HELP ci_cd_memory_usage_percent Memory usage percentage
-# TYPE ci_cd_memory_usage_percent gauge
-ci_cd_memory_usage_percent {system_metrics.get('memory_usage_percent', 0)}
-
-# HELP ci_cd_disk_usage_percent Disk usage percentage
-# TYPE ci_cd_disk_usage_percent gauge
-ci_cd_disk_usage_percent {system_metrics.get('disk_usage_percent', 0)}
-"""
-        
-        return metrics_text, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+        health_snapshot.start()
+        metrics_text = render_metrics([SnapshotCollector(health_snapshot)])
+        return metrics_text, 200, {'Content-Type': CONTENT_TYPE_LATEST}
     
     except Exception as e:
         logger.error("Error generating metrics", 
@@ -325,10 +427,5 @@ ci_cd_disk_usage_percent {system_metrics.get('disk_usage_percent', 0)}
 if __name__ == '__main__':
     logger.info("Starting Health Check service", component="main")
     
-    # Запуск Flask приложения
-    app.run(
-        host='0.0.0.0',
-        port=8085,
-        debug=False,
-        threaded=True
-    )
\ No newline at end of file
+    # В контейнере сервер запускает gunicorn (gunicorn.conf.py), здесь - встроенный сервер Flask
+    run(app, port=8085)
\ No newline at end of file
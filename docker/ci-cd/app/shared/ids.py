@@ -0,0 +1,52 @@
+"""
+IDs - идентификаторы, упорядоченные по времени создания (ULID)
+
+26 символов Crockford base32: 48 бит - миллисекунды Unix time, 80 бит -
+случайная часть. Строки сортируются в порядке создания, поэтому новые
+значения уникального индекса попадают в его конец, а не в случайные
+страницы. В пределах одной миллисекунды процесс увеличивает случайную часть
+предыдущего значения на 1: идентификаторы процесса строго возрастают, а
+совпадение с другим процессом требует одинаковых 80 случайных бит.
+"""
+import os
+import threading
+import time
+
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# Crockford base32 -> алфавит int(..., 32)
+_DECODE = str.maketrans(_ALPHABET, "0123456789abcdefghijklmnopqrstuv")
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(_ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def ulid() -> str:
+    """Новый идентификатор, больший всех ранее выданных процессом"""
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms > _last_ms:
+            _last_ms, _last_random = now_ms, int.from_bytes(os.urandom(10), 'big')
+        elif _last_random < _RANDOM_MAX:
+            # Та же миллисекунда или часы переведены назад: время не уменьшается
+            _last_random += 1
+        else:
+            _last_ms, _last_random = _last_ms + 1, int.from_bytes(os.urandom(10), 'big')
+        return _encode(_last_ms, 10) + _encode(_last_random, 16)
+
+
+def ulid_time(value: str) -> float:
+    """Время создания идентификатора, секунды Unix time"""
+    return int(value[:10].translate(_DECODE), 32) / 1000
@@ -0,0 +1,242 @@
+"""
+Log Index - индекс записей логов для поиска по correlation_id и операции
+
+Индекс пополняет процесс записи логов (shared/log_writer.py) пакетами
+в фоновом потоке; API читает его для трассировки операций. Хранилище -
+SQLite в режиме WAL: один писатель и параллельные читатели из других
+процессов. Текст сообщений индексируется FTS5, если он доступен в сборке
+SQLite.
+"""
+import calendar
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS log_records (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        logger TEXT NOT NULL,
+        service TEXT,
+        component TEXT,
+        operation TEXT,
+        level TEXT,
+        correlation_id TEXT,
+        message TEXT,
+        record TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_log_records_correlation ON log_records(correlation_id, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_log_records_service ON log_records(service, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_log_records_component ON log_records(component, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_log_records_operation ON log_records(operation, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_log_records_ts ON log_records(ts)"
+]
+
+_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS log_records_fts
+    USING fts5(message, content='log_records', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS log_records_fts_insert AFTER INSERT ON log_records BEGIN
+        INSERT INTO log_records_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS log_records_fts_delete AFTER DELETE ON log_records BEGIN
+        INSERT INTO log_records_fts(log_records_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END
+    """
+]
+
+# Операции недавних correlation_id: записи внутри операции получают ее имя
+_OPERATION_CACHE_SIZE = 10000
+
+
+def parse_timestamp(text: str) -> float:
+    """Время записи StructuredFormatter (2024-01-01T12:00:00.123456Z) в секунды эпохи"""
+    seconds = calendar.timegm(time.strptime(text[:19], '%Y-%m-%dT%H:%M:%S'))
+    fraction = text[19:].rstrip('Z')
+    return seconds + (float(fraction) if fraction else 0.0)
+
+
+class LogIndex:
+    """Индекс записей логов в SQLite"""
+    
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv('LOG_INDEX_PATH', '/logs/log-index.db')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._operations: 'OrderedDict[str, str]' = OrderedDict()
+        self.fts = False
+    
+    def _writer(self) -> sqlite3.Connection:
+        """Соединение писателя; схема создается при первом обращении"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            try:
+                for statement in _FTS_SCHEMA:
+                    connection.execute(statement)
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite без FTS5: поиск по тексту выполняется через LIKE
+                self.fts = False
+            connection.commit()
+            self._connection = connection
+        return self._connection
+    
+    def _reader(self) -> sqlite3.Connection:
+        """Соединение только для чтения: API не блокирует запись индекса"""
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        return connection
+    
+    def _operation(self, entry: Dict[str, Any]) -> Optional[str]:
+        correlation_id = entry.get("correlation_id")
+        operation = entry.get("operation")
+        if operation and correlation_id:
+            self._operations[correlation_id] = operation
+            self._operations.move_to_end(correlation_id)
+            while len(self._operations) > _OPERATION_CACHE_SIZE:
+                self._operations.popitem(last=False)
+        elif correlation_id:
+            operation = self._operations.get(correlation_id)
+        return operation
+    
+    def add(self, records: List[Tuple[str, bytes]]) -> int:
+        """
+        Добавление пакета строк логов одной транзакцией
+        
+        Args:
+            records: Пары (имя логгера, строка JSON записи)
+        
+        Returns:
+            int: Число проиндексированных записей; строки не в формате JSON пропускаются
+        """
+        rows = []
+        for name, data in records:
+            try:
+                entry = json.loads(data)
+                ts = parse_timestamp(entry["timestamp"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            rows.append((ts, name, entry.get("service"), entry.get("component"), self._operation(entry),
+                         entry.get("level"), entry.get("correlation_id"), entry.get("message"),
+                         data.decode('utf-8', errors='replace').rstrip('\n')))
+        
+        connection = self._writer()
+        with connection:
+            connection.executemany("""
+                INSERT INTO log_records (ts, logger, service, component, operation, level,
+                                         correlation_id, message, record)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
+    def prune(self, retention_seconds: float) -> int:
+        """Удаление записей старше срока хранения"""
+        connection = self._writer()
+        with connection:
+            cursor = connection.execute("DELETE FROM log_records WHERE ts < ?",
+                                        (time.time() - retention_seconds,))
+        return cursor.rowcount
+    
+    def search(self, correlation_id: str = None, service: str = None, component: str = None,
+               operation: str = None, since: float = None, until: float = None, text: str = None,
+               limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Поиск записей по ключам индекса
+        
+        Returns:
+            List[Dict[str, Any]]: Записи в порядке времени, как они записаны в лог,
+            с именем логгера в поле logger
+        """
+        conditions, params = [], []
+        for column, value in (("correlation_id", correlation_id), ("service", service),
+                              ("component", component), ("operation", operation)):
+            if value:
+                conditions.append(f"r.{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("r.ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("r.ts <= ?")
+            params.append(until)
+        
+        connection = self._reader()
+        try:
+            source = "log_records r"
+            if text:
+                if self._has_fts(connection):
+                    source += " JOIN log_records_fts f ON f.rowid = r.id"
+                    conditions.append("log_records_fts MATCH ?")
+                    # Фраза целиком: символы запроса не разбираются как синтаксис FTS
+                    params.append('"' + text.replace('"', '""') + '"')
+                else:
+                    conditions.append("r.message LIKE ?")
+                    params.append(f"%{text}%")
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = connection.execute(
+                f"SELECT r.logger, r.record FROM {source} {where} ORDER BY r.ts, r.id LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        finally:
+            connection.close()
+        
+        result = []
+        for row in rows:
+            entry = json.loads(row["record"])
+            entry["logger"] = row["logger"]
+            result.append(entry)
+        return result
+    
+    def _has_fts(self, connection: sqlite3.Connection) -> bool:
+        return connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'log_records_fts'"
+        ).fetchone() is not None
+    
+    def trace(self, correlation_id: str, limit: int = 5000) -> Dict[str, Any]:
+        """Все записи операции во всех сервисах и сводка по ним"""
+        records = self.search(correlation_id=correlation_id, limit=limit)
+        trace = {
+            "correlation_id": correlation_id,
+            "records": records,
+            "count": len(records),
+            "services": sorted({entry.get("service") for entry in records if entry.get("service")}),
+            "operations": sorted({entry.get("operation") for entry in records if entry.get("operation")})
+        }
+        if records:
+            started = parse_timestamp(records[0]["timestamp"])
+            finished = parse_timestamp(records[-1]["timestamp"])
+            trace["started_at"] = records[0]["timestamp"]
+            trace["duration"] = round(finished - started, 3)
+        return trace
+    
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+# Глобальный экземпляр для чтения индекса
+_log_index: Optional[LogIndex] = None
+
+
+def get_log_index() -> LogIndex:
+    """Получение индекса логов"""
+    global _log_index
+    if _log_index is None:
+        _log_index = LogIndex()
+    return _log_index
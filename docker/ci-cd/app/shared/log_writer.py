@@ -0,0 +1,379 @@
+"""
+Log Writer - единственный процесс записи файловых логов сервисов CI/CD контейнера
+
+Сервисы под supervisord не пишут в /logs сами: обработчик логгера передает
+отформатированные записи по Unix сокету LOG_WRITER_SOCKET, а этот процесс
+дописывает их в /logs/<логгер>.log. Ротация выполняется только здесь,
+поэтому логгеры с одинаковыми именами в разных процессах (postgres_client,
+gitlab_client) не теряют и не перемешивают строки при ротации. Ротированные
+файлы сжимаются gzip в фоновом потоке, записи добавляются в индекс логов
+(shared/log_index.py) для поиска по correlation_id и операции.
+
+Протокол: строка "<логгер>\\t<запись>\\n" на каждую запись.
+
+Пока процесс записи не запущен, сервисы пишут в /logs/<логгер>.<pid>.log;
+при запуске и затем раз в LOG_WRITER_STATS_INTERVAL секунд эти файлы
+переносятся в /logs/<логгер>.log и индекс и удаляются.
+"""
+import glob
+import gzip
+import os
+import queue
+import re
+import shutil
+import signal
+import socketserver
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from shared.log_index import LogIndex
+from shared.logger import get_logger
+from shared.metrics import LOG_WRITER_BYTES, LOG_WRITER_RECORDS
+
+
+# Имя файла лога: имя логгера без разделителей каталогов
+_LOG_NAME_RE = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]{0,99}$')
+
+# Резервный файл процесса, писавшего без процесса записи (shared/logger.py, _LogWriterHandler)
+_FALLBACK_FILE_RE = re.compile(r'^(?P<name>.+)\.(?P<pid>\d+)\.log(?P<backup>\.1)?$')
+
+
+class _RotatingLogFile:
+    """Файл лога одного логгера с ротацией по размеру"""
+    
+    def __init__(self, path: str, max_bytes: int, compressor: '_Compressor'):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compressor = compressor
+        self.lock = threading.Lock()
+        self.records = 0
+        self._sequence = 0
+        self._open()
+    
+    def _open(self):
+        # Без буферизации: принятая строка сразу попадает в файл и не теряется при остановке
+        self.file = open(self.path, 'ab', buffering=0)
+        self.size = self.file.tell()
+    
+    def write(self, data: bytes):
+        with self.lock:
+            self.file.write(data)
+            self.size += len(data)
+            self.records += 1
+            if self.size >= self.max_bytes:
+                self._rotate()
+    
+    def _rotate(self):
+        """Переименование текущего файла и передача его на сжатие"""
+        self.file.close()
+        self._sequence += 1
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}-{self._sequence:06d}"
+        os.rename(self.path, rotated)
+        self._open()
+        self.compressor.submit(rotated, self.path)
+    
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class _Compressor:
+    """Фоновое сжатие ротированных файлов и удаление старых архивов"""
+    
+    def __init__(self, backup_count: int):
+        self.backup_count = backup_count
+        self.queue: queue.Queue = queue.Queue()
+        self.logger = get_logger("log-writer")
+        self._thread = threading.Thread(target=self._run, name="log-compressor", daemon=True)
+        self._thread.start()
+    
+    def submit(self, rotated: str, base_path: str):
+        self.queue.put((rotated, base_path))
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._compress(*item)
+            except Exception as e:
+                self.logger.error("Failed to compress rotated log",
+                                component="rotation",
+                                details={"file": item[0], "error": str(e)})
+            finally:
+                self.queue.task_done()
+    
+    def _compress(self, rotated: str, base_path: str):
+        with open(rotated, 'rb') as source, gzip.open(f"{rotated}.gz", 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        
+        # Имена архивов содержат время ротации - сортировка по имени хронологическая
+        archives = sorted(glob.glob(f"{glob.escape(base_path)}.*.gz"))
+        for path in archives[:max(0, len(archives) - self.backup_count)]:
+            os.remove(path)
+    
+    def stop(self, timeout: float = 30.0):
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+
+class _Indexer:
+    """
+    Пакетное добавление записей в индекс логов в фоновом потоке
+    
+    Запись в файлы не ждет индекса: при переполнении очереди строки
+    не индексируются (учитываются в dropped), но в файлы попадают.
+    """
+    
+    BATCH_SIZE = 1000
+    
+    def __init__(self, index: LogIndex, queue_size: int, retention_seconds: float):
+        self.index = index
+        self.retention_seconds = retention_seconds
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.logger = get_logger("log-writer")
+        self._pruned_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-indexer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, name: str, data: bytes):
+        try:
+            self.queue.put_nowait((name, data))
+        except queue.Full:
+            self.dropped += 1
+    
+    def _run(self):
+        try:
+            self._index_batches()
+        finally:
+            # Соединение SQLite закрывается в потоке, который его открыл
+            self.index.close()
+    
+    def _index_batches(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            stop = False
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            try:
+                self.index.add(batch)
+                if time.monotonic() - self._pruned_at > 3600:
+                    self._pruned_at = time.monotonic()
+                    self.index.prune(self.retention_seconds)
+            except Exception as e:
+                self.logger.error("Failed to index log records",
+                                component="indexing",
+                                details={"records": len(batch), "error": str(e)})
+            if stop:
+                return
+    
+    def stop(self, timeout: float = 30.0):
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+
+class LogWriter:
+    """Запись строк логов всех сервисов с учетом скорости поступления"""
+    
+    def __init__(self, log_dir: str = None, max_bytes: int = None, backup_count: int = None,
+                 index: LogIndex = None):
+        self.log_dir = log_dir or os.getenv('LOG_DIR', '/logs')
+        self.max_bytes = max_bytes or int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.compressor = _Compressor(backup_count or int(os.getenv('LOG_BACKUP_COUNT', '5')))
+        self.indexer = None
+        if index is not None:
+            self.indexer = _Indexer(index,
+                                    int(os.getenv('LOG_INDEX_QUEUE_SIZE', '50000')),
+                                    float(os.getenv('LOG_INDEX_RETENTION_DAYS', '7')) * 86400)
+        self.files: Dict[str, _RotatingLogFile] = {}
+        self._files_lock = threading.Lock()
+        self._started_at = time.monotonic()
+        os.makedirs(self.log_dir, exist_ok=True)
+    
+    def _file(self, name: str) -> _RotatingLogFile:
+        log_file = self.files.get(name)
+        if log_file is None:
+            with self._files_lock:
+                log_file = self.files.get(name)
+                if log_file is None:
+                    log_file = _RotatingLogFile(os.path.join(self.log_dir, f"{name}.log"),
+                                                self.max_bytes, self.compressor)
+                    self.files[name] = log_file
+        return log_file
+    
+    def write(self, name: str, data: bytes) -> bool:
+        """Запись строки в лог логгера name; строки с недопустимым именем отбрасываются"""
+        if not _LOG_NAME_RE.match(name):
+            return False
+        self._file(name).write(data)
+        if self.indexer is not None:
+            self.indexer.submit(name, data)
+        LOG_WRITER_RECORDS.labels(service=name).inc()
+        LOG_WRITER_BYTES.labels(service=name).inc(len(data))
+        return True
+    
+    def ingest_fallback_files(self, min_age: float = None) -> int:
+        """
+        Перенос резервных файлов <логгер>.<pid>.log в общий лог и индекс
+        
+        Файлы, изменявшиеся менее min_age секунд назад, пропускаются: процесс
+        мог еще не переключиться на сокет. Удаленный файл процесс создает заново.
+        
+        Returns:
+            int: Число перенесенных строк
+        """
+        min_age = float(os.getenv('LOG_FALLBACK_INGEST_AGE', '5')) if min_age is None else min_age
+        files = []
+        for path in glob.glob(os.path.join(self.log_dir, "*.log*")):
+            match = _FALLBACK_FILE_RE.match(os.path.basename(path))
+            if match and _LOG_NAME_RE.match(match.group("name")):
+                # Копия .1 старше основного файла того же процесса
+                files.append((match.group("name"), match.group("pid"), not match.group("backup"), path))
+        
+        ingested = 0
+        now = time.time()
+        for name, _, _, path in sorted(files):
+            try:
+                if now - os.path.getmtime(path) < min_age:
+                    continue
+                with open(path, 'rb') as f:
+                    for line in f:
+                        if line.strip():
+                            self.write(name, line if line.endswith(b'\n') else line + b'\n')
+                            ingested += 1
+                os.remove(path)
+            except OSError:
+                continue
+        return ingested
+    
+    @property
+    def records(self) -> Dict[str, int]:
+        """Число записанных строк по логгерам"""
+        return {name: log_file.records for name, log_file in list(self.files.items())}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Число записей по логгерам и средняя скорость поступления"""
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        records = self.records
+        return {
+            "records": records,
+            "records_per_second": round(sum(records.values()) / elapsed, 1),
+            "compress_backlog": self.compressor.queue.qsize(),
+            "index_backlog": self.indexer.queue.qsize() if self.indexer else None,
+            "index_dropped": self.indexer.dropped if self.indexer else None
+        }
+    
+    def close(self):
+        if self.indexer is not None:
+            self.indexer.stop()
+        self.compressor.stop()
+        for log_file in list(self.files.values()):
+            log_file.close()
+
+
+class _LogStreamHandler(socketserver.StreamRequestHandler):
+    """Соединение одного процесса-отправителя"""
+    
+    def handle(self):
+        writer: LogWriter = self.server.writer
+        for raw in self.rfile:
+            name, sep, data = raw.partition(b'\t')
+            if sep:
+                writer.write(name.decode('utf-8', errors='replace'),
+                             data if data.endswith(b'\n') else data + b'\n')
+
+
+class LogWriterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix сокет приема записей: поток на процесс-отправитель"""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str, writer: LogWriter):
+        if os.path.exists(socket_path):
+            # Сокет остался от предыдущего запуска
+            os.remove(socket_path)
+        self.writer = writer
+        super().__init__(socket_path, _LogStreamHandler)
+        os.chmod(socket_path, 0o660)
+
+
+class _IngestReporter:
+    """Периодическая запись скорости поступления записей"""
+    
+    def __init__(self, writer: LogWriter, interval: float):
+        self.writer = writer
+        self.interval = interval
+        self.logger = get_logger("log-writer")
+        self._stop = threading.Event()
+        self._previous: Dict[str, int] = {}
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.writer.ingest_fallback_files()
+            records = self.writer.records
+            rates = {name: round((count - self._previous.get(name, 0)) / self.interval, 2)
+                     for name, count in records.items()}
+            self._previous = records
+            self.logger.info("Log ingest rate",
+                           component="ingest",
+                           details={
+                               "records_per_second": round(sum(rates.values()), 2),
+                               "by_logger": {name: rate for name, rate in rates.items() if rate},
+                               "compress_backlog": self.writer.compressor.queue.qsize()
+                           })
+    
+    def start(self):
+        threading.Thread(target=self._run, name="log-ingest-reporter", daemon=True).start()
+    
+    def stop(self):
+        self._stop.set()
+
+
+def main(socket_path: Optional[str] = None):
+    socket_path = socket_path or os.getenv('LOG_WRITER_SOCKET', '/tmp/cicd-log-writer.sock')
+    index = None
+    if os.getenv('LOG_INDEX_ENABLED', 'true').lower() not in ('0', 'false', 'no'):
+        index = LogIndex()
+    writer = LogWriter(index=index)
+    server = LogWriterServer(socket_path, writer)
+    reporter = _IngestReporter(writer, float(os.getenv('LOG_WRITER_STATS_INTERVAL', '60')))
+    reporter.start()
+    # Записи процессов, запущенных раньше процесса записи
+    ingested = writer.ingest_fallback_files()
+    
+    # Остановка по SIGTERM от supervisord: оставшиеся строки дописываются, ротированные файлы сжимаются
+    signal.signal(signal.SIGTERM,
+                  lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    
+    logger = get_logger("log-writer")
+    logger.info("Starting Log Writer service",
+               component="main",
+               details={"socket": socket_path, "log_dir": writer.log_dir, "max_bytes": writer.max_bytes,
+                        "fallback_records_ingested": ingested})
+    
+    try:
+        server.serve_forever()
+    finally:
+        reporter.stop()
+        server.server_close()
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
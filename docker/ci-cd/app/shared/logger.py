@@ -1,26 +1,75 @@
 """
 Централизованная система логирования для CI/CD контейнера
 """
+import atexit
+import itertools
 import json
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import socket
 import sys
-from datetime import datetime
-from typing import Dict, Any, Optional
-import uuid
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from shared.metrics import LOG_RECORDS_DROPPED, OPERATION_DURATION_SECONDS, OPERATION_ERRORS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_stdlib(entry: Dict[str, Any]) -> str:
+    return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _dumps_orjson(entry: Dict[str, Any]) -> str:
+    try:
+        return orjson.dumps(entry, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    except TypeError:
+        # Значения, которые orjson не сериализует (например, целые больше 64 бит)
+        return _dumps_stdlib(entry)
+
+
+# Сериализация записей: orjson, если установлен (LOG_JSON_ENCODER=json - только стандартный json)
+_dumps = _dumps_orjson if orjson is not None and os.getenv('LOG_JSON_ENCODER', 'auto') != 'json' else _dumps_stdlib
 
 
 class StructuredFormatter(logging.Formatter):
-    """Форматтер для структурированных JSON логов"""
+    """
+    Форматтер для структурированных JSON логов
+    
+    Консольный и файловый обработчики логгера форматируют одну и ту же
+    запись: строка сохраняется в записи и второй раз не строится. Дата и
+    время с точностью до секунды кэшируются.
+    """
     
     def __init__(self, service_name: str):
         super().__init__()
         self.service_name = service_name
+        self._second = None
+        self._second_text = ""
+    
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._second:
+            self._second_text = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+            self._second = second
+        return f"{self._second_text}.{int((created - second) * 1000000):06d}Z"
     
     def format(self, record: logging.LogRecord) -> str:
+        cached = record.__dict__.get('_structured')
+        if cached is not None and cached[0] == self.service_name:
+            return cached[1]
+        
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            # Время создания записи, а не форматирования в потоке записи
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "service": self.service_name,
             "component": getattr(record, 'component', 'unknown'),
@@ -28,6 +77,11 @@ class StructuredFormatter(logging.Formatter):
             "correlation_id": getattr(record, 'correlation_id', None)
         }
         
+        # Операция log_operation_* - ключ поиска в индексе логов
+        operation = getattr(record, 'operation', None)
+        if operation:
+            log_entry["operation"] = operation
+        
         # Добавление дополнительных данных
         if hasattr(record, 'details'):
             log_entry["details"] = record.details
@@ -37,10 +91,339 @@ class StructuredFormatter(logging.Formatter):
             log_entry["error"] = {
                 "type": record.exc_info[0].__name__,
                 "message": str(record.exc_info[1]),
-                "traceback": self.formatException(record.exc_info)
+                "traceback": record.exc_text or self.formatException(record.exc_info)
             }
         
-        return json.dumps(log_entry, ensure_ascii=False)
+        line = _dumps(log_entry)
+        record._structured = (self.service_name, line)
+        return line
+
+
+class _LogWriterHandler(logging.Handler):
+    """
+    Передача записей процессу записи логов (shared/log_writer.py) по Unix сокету
+    
+    Файлы /logs/<логгер>.log пишет и ротирует только процесс записи. Пока он
+    недоступен, записи дописываются в /logs/<логгер>.<pid>.log этого процесса
+    (файл не делится с другими процессами), соединение повторяется не чаще
+    раза в секунду. Файл ограничен LOG_FALLBACK_MAX_BYTES: при превышении он
+    переименовывается в .1 (одна копия). Процесс записи переносит такие файлы
+    в /logs/<логгер>.log и индекс логов и удаляет их (LogWriter.ingest_fallback_files).
+    """
+    
+    def __init__(self, socket_path: str, name: str, log_dir: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self.log_name = name
+        self.log_dir = log_dir
+        self._socket: Optional[socket.socket] = None
+        self._pid = os.getpid()
+        self._retry_at = 0.0
+        self._fallback = None
+        self._fallback_path = None
+        self._fallback_size = 0
+        self.fallback_max_bytes = int(os.getenv('LOG_FALLBACK_MAX_BYTES', str(5 * 1024 * 1024)))
+    
+    def _send(self, data: bytes) -> bool:
+        if self._pid != os.getpid():
+            # Соединение унаследовано при fork - строки процессов не должны перемешиваться
+            self._socket = None
+            self._fallback = None
+            self._pid = os.getpid()
+        if self._socket is None:
+            if time.monotonic() < self._retry_at:
+                return False
+            try:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(self.socket_path)
+            except OSError:
+                self._disconnect()
+                return False
+        try:
+            self._socket.sendall(data)
+            return True
+        except OSError:
+            self._disconnect()
+            return False
+    
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self._retry_at = time.monotonic() + 1.0
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record)
+            if self._send(f"{self.log_name}\t{line}\n".encode('utf-8')):
+                return
+            self._write_fallback(line + '\n')
+        except Exception:
+            self.handleError(record)
+    
+    def _write_fallback(self, line: str):
+        if self._fallback is not None and not os.path.exists(self._fallback_path):
+            # Файл перенесен процессом записи в общий лог
+            self._close_fallback()
+        if self._fallback is not None and self._fallback_size + len(line) > self.fallback_max_bytes:
+            self._close_fallback()
+            os.replace(self._fallback_path, self._fallback_path + '.1')
+        if self._fallback is None:
+            self._fallback_path = os.path.join(self.log_dir, f"{self.log_name}.{os.getpid()}.log")
+            self._fallback = open(self._fallback_path, 'a', encoding='utf-8')
+            self._fallback_size = self._fallback.tell()
+        self._fallback.write(line)
+        self._fallback.flush()
+        self._fallback_size += len(line)
+    
+    def _close_fallback(self):
+        self._fallback.close()
+        self._fallback = None
+    
+    def close(self):
+        self.acquire()
+        try:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            if self._fallback is not None:
+                self._close_fallback()
+        finally:
+            self.release()
+        super().close()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Постановка записей в ограниченную очередь без ожидания
+    
+    Вызывающий поток только подготавливает запись; форматирование и
+    запись выполняет поток _LogDispatcher. При переполнении очереди
+    запись отбрасывается по политике LOG_QUEUE_DROP_POLICY:
+    - drop_new - отбрасывается новая запись;
+    - drop_oldest - отбрасывается самая старая запись очереди.
+    Записи уровня WARNING и выше ждут места до LOG_QUEUE_BLOCK_TIMEOUT
+    секунд и только затем отбрасываются.
+    """
+    
+    def __init__(self, pipeline: '_LogPipeline'):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трассировка фиксируются сейчас: аргументы и исключение
+        # могут измениться до обработки записи
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and record.exc_info[0] is not None and not record.exc_text:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+        details = getattr(record, 'details', None)
+        if isinstance(details, dict):
+            record.details = dict(details)
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        pipeline = self.pipeline
+        try:
+            pipeline.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        
+        if record.levelno >= logging.WARNING and pipeline.block_timeout > 0:
+            try:
+                pipeline.queue.put(record, timeout=pipeline.block_timeout)
+                return
+            except queue.Full:
+                pass
+        
+        if pipeline.drop_policy == 'drop_oldest':
+            try:
+                dropped = pipeline.queue.get_nowait()
+                pipeline.queue.task_done()
+                pipeline.count_dropped(dropped.name)
+                pipeline.queue.put_nowait(record)
+                return
+            except (queue.Empty, queue.Full):
+                pass
+        
+        pipeline.count_dropped(record.name)
+
+
+class _LogDispatcher(logging.handlers.QueueListener):
+    """Поток записи: передает запись обработчикам логгера, от которого она пришла"""
+    
+    def __init__(self, pipeline: '_LogPipeline'):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+    
+    def handle(self, record: logging.LogRecord):
+        for handler in self.pipeline.sinks.get(record.name, ()):
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+        
+        self.pipeline.report_dropped()
+
+
+class _LogPipeline:
+    """
+    Асинхронная запись логов процесса
+    
+    Одна ограниченная очередь и один поток записи на процесс для всех
+    логгеров: JSON сериализация и запись в stdout и файлы не выполняются
+    в потоках запросов и операций с БД.
+    """
+    
+    def __init__(self):
+        self.queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+        self.drop_policy = os.getenv('LOG_QUEUE_DROP_POLICY', 'drop_new')
+        self.block_timeout = float(os.getenv('LOG_QUEUE_BLOCK_TIMEOUT', '0.1'))
+        self.sinks: Dict[str, List[logging.Handler]] = {}
+        self.dropped: Dict[str, int] = {}
+        self._unreported: Dict[str, int] = {}
+        self._dropped_lock = threading.Lock()
+        self._start()
+    
+    def _start(self):
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.dispatcher = _LogDispatcher(self)
+        self.dispatcher.start()
+    
+    def register(self, name: str, handlers: List[logging.Handler]) -> logging.Handler:
+        """Регистрация обработчиков логгера, возвращает обработчик постановки в очередь"""
+        self.sinks[name] = handlers
+        return _DroppingQueueHandler(self)
+    
+    def count_dropped(self, name: str):
+        with self._dropped_lock:
+            self.dropped[name] = self.dropped.get(name, 0) + 1
+            self._unreported[name] = self._unreported.get(name, 0) + 1
+        LOG_RECORDS_DROPPED.labels(service=name).inc()
+    
+    def report_dropped(self):
+        """Запись о потерянных записях в лог сервиса, когда в очереди снова есть место"""
+        if not self._unreported or self.queue.qsize() > self.queue_size // 2:
+            return
+        
+        with self._dropped_lock:
+            unreported, self._unreported = self._unreported, {}
+            totals = dict(self.dropped)
+        
+        for name, count in unreported.items():
+            record = logging.LogRecord(name, logging.WARNING, __file__, 0,
+                                       "Log queue overflow, records dropped", None, None)
+            record.component = "logging"
+            record.details = {"dropped": count, "dropped_total": totals[name],
+                              "queue_size": self.queue_size, "policy": self.drop_policy}
+            for handler in self.sinks.get(name, ()):
+                handler.handle(record)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Состояние очереди логов"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "drop_policy": self.drop_policy,
+            "dropped": dict(self.dropped)
+        }
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Ожидание записи всех поставленных в очередь записей"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+    
+    def stop(self):
+        """Запись сводки операций последнего окна и оставшихся записей, остановка потока"""
+        if _operation_tracker is not None:
+            _operation_tracker.report(force=True)
+        if self.dispatcher._thread is not None:
+            self.dispatcher.stop()
+    
+    def restart_after_fork(self):
+        # Поток записи не переживает fork - в дочернем процессе очередь создается заново
+        self.dispatcher._thread = None
+        self._dropped_lock = threading.Lock()
+        self._start()
+
+
+# Идентификаторы корреляции: случайный префикс процесса и счетчик. 64 бита
+# префикса: совпадение у программ, воркеров и перезапусков за срок хранения
+# индекса логов (оно смешало бы операции в /api/logs/trace) практически исключено
+_CORRELATION_PREFIX_BYTES = 8
+_correlation_prefix = os.urandom(_CORRELATION_PREFIX_BYTES).hex()
+_correlation_counter = itertools.count(1)
+
+
+def new_correlation_id() -> str:
+    """Идентификатор корреляции: префикс процесса и возрастающий счетчик, без uuid4"""
+    return f"{_correlation_prefix}{next(_correlation_counter):04x}"
+
+
+def _reset_correlation_ids():
+    # Дочерний процесс не должен повторять идентификаторы родителя
+    global _correlation_prefix, _correlation_counter
+    _correlation_prefix = os.urandom(_CORRELATION_PREFIX_BYTES).hex()
+    _correlation_counter = itertools.count(1)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_correlation_ids)
+
+
+# Форматирование трассировок в вызывающем потоке
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_pipeline: Optional[_LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def _async_logging_enabled() -> bool:
+    return os.getenv('LOG_ASYNC', 'true').lower() not in ('0', 'false', 'no')
+
+
+def _get_pipeline() -> _LogPipeline:
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = _LogPipeline()
+            atexit.register(_pipeline.stop)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=_pipeline.restart_after_fork)
+    return _pipeline
+
+
+def after_fork():
+    """
+    Восстановление логирования в дочернем процессе без os.register_at_fork (Python 3.6)
+    
+    Вызывается сервером, создающим процессы fork (post_fork в gunicorn.conf.py).
+    """
+    if hasattr(os, 'register_at_fork'):
+        return
+    _reset_correlation_ids()
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+def flush_logs(timeout: float = 5.0) -> bool:
+    """Ожидание записи логов, поставленных в очередь (перед завершением, в тестах)"""
+    if _pipeline is None:
+        return True
+    return _pipeline.flush(timeout)
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    """Состояние асинхронной записи логов: глубина очереди и потерянные записи"""
+    if _pipeline is None:
+        return {"async": False}
+    return dict(_pipeline.stats(), **{"async": True})
 
 
 class CILogger:
@@ -53,50 +436,75 @@ class CILogger:
         
         # Очистка существующих обработчиков
         self.logger.handlers.clear()
+        self.logger.propagate = False
         
         # Настройка обработчиков
         self._setup_handlers()
     
     def _setup_handlers(self):
-        """Настройка обработчиков логов"""
+        """
+        Настройка обработчиков логов
+        
+        При LOG_ASYNC (по умолчанию) логгер только ставит записи в очередь,
+        обработчики вызываются потоком записи.
+        """
+        handlers = []
         
         # Консольный обработчик
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(StructuredFormatter(self.service_name))
-        self.logger.addHandler(console_handler)
+        handlers.append(console_handler)
         
-        # Файловый обработчик с ротацией
+        # Файловый обработчик: под supervisord через процесс записи логов
+        # (ротация в одном процессе), иначе - ротация в этом процессе
         log_dir = "/logs"
         if not os.path.exists(log_dir):
             os.makedirs(log_dir, exist_ok=True)
         
-        log_file = os.path.join(log_dir, f"{self.service_name}.log")
-        file_handler = logging.handlers.RotatingFileHandler(
-            log_file,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
-        )
+        writer_socket = os.getenv('LOG_WRITER_SOCKET')
+        if writer_socket:
+            file_handler = _LogWriterHandler(writer_socket, self.service_name, log_dir)
+        else:
+            log_file = os.path.join(log_dir, f"{self.service_name}.log")
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=10 * 1024 * 1024,  # 10MB
+                backupCount=5,
+                encoding='utf-8'
+            )
         file_handler.setFormatter(StructuredFormatter(self.service_name))
-        self.logger.addHandler(file_handler)
+        handlers.append(file_handler)
+        
+        if _async_logging_enabled():
+            self.logger.addHandler(_get_pipeline().register(self.service_name, handlers))
+        else:
+            for handler in handlers:
+                self.logger.addHandler(handler)
     
     def _log_with_context(self, level: int, message: str, component: str = None, 
-                         details: Dict[str, Any] = None, correlation_id: str = None):
+                         details: Dict[str, Any] = None, correlation_id: str = None,
+                         operation: str = None):
         """Логирование с контекстом"""
+        # Запись отключенного уровня не строится
+        if not self.logger.isEnabledFor(level):
+            return
+        
         extra = {
             'component': component or 'main',
-            'correlation_id': correlation_id or str(uuid.uuid4())[:8]
+            'correlation_id': correlation_id or new_correlation_id()
         }
         
         if details:
             extra['details'] = details
+        if operation:
+            extra['operation'] = operation
         
         self.logger.log(level, message, extra=extra)
     
     def info(self, message: str, component: str = None, details: Dict[str, Any] = None, 
-             correlation_id: str = None):
+             correlation_id: str = None, operation: str = None):
         """Информационное сообщение"""
-        self._log_with_context(logging.INFO, message, component, details, correlation_id)
+        self._log_with_context(logging.INFO, message, component, details, correlation_id, operation)
     
     def warning(self, message: str, component: str = None, details: Dict[str, Any] = None, 
                 correlation_id: str = None):
@@ -104,15 +512,20 @@ class CILogger:
         self._log_with_context(logging.WARNING, message, component, details, correlation_id)
     
     def error(self, message: str, component: str = None, details: Dict[str, Any] = None, 
-              correlation_id: str = None, exc_info: bool = False):
+              correlation_id: str = None, exc_info: bool = False, operation: str = None):
         """Ошибка"""
+        if not self.logger.isEnabledFor(logging.ERROR):
+            return
+        
         extra = {
             'component': component or 'main',
-            'correlation_id': correlation_id or str(uuid.uuid4())[:8]
+            'correlation_id': correlation_id or new_correlation_id()
         }
         
         if details:
             extra['details'] = details
+        if operation:
+            extra['operation'] = operation
         
         self.logger.error(message, extra=extra, exc_info=exc_info)
     
@@ -135,40 +548,252 @@ def get_logger(service_name: str, log_level: str = None) -> CILogger:
     return _loggers[service_name]
 
 
+class _OperationStats:
+    """Статистика одной операции за окно сводки"""
+    
+    # Наибольшее число длительностей окна для перцентилей (выборка резервуаром)
+    RESERVOIR_SIZE = 2048
+    
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.suppressed = 0
+        self.durations: List[float] = []
+        self._seen = 0
+        # Токены ограничения частоты записей операции
+        self.tokens = None
+        self.refilled_at = time.monotonic()
+    
+    def reset(self):
+        """Начало нового окна сводки; состояние ограничения частоты сохраняется"""
+        self.count = 0
+        self.errors = 0
+        self.suppressed = 0
+        self.durations = []
+        self._seen = 0
+    
+    def add_duration(self, duration: float):
+        self._seen += 1
+        if len(self.durations) < self.RESERVOIR_SIZE:
+            self.durations.append(duration)
+        else:
+            index = random.randrange(self._seen)
+            if index < self.RESERVOIR_SIZE:
+                self.durations[index] = duration
+    
+    def summary(self) -> Dict[str, Any]:
+        summary = {"count": self.count, "errors": self.errors, "suppressed": self.suppressed}
+        if self.durations:
+            durations = sorted(self.durations)
+            summary["p50"] = round(durations[int(0.5 * (len(durations) - 1))], 3)
+            summary["p95"] = round(durations[int(0.95 * (len(durations) - 1))], 3)
+        return summary
+
+
+class _OperationTracker:
+    """
+    Выборка и ограничение частоты записей log_operation_*
+    
+    Время начала операций хранится по идентификатору корреляции в
+    ограниченном словаре (LOG_OPERATION_TRACK_LIMIT, старые вытесняются).
+    Записи начала и успешного завершения пишутся для доли операций
+    LOG_OPERATION_SAMPLE_RATE и не чаще LOG_OPERATION_RATE_LIMIT в секунду
+    на операцию; ошибки и операции дольше LOG_OPERATION_SLOW_SECONDS
+    пишутся всегда. Раз в LOG_OPERATION_SUMMARY_INTERVAL секунд каждый
+    сервис получает сводку по операциям: число, ошибки, подавленные
+    записи, p50/p95 длительности. Сводки пишет фоновый поток, в том числе
+    когда операций больше нет; сводка последнего окна пишется при
+    завершении процесса. Длительности всех операций, независимо
+    от выборки, попадают в гистограмму ci_cd_operation_duration_seconds.
+    """
+    
+    def __init__(self):
+        self.sample_rate = float(os.getenv('LOG_OPERATION_SAMPLE_RATE', '1.0'))
+        self.rate_limit = float(os.getenv('LOG_OPERATION_RATE_LIMIT', '5'))
+        self.slow_seconds = float(os.getenv('LOG_OPERATION_SLOW_SECONDS', '5'))
+        self.summary_interval = float(os.getenv('LOG_OPERATION_SUMMARY_INTERVAL', '60'))
+        self.track_limit = int(os.getenv('LOG_OPERATION_TRACK_LIMIT', '10000'))
+        self._lock = threading.Lock()
+        self._started: 'OrderedDict[str, Tuple[str, str, float, bool]]' = OrderedDict()
+        self._stats: Dict[Tuple[str, str], _OperationStats] = {}
+        self._window_started = time.monotonic()
+        # Процесс, в котором запущен поток сводок: после fork поток запускается заново
+        self._timer_pid: Optional[int] = None
+    
+    def _ensure_timer(self):
+        # Без блокировки: блокировка могла остаться захваченной при fork
+        if self._timer_pid == os.getpid():
+            return
+        self._timer_pid = os.getpid()
+        threading.Thread(target=self._run_timer, args=(self._timer_pid,),
+                         name="operation-summary", daemon=True).start()
+    
+    def _run_timer(self, pid: int):
+        # Окно проверяется чаще интервала: сводка опаздывает не больше чем на четверть окна
+        tick = max(self.summary_interval / 4, 0.05)
+        while self._timer_pid == pid:
+            time.sleep(tick)
+            try:
+                self.report()
+            except Exception:
+                pass
+    
+    def _operation(self, service: str, operation: str) -> _OperationStats:
+        stats = self._stats.get((service, operation))
+        if stats is None:
+            stats = self._stats[(service, operation)] = _OperationStats()
+        return stats
+    
+    def _allow(self, stats: _OperationStats) -> bool:
+        """Выборка и ограничение частоты (token bucket) записей операции"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit <= 0:
+            return True
+        
+        now = time.monotonic()
+        if stats.tokens is None:
+            stats.tokens = self.rate_limit
+        stats.tokens = min(self.rate_limit, stats.tokens + (now - stats.refilled_at) * self.rate_limit)
+        stats.refilled_at = now
+        if stats.tokens < 1:
+            return False
+        stats.tokens -= 1
+        return True
+    
+    def start(self, service: str, operation: str, correlation_id: str) -> bool:
+        """Регистрация начала операции; True - запись начала нужно писать"""
+        self._ensure_timer()
+        with self._lock:
+            stats = self._operation(service, operation)
+            sampled = self._allow(stats)
+            if not sampled:
+                stats.suppressed += 1
+            self._started[correlation_id] = (service, operation, time.monotonic(), sampled)
+            while len(self._started) > self.track_limit:
+                self._started.popitem(last=False)
+        return sampled
+    
+    def finish(self, service: str, operation: str, correlation_id: str,
+               failed: bool) -> Tuple[bool, Optional[float]]:
+        """
+        Завершение операции
+        
+        Returns:
+            Tuple[bool, Optional[float]]: Нужно ли писать запись завершения и
+            длительность (None, если начало операции не зарегистрировано)
+        """
+        with self._lock:
+            started = self._started.pop(correlation_id, None)
+            duration = time.monotonic() - started[2] if started else None
+            
+            stats = self._operation(service, operation)
+            stats.count += 1
+            if failed:
+                stats.errors += 1
+            if duration is not None:
+                stats.add_duration(duration)
+            
+            # Ошибки, медленные и незарегистрированные операции пишутся всегда
+            write = failed or started is None or started[3] or duration >= self.slow_seconds
+            if not write:
+                stats.suppressed += 1
+        
+        if duration is not None:
+            OPERATION_DURATION_SECONDS.labels(service=service, operation=operation).observe(duration)
+        if failed:
+            OPERATION_ERRORS.labels(service=service, operation=operation).inc()
+        return write, duration
+    
+    def take_summaries(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Сводки по сервисам за окно, если окно истекло; окно начинается заново"""
+        with self._lock:
+            now = time.monotonic()
+            window = now - self._window_started
+            if not force and window < self.summary_interval:
+                return {}
+            self._window_started = now
+            
+            summaries: Dict[str, Dict[str, Any]] = {}
+            for (service, operation), stats in self._stats.items():
+                if stats.count or stats.suppressed:
+                    summaries.setdefault(service, {"window_seconds": round(window, 1), "operations": {}})
+                    summaries[service]["operations"][operation] = stats.summary()
+                    stats.reset()
+        return summaries
+    
+    def report(self, force: bool = False):
+        """Запись сводок в логи сервисов"""
+        for service, summary in self.take_summaries(force).items():
+            get_logger(service).info("Operation summary",
+                                     component="operation",
+                                     details=summary)
+
+
+_operation_tracker: Optional[_OperationTracker] = None
+_operation_tracker_lock = threading.Lock()
+
+
+def _get_operation_tracker() -> _OperationTracker:
+    global _operation_tracker
+    with _operation_tracker_lock:
+        if _operation_tracker is None:
+            _operation_tracker = _OperationTracker()
+            atexit.register(_operation_tracker.report, force=True)
+    return _operation_tracker
+
+
 # Удобные функции для быстрого логирования
 def log_operation_start(service: str, operation: str, details: Dict[str, Any] = None) -> str:
-    """Логирование начала операции"""
-    correlation_id = str(uuid.uuid4())[:8]
-    logger = get_logger(service)
-    logger.info(f"Starting {operation}", 
-                component="operation", 
-                details=details, 
-                correlation_id=correlation_id)
+    """Логирование начала операции (с выборкой, см. _OperationTracker)"""
+    correlation_id = new_correlation_id()
+    tracker = _get_operation_tracker()
+    if tracker.start(service, operation, correlation_id):
+        logger = get_logger(service)
+        logger.info(f"Starting {operation}", 
+                    component="operation", 
+                    details=details, 
+                    correlation_id=correlation_id,
+                    operation=operation)
+    tracker.report()
     return correlation_id
 
 
 def log_operation_success(service: str, operation: str, correlation_id: str, 
                          details: Dict[str, Any] = None):
-    """Логирование успешного завершения операции"""
-    logger = get_logger(service)
-    logger.info(f"Completed {operation} successfully", 
-                component="operation", 
-                details=details, 
-                correlation_id=correlation_id)
+    """Логирование успешного завершения операции (с выборкой, медленные пишутся всегда)"""
+    tracker = _get_operation_tracker()
+    write, duration = tracker.finish(service, operation, correlation_id, failed=False)
+    if write:
+        logger = get_logger(service)
+        if duration is not None:
+            details = dict(details or {})
+            details.setdefault("duration", round(duration, 3))
+        logger.info(f"Completed {operation} successfully", 
+                    component="operation", 
+                    details=details, 
+                    correlation_id=correlation_id,
+                    operation=operation)
+    tracker.report()
 
 
 def log_operation_error(service: str, operation: str, correlation_id: str, 
                        error: Exception, details: Dict[str, Any] = None):
-    """Логирование ошибки операции"""
+    """Логирование ошибки операции (пишется всегда)"""
+    _, duration = _get_operation_tracker().finish(service, operation, correlation_id, failed=True)
     logger = get_logger(service)
     error_details = details or {}
     error_details.update({
         "error_type": type(error).__name__,
         "error_message": str(error)
     })
+    if duration is not None:
+        error_details.setdefault("duration", round(duration, 3))
     
     logger.error(f"Failed {operation}", 
                 component="operation", 
                 details=error_details, 
                 correlation_id=correlation_id, 
-                exc_info=True)
\ No newline at end of file
+                exc_info=True,
+                operation=operation)
+    _get_operation_tracker().report()
\ No newline at end of file
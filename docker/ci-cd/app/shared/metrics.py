@@ -0,0 +1,189 @@
+"""
+Metrics - метрики Prometheus сервисов CI/CD контейнера
+
+Сервисы работают в отдельных процессах supervisord. При заданном
+PROMETHEUS_MULTIPROC_DIR каждый процесс пишет значения метрик в файлы
+этого каталога, а /metrics процесса health-check объединяет их. Gauge
+объявляются с multiprocess_mode livesum: значения живых процессов
+складываются, файлы завершившихся процессов удаляются при сборе.
+"""
+import glob
+import os
+import re
+from typing import Iterable
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+
+# Границы интервалов для блокировок: от мгновенной передачи до таймаута gitsync
+_LOCK_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Границы интервалов для операций log_operation_*: от запроса к БД до синхронизации
+_OPERATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Границы интервалов для HTTP запросов к внешним сервисам и запросов к БД
+_REQUEST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Границы интервалов для длительных этапов: цикл синхронизации, разбор файла, пайплайн
+_LONG_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+
+GIT_LOCK_WAIT_SECONDS = Histogram(
+    'ci_cd_git_lock_wait_seconds',
+    'Time spent waiting for the Git lock',
+    ['service'],
+    buckets=_LOCK_BUCKETS
+)
+
+GIT_LOCK_HOLD_SECONDS = Histogram(
+    'ci_cd_git_lock_hold_seconds',
+    'Time the Git lock was held',
+    ['service'],
+    buckets=_LOCK_BUCKETS
+)
+
+OPERATION_DURATION_SECONDS = Histogram(
+    'ci_cd_operation_duration_seconds',
+    'Duration of operations from log_operation_start to their completion',
+    ['service', 'operation'],
+    buckets=_OPERATION_BUCKETS
+)
+
+OPERATION_ERRORS = Counter(
+    'ci_cd_operation_errors',
+    'Operations completed with log_operation_error',
+    ['service', 'operation']
+)
+
+SYNC_CYCLE_SECONDS = Histogram(
+    'ci_cd_sync_cycle_seconds',
+    'Duration of gitsync sync cycles by outcome',
+    ['outcome'],
+    buckets=_LONG_BUCKETS
+)
+
+ACTIVE_PIPELINES = Gauge(
+    'ci_cd_active_pipelines',
+    'Pipelines triggered and not yet completed',
+    ['pipeline_type'],
+    multiprocess_mode='livesum'
+)
+
+PIPELINE_DURATION_SECONDS = Histogram(
+    'ci_cd_pipeline_duration_seconds',
+    'End-to-end pipeline latency from trigger to completion handling',
+    ['pipeline_type', 'status'],
+    buckets=_LONG_BUCKETS
+)
+
+REDMINE_POLL_BACKLOG = Gauge(
+    'ci_cd_redmine_poll_backlog',
+    'New 1C attachments found in Redmine and not yet processed',
+    multiprocess_mode='livesum'
+)
+
+DECOMPILE_SECONDS = Histogram(
+    'ci_cd_decompile_seconds',
+    'Duration of 1C file decompilation by outcome',
+    ['outcome'],
+    buckets=_LONG_BUCKETS
+)
+
+DOWNLOAD_BYTES = Counter(
+    'ci_cd_download_bytes',
+    'Bytes of attachments downloaded from Redmine',
+    ['service']
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'ci_cd_http_request_seconds',
+    'Latency of HTTP requests to upstream services',
+    ['upstream', 'method', 'endpoint'],
+    buckets=_REQUEST_BUCKETS
+)
+
+HTTP_SERVER_SECONDS = Histogram(
+    'ci_cd_http_server_seconds',
+    'Latency of requests served by the API and health check services',
+    ['service', 'method', 'endpoint', 'status'],
+    buckets=_REQUEST_BUCKETS
+)
+
+DB_QUERY_SECONDS = Histogram(
+    'ci_cd_db_query_seconds',
+    'Latency of PostgreSQL queries by statement',
+    ['statement'],
+    buckets=_REQUEST_BUCKETS
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    'ci_cd_log_records_dropped',
+    'Log records dropped because the log queue was full',
+    ['service']
+)
+
+LOG_WRITER_RECORDS = Counter(
+    'ci_cd_log_writer_records',
+    'Log records written by the log writer process',
+    ['service']
+)
+
+LOG_WRITER_BYTES = Counter(
+    'ci_cd_log_writer_bytes',
+    'Bytes of log records written by the log writer process',
+    ['service']
+)
+
+
+# Идентификаторы в пути запроса: /projects/12/pipelines/345 -> /projects/:id/pipelines/:id
+_PATH_ID_RE = re.compile(r'/(?:\d+|[0-9a-f]{40})(?=/|\.|$)')
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Путь запроса без идентификаторов и параметров - метка ограниченной кардинальности"""
+    path = '/' + endpoint.split('?', 1)[0].lstrip('/')
+    return _PATH_ID_RE.sub('/:id', path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _reap_dead_processes(path: str):
+    """Удаление значений Gauge процессов, завершившихся без очистки (перезапуск supervisord)"""
+    for file_path in glob.glob(os.path.join(path, 'gauge_live*_*.db')):
+        pid = os.path.basename(file_path)[:-len('.db')].rsplit('_', 1)[1]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            multiprocess.mark_process_dead(int(pid), path)
+
+
+def render_metrics(collectors: Iterable = ()) -> str:
+    """
+    Метрики всех процессов (или текущего процесса без multiprocess режима) в формате Prometheus
+    
+    Args:
+        collectors: Дополнительные коллекторы процесса, отдающего /metrics
+    """
+    path = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        _reap_dead_processes(path)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = CollectorRegistry()
+        registry.register(_DefaultRegistryCollector())
+    for collector in collectors:
+        registry.register(collector)
+    return generate_latest(registry).decode('utf-8')
+
+
+class _DefaultRegistryCollector:
+    """Метрики глобального реестра текущего процесса в отдельном реестре запроса"""
+    
+    def collect(self):
+        return REGISTRY.collect()
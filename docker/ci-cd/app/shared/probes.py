@@ -0,0 +1,121 @@
+"""
+Probes - параллельное выполнение проверок состояния сервисов
+
+Проверки запускаются одновременно в отдельных потоках, поэтому полная
+проверка занимает время самой медленной из них, а не сумму таймаутов.
+У каждой проверки свой таймаут, у запуска - общий срок; проверка, не
+уложившаяся в срок, получает результат unhealthy с признаком timed_out
+и продолжает выполняться в фоне: следующий запуск ждет ее, а не стартует
+вторую копию. Завершенные результаты кэшируются на cache_ttl секунд.
+"""
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from shared.logger import get_logger
+
+
+logger = get_logger("probes")
+
+
+class Probe:
+    """Описание проверки: функция возвращает словарь со статусом"""
+    
+    def __init__(self, name: str, check: Callable[[], Dict[str, Any]], timeout: float = 10.0,
+                 cache_ttl: float = 0.0):
+        self.name = name
+        self.check = check
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+
+
+class ProbeRunner:
+    """Параллельный запуск проверок с таймаутами и кэшированием результатов"""
+    
+    def __init__(self, probes: Iterable[Probe], deadline: Optional[float] = None):
+        self.probes: Dict[str, Probe] = {probe.name: probe for probe in probes}
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        # Выполняющиеся проверки
+        self._inflight: Dict[str, Future] = {}
+        # Завершенные проверки: имя -> (время завершения, результат)
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    
+    def _execute(self, probe: Probe, future: Future):
+        try:
+            result = probe.check()
+        except Exception as e:
+            logger.warning("Probe failed",
+                          component="probe",
+                        details={"probe": probe.name, "error": str(e)})
+            result = {"status": "unhealthy", "error": str(e)}
+        
+        with self._lock:
+            self._cache[probe.name] = (time.monotonic(), result)
+            self._inflight.pop(probe.name, None)
+        future.set_result(result)
+    
+    def _submit(self, probe: Probe) -> Future:
+        """Запуск проверки или присоединение к уже выполняющейся"""
+        with self._lock:
+            inflight = self._inflight.get(probe.name)
+            if inflight is not None:
+                return inflight
+            future = self._inflight[probe.name] = Future()
+        
+        threading.Thread(target=self._execute, args=(probe, future),
+                         name=f"probe-{probe.name}", daemon=True).start()
+        return future
+    
+    def _cached(self, probe: Probe) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._cache.get(probe.name)
+        if entry is not None and time.monotonic() - entry[0] < probe.cache_ttl:
+            return entry[1]
+        return None
+    
+    def run(self, names: Optional[List[str]] = None, deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Выполнение проверок
+        
+        Args:
+            names: Имена проверок; по умолчанию все в порядке регистрации
+            deadline: Общий срок в секундах; по умолчанию срок, заданный при создании
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Результаты в порядке имен
+        """
+        deadline = deadline if deadline is not None else self.deadline
+        started = time.monotonic()
+        run_until = started + deadline if deadline is not None else None
+        
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        pending = {}
+        for name in names or list(self.probes):
+            probe = self.probes[name]
+            results[name] = self._cached(probe)
+            if results[name] is None:
+                pending[name] = self._submit(probe)
+        
+        for name, future in pending.items():
+            probe = self.probes[name]
+            # Проверки запущены одновременно: таймауты отсчитываются от начала запуска
+            wait_until = started + probe.timeout
+            reason = f"Probe timed out after {probe.timeout}s"
+            if run_until is not None and run_until < wait_until:
+                wait_until = run_until
+                reason = f"Check deadline of {deadline}s exceeded"
+            
+            try:
+                results[name] = future.result(timeout=max(0.0, wait_until - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning("Probe timed out",
+                              component="probe",
+                              details={"probe": name, "reason": reason})
+                results[name] = {"status": "unhealthy", "error": reason, "timed_out": True}
+        
+        logger.debug("Probes completed",
+                    component="probe",
+                    details={"probes": list(results), "duration": round(time.monotonic() - started, 3)})
+        return results
@@ -0,0 +1,175 @@
+"""
+Process Runner - запуск внешних процессов с потоковым чтением вывода
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Any, List
+
+from shared.logger import get_logger
+
+
+class ProcessRunner:
+    """
+    Запуск долгих процессов (gitsync, precommit1c) без накопления вывода в памяти
+    
+    Вывод читается построчно: каждая строка передается в обработчик прогресса,
+    полностью пишется в файл запуска, а в памяти остается только хвост
+    из tail_lines строк.
+    """
+    
+    def __init__(self, service_name: str, runs_dir: str = None, tail_lines: int = None,
+                 keep_runs: int = None, kill_grace_period: int = 10):
+        self.service_name = service_name
+        self.runs_dir = runs_dir or os.path.join(os.getenv('PROCESS_RUNS_DIR', '/logs/runs'), service_name)
+        self.tail_lines = tail_lines or int(os.getenv('PROCESS_OUTPUT_TAIL_LINES', '50'))
+        self.keep_runs = keep_runs or int(os.getenv('PROCESS_RUNS_KEEP', '20'))
+        self.kill_grace_period = kill_grace_period
+        self.logger = get_logger(service_name)
+    
+    def _open_run_log(self, run_name: str):
+        """Создание файла для полного вывода запуска"""
+        try:
+            os.makedirs(self.runs_dir, exist_ok=True)
+            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            path = os.path.join(self.runs_dir, f"{run_name}-{timestamp}.log")
+            return path, open(path, 'w', encoding='utf-8', errors='replace')
+        
+        except OSError as e:
+            self.logger.warning("Failed to create run log file",
+                              component="process_runner",
+                              details={"runs_dir": self.runs_dir, "error": str(e)})
+            return None, None
+    
+    def _rotate_run_logs(self, run_name: str):
+        """Удаление старых файлов запусков сверх keep_runs"""
+        try:
+            prefix = f"{run_name}-"
+            files = sorted(
+                name for name in os.listdir(self.runs_dir)
+                if name.startswith(prefix) and name.endswith('.log')
+            )
+            for name in files[:-self.keep_runs]:
+                os.remove(os.path.join(self.runs_dir, name))
+        
+        except OSError as e:
+            self.logger.debug("Failed to rotate run logs",
+                            component="process_runner",
+                            details={"runs_dir": self.runs_dir, "error": str(e)})
+    
+    def _kill_process_group(self, process: subprocess.Popen):
+        """Завершение всей группы процессов: SIGTERM, затем SIGKILL"""
+        try:
+            pgid = os.getpgid(process.pid)
+        except ProcessLookupError:
+            return
+        
+        try:
+            os.killpg(pgid, signal.SIGTERM)
+            try:
+                process.wait(timeout=self.kill_grace_period)
+            except subprocess.TimeoutExpired:
+                os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    
+    def run(self, cmd: List[str], run_name: str, timeout: int, cwd: str = None,
+            env: Dict[str, str] = None, on_line: Callable[[str], None] = None,
+            correlation_id: str = None) -> Dict[str, Any]:
+        """
+        Запуск процесса с потоковым чтением объединенного stdout/stderr
+        
+        Args:
+            cmd: Команда запуска
+            run_name: Имя запуска для файла вывода (например, "sync")
+            timeout: Таймаут выполнения в секундах
+            cwd: Рабочая директория
+            env: Переменные окружения
+            on_line: Обработчик каждой строки вывода (разбор прогресса)
+            correlation_id: ID для логирования
+        
+        Returns:
+            Dict[str, Any]: exit_code, duration, timed_out, output_tail,
+            output_lines, output_bytes, log_file
+        """
+        tail = deque(maxlen=self.tail_lines)
+        lines_count = 0
+        bytes_count = 0
+        timed_out = threading.Event()
+        
+        start_time = time.time()
+        
+        # Отдельная группа процессов: при таймауте завершаются и дочерние процессы 1С
+        process = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            errors='replace',
+            bufsize=1,
+            start_new_session=True
+        )
+        
+        # Файл вывода создается после запуска: при ошибке Popen не остается пустого файла
+        log_path, log_file = self._open_run_log(run_name)
+        
+        def on_timeout():
+            timed_out.set()
+            self.logger.error("Process timed out, killing process group",
+                            component="process_runner",
+                            details={"command": ' '.join(cmd), "timeout": timeout, "pid": process.pid},
+                            correlation_id=correlation_id)
+            self._kill_process_group(process)
+        
+        watchdog = threading.Timer(timeout, on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        
+        try:
+            for line in process.stdout:
+                lines_count += 1
+                bytes_count += len(line)
+                
+                if log_file:
+                    log_file.write(line)
+                
+                line = line.rstrip('\n')
+                tail.append(line)
+                
+                if on_line:
+                    try:
+                        on_line(line)
+                    except Exception as e:
+                        self.logger.debug("Output line handler failed",
+                                        component="process_runner",
+                                        details={"error": str(e)},
+                                        correlation_id=correlation_id)
+            
+            process.wait()
+        
+        except BaseException:
+            self._kill_process_group(process)
+            raise
+        
+        finally:
+            watchdog.cancel()
+            process.stdout.close()
+            if log_file:
+                log_file.close()
+                self._rotate_run_logs(run_name)
+        
+        return {
+            "exit_code": process.returncode,
+            "duration": time.time() - start_time,
+            "timed_out": timed_out.is_set(),
+            "output_tail": '\n'.join(tail),
+            "output_lines": lines_count,
+            "output_bytes": bytes_count,
+            "log_file": log_path
+        }
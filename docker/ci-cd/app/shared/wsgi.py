@@ -0,0 +1,81 @@
+"""
+WSGI - общие части HTTP сервисов api-server и health-check
+
+В контейнере приложения Flask обслуживает gunicorn (gunicorn.conf.py):
+несколько процессов-воркеров с пулом потоков в каждом. Здесь собрано то,
+что не зависит от способа запуска:
+- замер длительности запросов (метрика ci_cd_http_server_seconds,
+  заголовок Server-Timing, предупреждение о медленных запросах);
+- действия при старте воркера: подключение клиентов и запуск фоновых
+  обновлений выполняются до приема первого запроса, а не в нем;
+- запуск встроенным сервером Flask для разработки (run).
+"""
+import os
+import time
+from typing import Callable
+
+from flask import Flask, g, request
+
+from shared.logger import get_logger
+from shared.metrics import HTTP_SERVER_SECONDS
+
+
+logger = get_logger("wsgi")
+
+_STARTUP_EXTENSION = "cicd_worker_startup"
+
+
+def install_request_timing(app: Flask, service: str):
+    """Замер длительности обработки запросов приложения"""
+    slow_seconds = float(os.getenv('SLOW_REQUEST_SECONDS', '2'))
+    
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+    
+    @app.after_request
+    def _observe(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        
+        duration = time.perf_counter() - started
+        # Шаблон маршрута, а не путь: /api/logs/trace/<correlation_id>
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_SERVER_SECONDS.labels(service=service, method=request.method, endpoint=endpoint,
+                                   status=str(response.status_code)).observe(duration)
+        response.headers['Server-Timing'] = f"app;dur={duration * 1000:.1f}"
+        
+        if duration > slow_seconds:
+            logger.warning("Slow request",
+                          component="request_timing",
+                          details={"service": service, "method": request.method, "endpoint": endpoint,
+                                   "status": response.status_code, "duration": round(duration, 3)})
+        return response
+
+
+def on_worker_start(app: Flask, action: Callable[[], object]):
+    """Регистрация действия, выполняемого при старте процесса-воркера"""
+    app.extensions.setdefault(_STARTUP_EXTENSION, []).append(action)
+
+
+def start_worker(app: Flask):
+    """
+    Выполнение действий старта воркера
+    
+    Ошибка одного действия не останавливает воркер: клиенты повторно
+    инициализируются при первом обращении.
+    """
+    for action in app.extensions.get(_STARTUP_EXTENSION, []):
+        try:
+            action()
+        except Exception as e:
+            logger.warning("Worker startup action failed",
+                          component="worker",
+                          details={"action": getattr(action, '__name__', repr(action)), "error": str(e)})
+
+
+def run(app: Flask, port: int):
+    """Запуск встроенным сервером Flask (разработка, отладка без gunicorn)"""
+    start_worker(app)
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
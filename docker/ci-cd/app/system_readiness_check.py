@@ -12,6 +12,8 @@ from typing import Dict, Any, List
 # Добавление пути к модулям приложения
 sys.path.insert(0, os.path.dirname(__file__))
 
+from shared.probes import Probe, ProbeRunner
+
 
 class SystemReadinessChecker:
     """Проверка готовности всей системы"""
@@ -46,6 +48,15 @@ class SystemReadinessChecker:
         }
         
         self.results = {}
+        
+        # Сервисы проверяются параллельно: полная проверка длится как самая медленная
+        probe_timeout = float(os.getenv('READINESS_PROBE_TIMEOUT', '30'))
+        cache_ttl = float(os.getenv('READINESS_CACHE_TTL', '10'))
+        self.runner = ProbeRunner(
+            (Probe(service_id, service_info['check_method'], timeout=probe_timeout, cache_ttl=cache_ttl)
+             for service_id, service_info in self.services.items()),
+            deadline=float(os.getenv('READINESS_DEADLINE', '60'))
+        )
     
     def _check_postgres(self) -> Dict[str, Any]:
         """Проверка PostgreSQL"""
@@ -277,12 +288,13 @@ class SystemReadinessChecker:
         print("🔍 Checking system readiness...")
         print("=" * 60)
         
+        self.results = self.runner.run()
+        
         for service_id, service_info in self.services.items():
-            print(f"Checking {service_info['name']}...", end=" ")
+            print(f"{service_info['name']}:", end=" ")
             
             try:
-                result = service_info['check_method']()
-                self.results[service_id] = result
+                result = self.results[service_id]
                 
                 status = result['status']
                 if status == 'healthy':
@@ -1,9 +1,12 @@
 """
 Тесты интеграций CI/CD системы
 """
+import asyncio
 import unittest
 import os
 import sys
+import threading
+import time
 from unittest.mock import Mock, patch, MagicMock
 
 # Добавление пути к модулям приложения
@@ -47,6 +50,50 @@ class TestPostgreSQLClient(unittest.TestCase):
         self.assertEqual(pipeline_id, 1)
 
 
+class TestPipelineIds(unittest.TestCase):
+    """Тесты генерации pipeline_id"""
+    
+    @patch('integrations.postgres_client.psycopg2.connect')
+    def test_pipeline_ids_unique_under_concurrent_bursts(self, mock_connect):
+        """Тысячи запусков в секунду из нескольких потоков получают разные pipeline_id в порядке создания"""
+        from shared.ids import ulid_time
+        
+        mock_connect.return_value = MagicMock()
+        client = PostgreSQLClient()
+        # Тысячи записей лога дописывались бы в поток вывода после окончания теста
+        client.logger = Mock()
+        created = {}
+        lock = threading.Lock()
+        
+        def execute_query(query, params=None, fetch=False):
+            with lock:
+                created.setdefault(threading.get_ident(), []).append(params[6])
+                return [{'id': sum(len(ids) for ids in created.values())}]
+        
+        def burst():
+            for _ in range(1000):
+                client.create_pipeline(pipeline_type="precommit1c", project_name="external-files")
+        
+        threads = [threading.Thread(target=burst) for _ in range(8)]
+        started = time.time()
+        with patch.object(client, 'execute_query', side_effect=execute_query):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.time() - started
+        
+        all_ids = [pipeline_id for ids in created.values() for pipeline_id in ids]
+        self.assertEqual(len(set(all_ids)), 8000)
+        self.assertLess(elapsed, 8.0)
+        for ids in created.values():
+            # В каждом потоке идентификаторы возрастают вместе со временем запуска
+            self.assertEqual(ids, sorted(ids))
+            self.assertTrue(all(pipeline_id.startswith("precommit1c_external-files_") and len(pipeline_id) == 53
+                                for pipeline_id in ids))
+        self.assertLessEqual(abs(ulid_time(all_ids[0].rsplit('_', 1)[1]) - started), 1.0)
+
+
 class TestGitLabClient(unittest.TestCase):
     """Тесты GitLab клиента"""
     
@@ -67,6 +114,22 @@ class TestGitLabClient(unittest.TestCase):
         
         self.assertIsNotNone(project)
         self.assertEqual(project['name'], 'test-project')
+    
+    def test_incremental_pipeline_config(self):
+        """Тест генерации пайплайна с инкрементальным анализом SonarQube"""
+        import yaml
+        
+        config = yaml.safe_load(self.client.create_ci_pipeline_config(1, "main", analysis_mode="incremental"))
+        
+        incremental_job = config['sonarqube_incremental_analysis']
+        self.assertIn('-Dsonar.inclusions="$SONAR_INCLUSIONS"', ' '.join(incremental_job['script']))
+        # Ограниченный анализ не публикуется в основной проект
+        self.assertIn('-Dsonar.projectKey=$SONAR_CHANGES_PROJECT_KEY', ' '.join(incremental_job['script']))
+        self.assertEqual(incremental_job['cache']['key'], config['sonarqube_analysis']['cache']['key'])
+        self.assertIn({'if': '$CI_PIPELINE_SOURCE == "schedule"'}, config['sonarqube_analysis']['rules'])
+        
+        full_config = yaml.safe_load(self.client.create_ci_pipeline_config(1, "main", analysis_mode="full"))
+        self.assertNotIn('sonarqube_incremental_analysis', full_config)
 
 
 class TestSonarQubeClient(unittest.TestCase):
@@ -87,6 +150,20 @@ class TestSonarQubeClient(unittest.TestCase):
             result = self.client.create_project("test-key", "Test Project")
         
         self.assertTrue(result)
+    
+    @patch('integrations.sonarqube_client.requests.Session.request')
+    def test_check_health_single_request(self, mock_request):
+        """Проверка готовности выполняет один запрос без повторов"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'status': 'STARTING'}
+        mock_request.return_value = mock_response
+        
+        result = self.client.check_health(timeout=3)
+        
+        self.assertEqual(result, {"status": "not_ready", "system_status": "STARTING"})
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 3)
 
 
 class TestRedmineClient(unittest.TestCase):
@@ -150,5 +227,453 @@ class TestSystemInitializer(unittest.TestCase):
         self.assertEqual(mock_wait.call_count, 4)
 
 
+class TestUpstreamStatusCache(unittest.TestCase):
+    """Тесты кэша состояния внешних сервисов для /status и /dashboard"""
+    
+    def test_refresh_replaces_snapshot_and_etag(self):
+        """Снимок обновляется однократными проверками, ETag меняется вместе со снимком"""
+        from upstream_status import UpstreamStatusCache
+        
+        client = Mock()
+        client.check_health.return_value = {"status": "healthy", "projects_count": 2}
+        client.execute_query.return_value = [{"count": 5}]
+        
+        cache = UpstreamStatusCache(interval=30, probe_timeout=1)
+        snapshot, initial_etag = cache.get()
+        self.assertEqual(snapshot["services"]["gitlab"]["status"], "unknown")
+        self.assertEqual(cache.max_age(), 0)
+        
+        with patch('upstream_status.get_gitlab_client', return_value=client), \
+                patch('upstream_status.get_redmine_client', return_value=client), \
+                patch('upstream_status.get_sonarqube_client', return_value=client), \
+                patch('upstream_status.get_postgres_client', return_value=client):
+            cache.refresh()
+        
+        snapshot, etag = cache.get()
+        self.assertNotEqual(etag, initial_etag)
+        self.assertEqual(snapshot["services"]["gitlab"], {"status": "healthy", "projects_count": 2})
+        self.assertEqual(snapshot["services"]["postgresql"], {"status": "healthy", "config_entries": 5})
+        self.assertEqual(snapshot["statistics"], {"pipelines_today": 5})
+        self.assertGreater(cache.max_age(), 0)
+        self.assertEqual(client.check_health.call_count, 3)
+
+
+class TestWebhookInbox(unittest.TestCase):
+    """Тесты приема webhook'ов через webhook_inbox"""
+    
+    def test_concurrent_webhooks_written_in_one_insert(self):
+        """Webhook'и одной пачки пишутся одним запросом, повторная доставка не считается новой"""
+        from webhook_inbox import WebhookInbox, _PendingWebhook
+        
+        client = Mock()
+        client.append_webhooks.return_value = [("gitlab", "a"), ("gitlab", "b")]
+        batch = [_PendingWebhook({"source": "gitlab", "delivery_id": delivery, "body": b"{}"})
+                 for delivery in ("a", "b", "a", "c")]
+        
+        with patch('webhook_inbox.get_postgres_client', return_value=client):
+            WebhookInbox(batch_size=10)._write(batch)
+        
+        self.assertEqual(client.append_webhooks.call_count, 1)
+        self.assertEqual([webhook["delivery_id"] for webhook in client.append_webhooks.call_args[0][0]],
+                         ["a", "b", "c"])
+        self.assertEqual([pending.inserted for pending in batch], [True, True, False, False])
+        self.assertTrue(all(pending.done.is_set() for pending in batch))
+    
+    def test_write_error_reported_to_request(self):
+        """Ошибка записи возвращается запросу, принявшему webhook"""
+        from webhook_inbox import WebhookInbox
+        
+        client = Mock()
+        client.append_webhooks.side_effect = RuntimeError("database unavailable")
+        with patch('webhook_inbox.get_postgres_client', return_value=client):
+            with self.assertRaises(RuntimeError):
+                WebhookInbox(ack_timeout=5).append("gitlab", "a", "Pipeline Hook", {}, b"{}")
+    
+    def test_delivery_id_from_header_or_body(self):
+        """Идентификатор доставки - заголовок GitLab или хэш тела"""
+        from webhook_inbox import delivery_id
+        
+        self.assertEqual(delivery_id({"X-Gitlab-Event-UUID": "uuid-1"}, b"{}"), "uuid-1")
+        self.assertEqual(delivery_id({}, b'{"pipeline_id": "7"}'), delivery_id({}, b'{"pipeline_id": "7"}'))
+        self.assertNotEqual(delivery_id({}, b'{"pipeline_id": "7"}'), delivery_id({}, b'{"pipeline_id": "8"}'))
+    
+    def test_processor_dispatches_and_retries(self):
+        """Завершение пайплайна передается координатору, ошибка разбора оставляет webhook для повтора"""
+        from webhook_inbox import WebhookInboxProcessor
+        
+        client = Mock()
+        client.claim_webhooks.return_value = [
+            {"id": 1, "source": "gitlab", "delivery_id": "a", "event_type": "Pipeline Hook", "attempts": 1,
+             "body": b'{"object_attributes": {"id": 7, "status": "success"}}'},
+            {"id": 2, "source": "gitlab", "delivery_id": "b", "event_type": "Push Hook", "attempts": 1,
+             "body": b'{}'},
+            {"id": 3, "source": "pipeline_completed", "delivery_id": "c", "event_type": None, "attempts": 1,
+             "body": b'not json'}
+        ]
+        coordinator = Mock()
+        coordinator.handle_pipeline_event.return_value = True
+        
+        with patch('webhook_inbox.get_postgres_client', return_value=client):
+            counts = WebhookInboxProcessor(coordinator, max_attempts=5).process_pending()
+        
+        coordinator.handle_pipeline_event.assert_called_once_with(7)
+        self.assertEqual(counts, {"done": 1, "ignored": 1, "pending": 1})
+        self.assertEqual([call[0][:2] for call in client.complete_webhook.call_args_list],
+                         [(1, "done"), (2, "ignored"), (3, "pending")])
+
+
+class TestPipelineCoordinatorTrigger(unittest.TestCase):
+    """Тесты запуска пайплайна GitSync"""
+    
+    def setUp(self):
+        self.postgres = Mock()
+        self.postgres.create_pipeline.return_value = 7
+        self.postgres.get_config_value.return_value = "1"
+        self.gitlab = Mock()
+        self.gitlab.trigger_pipeline.return_value = {"id": 1007, "web_url": "http://gitlab/p/1007"}
+        self.patches = [
+            patch('pipeline_coordinator.get_postgres_client', return_value=self.postgres),
+            patch('pipeline_coordinator.get_gitlab_client', return_value=self.gitlab),
+            patch('pipeline_coordinator.get_sonarqube_client', return_value=Mock()),
+            patch('pipeline_coordinator.get_redmine_client', return_value=Mock())
+        ]
+        for patcher in self.patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _trigger(self, analysis_mode: str):
+        from pipeline_coordinator import PipelineCoordinator
+        
+        with patch.dict(os.environ, {"SONAR_ANALYSIS_MODE": analysis_mode}):
+            coordinator = PipelineCoordinator()
+        coordinator.trigger_gitsync_pipeline(
+            "abc123", [{"type": "Catalogs", "name": "Items", "files": ["src/Catalogs/Items.xml"]}],
+            change_summary={"base_commit": "def456"}
+        )
+        return coordinator.gitlab_client.trigger_pipeline.call_args[1]["variables"], coordinator.active_pipelines[7]
+    
+    def test_full_mode_analyzes_main_project(self):
+        """В режиме full область анализа не ограничивается, результаты читаются из основного проекта"""
+        variables, pipeline = self._trigger("full")
+        
+        self.assertNotIn("SONAR_INCLUSIONS", variables)
+        self.assertNotIn("SONAR_CHANGES_PROJECT_KEY", variables)
+        self.assertEqual(pipeline["sonar_project_key"], "ut103-ci")
+    
+    def test_trigger_does_not_set_active_gauge(self):
+        """Процесс, запустивший пайплайн, не отслеживает его и не меняет ci_cd_active_pipelines"""
+        with patch('pipeline_coordinator.ACTIVE_PIPELINES') as gauge:
+            self._trigger("full")
+        gauge.labels.assert_not_called()
+    
+    def test_incremental_mode_analyzes_changes_project(self):
+        """В режиме incremental анализируются измененные объекты в отдельном проекте"""
+        variables, pipeline = self._trigger("incremental")
+        
+        self.assertIn("**/Catalogs/Items/**", variables["SONAR_INCLUSIONS"])
+        self.assertEqual(variables["SONAR_CHANGES_PROJECT_KEY"], "ut103-ci-changes")
+        self.assertEqual(pipeline["sonar_project_key"], "ut103-ci-changes")
+
+class TestAsyncPipelineCoordinator(unittest.TestCase):
+    """Тесты событийного цикла координации пайплайнов"""
+    
+    def setUp(self):
+        self.coordinator = Mock()
+        self.coordinator.active_pipelines = {}
+        self.coordinator.monitoring_interval = 3600
+        self.coordinator.sonar_project_key = "ut103-ci"
+        self.coordinator.sonarqube_client.get_project_analysis_status.return_value = {"projectStatus": {}}
+        self.coordinator.sonarqube_client.get_project_measures.return_value = {"bugs": 0}
+    
+    def _rows(self, count: int):
+        return [{"id": number, "pipeline_id": f"gitsync_{number}", "pipeline_type": "gitsync", "triggered_at": None,
+                 "metadata": {"gitlab_project_id": 1, "gitlab_pipeline_id": 1000 + number}}
+                for number in range(1, count + 1)]
+    
+    def _start(self, runtime):
+        thread = threading.Thread(target=runtime.run, daemon=True)
+        thread.start()
+        
+        def stop():
+            runtime.stop()
+            thread.join(10)
+        self.addCleanup(stop)
+    
+    def _wait_until(self, predicate, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("Condition not reached in time")
+            time.sleep(0.01)
+    
+    def test_pipelines_completed_concurrently_within_upstream_limits(self):
+        """Сотни пайплайнов обрабатываются одновременно, вызовы GitLab не превышают лимит"""
+        from pipeline_coordinator_async import AsyncPipelineCoordinator
+        
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        
+        def get_pipeline_status(project_id, pipeline_id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.005)
+            with lock:
+                active[0] -= 1
+            return {"status": "success", "duration": 10}
+        
+        self.coordinator.postgres_client.get_running_pipelines.return_value = self._rows(300)
+        self.coordinator.gitlab_client.get_pipeline_status.side_effect = get_pipeline_status
+        
+        runtime = AsyncPipelineCoordinator(self.coordinator, concurrency={
+            "gitlab": 4, "sonarqube": 4, "redmine": 4, "postgres": 4
+        })
+        runtime.discovery_interval = 0.05
+        self._start(runtime)
+        self._wait_until(lambda: self.coordinator.create_gitsync_notification.call_count == 300)
+        
+        self.assertLessEqual(peak[0], 4)
+        self.assertEqual(self.coordinator.record_completion.call_count, 300)
+        # Завершенные пайплайны из выборки running не отслеживаются повторно
+        discoveries = self.coordinator.postgres_client.get_running_pipelines.call_count
+        self._wait_until(lambda: self.coordinator.postgres_client.get_running_pipelines.call_count >= discoveries + 2)
+        self.assertEqual(self.coordinator.gitlab_client.get_pipeline_status.call_count, 300)
+    
+    def test_webhook_event_checks_pipeline_immediately(self):
+        """Событие webhook'а проверяет пайплайн сразу, не дожидаясь интервала мониторинга"""
+        from pipeline_coordinator_async import AsyncPipelineCoordinator
+        
+        self.coordinator.postgres_client.get_running_pipelines.return_value = self._rows(1)
+        self.coordinator.gitlab_client.get_pipeline_status.side_effect = [
+            {"status": "running"}, {"status": "failed", "duration": 5}
+        ]
+        
+        runtime = AsyncPipelineCoordinator(self.coordinator)
+        self._start(runtime)
+        self._wait_until(lambda: self.coordinator.gitlab_client.get_pipeline_status.call_count == 1)
+        
+        started = time.monotonic()
+        self.assertTrue(runtime.handle_pipeline_event(1001))
+        self.assertFalse(runtime.handle_pipeline_event(9999))
+        self._wait_until(lambda: self.coordinator.record_completion.called, timeout=1.0)
+        
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.coordinator.create_gitsync_notification.assert_not_called()
+    
+    
+    def test_sharded_instances_track_disjoint_pipelines(self):
+        """Экземпляры отслеживают только пайплайны своих шардов; уже записанное завершение не уведомляет"""
+        from pipeline_coordinator_async import AsyncPipelineCoordinator
+        from pipeline_shards import shard_of
+        
+        rows = self._rows(40)
+        runtimes = []
+        for owned in (frozenset(range(0, 8)), frozenset(range(8, 16))):
+            coordinator = Mock()
+            coordinator.active_pipelines = {}
+            coordinator.monitoring_interval = 3600
+            coordinator.postgres_client.get_running_pipelines.return_value = rows
+            coordinator.gitlab_client.get_pipeline_status.return_value = {"status": "success", "duration": 1}
+            coordinator.record_completion.return_value = False
+            
+            shards = Mock(shard_count=16, owned=owned, heartbeat_interval=3600)
+            shards.owns.side_effect = lambda pipeline_id, owned=owned: shard_of(pipeline_id, 16) in owned
+            shards.heartbeat.return_value = owned
+            shards.instance_id = f"instance-{len(runtimes)}"
+            runtime = AsyncPipelineCoordinator(coordinator, shards=shards)
+            runtime._listen = Mock(side_effect=lambda: asyncio.sleep(0))
+            runtimes.append(runtime)
+            self._start(runtime)
+        
+        for runtime in runtimes:
+            self._wait_until(lambda runtime=runtime: runtime.coordinator.postgres_client.get_running_pipelines.called
+                             and not runtime.coordinator.active_pipelines)
+        
+        checked = [{call[0][1] for call in runtime.coordinator.gitlab_client.get_pipeline_status.call_args_list}
+                   for runtime in runtimes]
+        self.assertEqual(checked[0] & checked[1], set())
+        self.assertEqual(checked[0] | checked[1], {row["metadata"]["gitlab_pipeline_id"] for row in rows})
+        for runtime in runtimes:
+            runtime.coordinator.create_gitsync_notification.assert_not_called()
+
+
+class _FakeShardStore:
+    """Таблицы coordinator_shards и coordinator_instances в памяти"""
+    
+    def __init__(self):
+        self.now = 0
+        self.shards = {}
+        self.instances = {}
+    
+    def init_coordinator_shards(self, shard_count):
+        for shard in range(shard_count):
+            self.shards.setdefault(shard, {"owner": None, "expires": 0})
+    
+    def heartbeat_coordinator_instance(self, instance_id, lease_ttl):
+        self.instances[instance_id] = self.now
+        self.instances = {name: seen for name, seen in self.instances.items() if seen >= self.now - lease_ttl}
+        return len(self.instances)
+    
+    def renew_shard_leases(self, instance_id, lease_ttl):
+        owned = [shard for shard, lease in self.shards.items() if lease["owner"] == instance_id]
+        for shard in owned:
+            self.shards[shard]["expires"] = self.now + lease_ttl
+        return owned
+    
+    def claim_shard_leases(self, instance_id, lease_ttl, limit):
+        free = [shard for shard, lease in sorted(self.shards.items())
+                if lease["owner"] is None or lease["expires"] < self.now][:limit]
+        for shard in free:
+            self.shards[shard] = {"owner": instance_id, "expires": self.now + lease_ttl}
+        return free
+    
+    def release_shard_leases(self, instance_id, shards=None):
+        for shard, lease in self.shards.items():
+            if lease["owner"] == instance_id and (shards is None or shard in shards):
+                self.shards[shard] = {"owner": None, "expires": 0}
+    
+    def remove_coordinator_instance(self, instance_id):
+        self.instances.pop(instance_id, None)
+
+
+class TestShardLeaseManager(unittest.TestCase):
+    """Тесты аренды шардов пайплайнов экземплярами координатора"""
+    
+    def setUp(self):
+        self.store = _FakeShardStore()
+        patcher = patch('pipeline_shards.get_postgres_client', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _manager(self, instance_id):
+        from pipeline_shards import ShardLeaseManager
+        return ShardLeaseManager(instance_id=instance_id, shard_count=16, lease_ttl=20, heartbeat_interval=5)
+    
+    def _owners(self):
+        return {lease["owner"] for lease in self.store.shards.values()}
+    
+    def test_shards_rebalanced_on_join_and_instance_loss(self):
+        """Шарды делятся между экземплярами и переходят к оставшимся после потери экземпляра"""
+        from pipeline_shards import shard_of
+        
+        first, second = self._manager("a"), self._manager("b")
+        self.assertEqual(len(first.heartbeat()), 16)
+        
+        # Новый экземпляр получает свою долю после того, как первый освободит лишние шарды
+        second.heartbeat()
+        first.heartbeat()
+        second.heartbeat()
+        self.assertEqual((len(first.owned), len(second.owned)), (8, 8))
+        self.assertEqual(first.owned & second.owned, frozenset())
+        self.assertTrue(first.owns("gitsync_1") != second.owns("gitsync_1"))
+        self.assertEqual(shard_of("gitsync_1", 16), shard_of("gitsync_1", 16))
+        
+        # Второй экземпляр перестал продлевать аренду
+        self.store.now += 30
+        first.heartbeat()
+        self.assertEqual(len(first.owned), 16)
+        self.assertEqual(self._owners(), {"a"})
+        
+        first.release()
+        self.assertEqual(self._owners(), {None})
+        self.assertFalse(first.owns("gitsync_1"))
+
+
+class TestDashboardEventHub(unittest.TestCase):
+    """Тесты источника событий живого dashboard"""
+    
+    def setUp(self):
+        from dashboard_events import DashboardEventHub
+        
+        self.hub = DashboardEventHub(interval=60, queue_size=4)
+        # Фоновый опрос не запускается: события публикуются вызовом poll()
+        self.hub._running = True
+        
+        self.upstream = Mock()
+        self.upstream.get.return_value = ({"services": {"gitlab": {"status": "healthy"}},
+                                           "statistics": {}, "checked_at": None}, "etag-1")
+        self.coordinator = Mock()
+        self.coordinator.get_lock_status.return_value = {"locked": False, "holders": []}
+        self.postgres = Mock()
+        self.postgres.get_recent_pipelines.return_value = [
+            {"id": 1, "pipeline_id": "p1", "status": "running", "completed_at": None}
+        ]
+        self.log_index = Mock()
+        self.log_index.search.return_value = []
+        
+        self.patches = [
+            patch('dashboard_events.get_upstream_status', return_value=self.upstream),
+            patch('dashboard_events.get_git_coordinator', return_value=self.coordinator),
+            patch('dashboard_events.get_postgres_client', return_value=self.postgres),
+            patch('dashboard_events.get_log_index', return_value=self.log_index)
+        ]
+        for patcher in self.patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _drain(self, subscriber):
+        events = []
+        while True:
+            event = subscriber.next(0)
+            if event is None:
+                return events
+            events.append(event.split("\n", 1)[0])
+    
+    def test_poll_publishes_only_changes_to_all_subscribers(self):
+        """Один опрос раздается всем подписчикам, неизменившиеся источники не публикуются"""
+        first, second = self.hub.subscribe(), self.hub.subscribe()
+        
+        self.hub.poll()
+        expected = ["event: services", "event: lock", "event: pipeline"]
+        self.assertEqual(self._drain(first), expected)
+        self.assertEqual(self._drain(second), expected)
+        
+        self.postgres.get_recent_pipelines.return_value = [
+            {"id": 1, "pipeline_id": "p1", "status": "success", "completed_at": "2024-01-01 00:00:00"}
+        ]
+        self.hub.poll()
+        self.assertEqual(self._drain(first), ["event: pipeline"])
+        self.assertEqual(self.upstream.get.call_count, 2)
+    
+    def test_new_subscriber_receives_last_state(self):
+        """Подписчик, открывший страницу позже, сразу получает текущее состояние"""
+        self.hub.poll()
+        late = self.hub.subscribe()
+        self.assertEqual(sorted(self._drain(late)), ["event: lock", "event: pipeline", "event: services"])
+    
+    def test_sync_outcome_from_cycle_record(self):
+        """Итог цикла GitSync берется из outcome: ошибка отправки и сбой синхронизации - неуспех"""
+        # Не первый опрос: публикуются все новые циклы
+        self.hub._sync_since = 0.0
+        self.log_index.search.return_value = [
+            {"timestamp": f"2024-01-01T00:00:0{number}", "message": message, "correlation_id": f"c{number}",
+             "details": details}
+            for number, (message, details) in enumerate([
+                ("Completed sync_cycle successfully", {"push_success": False}),
+                ("Sync cycle finished", {"outcome": "push_failed"}),
+                ("Sync cycle failed", {"success": False}),
+                ("Sync cycle finished", {"outcome": "sync_failed"}),
+                ("Sync cycle finished", {"outcome": "success"})
+            ])
+        ]
+        published = []
+        with patch.object(self.hub, 'publish', side_effect=lambda event, data, **kwargs: published.append(data)):
+            self.hub._poll_sync()
+        
+        self.assertEqual([(data["outcome"], data["success"]) for data in published],
+                         [("push_failed", False), ("sync_failed", False), ("success", True)])
+    
+    def test_slow_subscriber_is_dropped(self):
+        """Переполненная очередь отключает подписчика, остальные продолжают получать события"""
+        slow, fast = self.hub.subscribe(), self.hub.subscribe()
+        for number in range(5):
+            self.hub.publish("sync", {"number": number})
+            self._drain(fast)
+        
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(self.hub.subscriber_count, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
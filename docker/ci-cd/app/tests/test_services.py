@@ -0,0 +1,319 @@
+"""
+Тесты сервисов GitSync и PreCommit1C
+"""
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+
+# Добавление пути к модулям приложения
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from precommit1c.precommit_service import PreCommit1CService
+from gitsync.storage_watcher import StorageWatcher
+from gitsync.change_set import build_sonar_inclusions, collect_change_set, metadata_object_for_path
+
+
+@contextmanager
+def _noop_lock(*args, **kwargs):
+    yield
+
+
+class TestPreCommitBatchPush(unittest.TestCase):
+    """Тесты пакетной отправки веток external-file-*"""
+    
+    def setUp(self):
+        self.service = PreCommit1CService()
+        self.service.git_coordinator = Mock()
+        self.service.git_coordinator.acquire_lock.side_effect = _noop_lock
+        self.service.workspace_path = os.getcwd()
+    
+    def _queue(self, issue_id: int, commit_hash: str):
+        self.service._queue_push({
+            "branch": f"external-file-{issue_id}",
+            "commit_hash": commit_hash,
+            "issue_id": issue_id,
+            "external_file_id": issue_id * 10,
+            "decompiled_path": "/tmp/decompiled",
+            "file_info": {"filename": f"file-{issue_id}.epf", "attachment_id": issue_id * 100},
+            "correlation_id": "test"
+        })
+    
+    @patch('precommit1c.precommit_service.subprocess.run')
+    def test_single_push_for_all_branches(self, mock_run):
+        """Все ветки цикла отправляются одной командой git push"""
+        mock_run.return_value = Mock(returncode=0, stdout="", stderr="")
+        self._queue(1, "a" * 40)
+        self._queue(2, "b" * 40)
+        self._queue(1, "c" * 40)
+        
+        with patch.object(self.service, '_complete_pushed_file') as mock_complete:
+            self.service._flush_pending_pushes()
+        
+        mock_run.assert_called_once()
+        self.assertEqual(
+            mock_run.call_args[0][0],
+            ['git', 'push', '--atomic', 'origin', 'external-file-1', 'external-file-2']
+        )
+        self.assertEqual(mock_complete.call_count, 3)
+        self.assertEqual(self.service.pending_pushes, [])
+    
+    @patch('precommit1c.precommit_service.subprocess.run')
+    def test_failed_push_keeps_commits_pending(self, mock_run):
+        """При ошибке отправки пайплайны не запускаются, коммиты остаются в очереди"""
+        mock_run.return_value = Mock(returncode=1, stdout="", stderr="rejected")
+        self._queue(1, "a" * 40)
+        
+        with patch.object(self.service, '_complete_pushed_file') as mock_complete:
+            self.service._flush_pending_pushes()
+        
+        mock_complete.assert_not_called()
+        self.assertEqual(len(self.service.pending_pushes), 1)
+        self.assertTrue(self.service._is_pending_push(100))
+    
+    @patch('precommit1c.precommit_service.subprocess.run')
+    def test_rejected_branch_does_not_block_batch(self, mock_run):
+        """Отклоненная ветка отправляется отдельно и снимается после исчерпания попыток"""
+        def run(cmd, **kwargs):
+            rejected = 'external-file-2' in cmd
+            return Mock(returncode=1 if rejected else 0, stdout="", stderr="rejected" if rejected else "")
+        
+        mock_run.side_effect = run
+        self.service.push_max_attempts = 2
+        self._queue(1, "a" * 40)
+        self._queue(2, "b" * 40)
+        
+        with patch.object(self.service, '_complete_pushed_file') as mock_complete, \
+                patch.object(self.service, '_drop_pending_push') as mock_drop:
+            self.service._flush_pending_pushes()
+            self.assertEqual([c[0][0]["branch"] for c in mock_complete.call_args_list], ['external-file-1'])
+            self.assertEqual([e["branch"] for e in self.service.pending_pushes], ['external-file-2'])
+            
+            self.service._flush_pending_pushes()
+            mock_drop.assert_called_once()
+        
+        self.assertEqual(self.service.pending_pushes, [])
+    
+    def test_flush_window(self):
+        """Отправка по размеру пакета и по истечении окна"""
+        self.service.push_batch_size = 2
+        self.service.push_flush_window = 3600
+        self.assertFalse(self.service._should_flush_pushes())
+        
+        self._queue(1, "a" * 40)
+        self.assertFalse(self.service._should_flush_pushes())
+        
+        self.service.pending_pushes[0]["queued_at"] -= 7200
+        self.assertTrue(self.service._should_flush_pushes())
+        
+        self.service.pending_pushes[0]["queued_at"] += 7200
+        self._queue(2, "b" * 40)
+        self.assertTrue(self.service._should_flush_pushes())
+
+
+
+class TestPreCommitBranchCommit(unittest.TestCase):
+    """Тесты коммита в ветку задачи без checkout"""
+    
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self._git('init', '-q', '-b', 'master')
+        self._git('config', 'user.name', 'test')
+        self._git('config', 'user.email', 'test@ci.local')
+        self._write('src/Configuration.xml', '<cfg/>\n')
+        self._git('add', '-A')
+        self._git('commit', '-q', '-m', 'init')
+        
+        self.service = PreCommit1CService()
+        self.service.workspace_path = self.repo
+        self.service.work_tree = tempfile.mkdtemp()
+        self.service.external_files_path = os.path.join(self.service.work_tree, 'external-files')
+    
+    def _git(self, *args) -> str:
+        return subprocess.run(['git'] + list(args), cwd=self.repo, check=True,
+                              stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    
+    def _write(self, path: str, content: str):
+        full_path = os.path.join(self.repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    
+    def test_commit_keeps_worktree_on_master(self):
+        """Ветка задачи обновляется, рабочее дерево и индекс master не меняются"""
+        master = self._git('rev-parse', 'master')
+        version_dir = self.service._create_version_directory(7)
+        os.makedirs(os.path.join(version_dir, 'decompiled'))
+        with open(os.path.join(version_dir, 'decompiled', 'Form.bsl'), 'w', encoding='utf-8') as f:
+            f.write('Перем А;\n')
+        
+        commit_hash = self.service._commit_to_git('/tmp/Report.erf', 7)
+        
+        self.assertEqual(self._git('rev-parse', 'external-file-7'), commit_hash)
+        self.assertEqual(self._git('rev-parse', 'external-file-7^'), master)
+        self.assertEqual(self._git('symbolic-ref', 'HEAD'), 'refs/heads/master')
+        self.assertEqual(self._git('rev-parse', 'HEAD'), master)
+        self.assertEqual(self._git('diff', '--cached', '--name-only'), '')
+        # Файлы задачи не появляются в рабочем дереве master
+        self.assertEqual(self._git('status', '--porcelain'), '')
+        self.assertIn('external-files/task-7/v1.0/decompiled/Form.bsl',
+                      self._git('ls-tree', '-r', '--name-only', 'external-file-7'))
+        
+        # Повторный коммит без изменений возвращает текущий коммит ветки
+        self.assertEqual(self.service._commit_to_git('/tmp/Report.erf', 7), commit_hash)
+
+
+
+class TestStorageWatcher(unittest.TestCase):
+    """Тесты отслеживания изменений хранилища 1С"""
+    
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.storage_file = os.path.join(self.storage_dir, '1cv8ddb.1CD')
+        with open(self.storage_file, 'wb') as f:
+            f.write(b'v1')
+        self.watcher = StorageWatcher(self.storage_dir, probe_interval=1, debounce_seconds=0)
+    
+    def tearDown(self):
+        self.watcher.close()
+    
+    def _write_new_version(self):
+        with open(self.storage_file, 'ab') as f:
+            f.write(b'v2')
+    
+    def test_no_change_after_mark_synced(self):
+        """Синхронизированное состояние хранилища не запускает следующий цикл"""
+        self.watcher.mark_synced()
+        
+        deadline = time.monotonic() + 1.5
+        self.assertFalse(self.watcher.wait_for_change(lambda: time.monotonic() < deadline))
+    
+    def test_wait_for_change(self):
+        """Ожидание возвращает True после записи новой версии"""
+        self.watcher.mark_synced()
+        timer = threading.Timer(0.2, self._write_new_version)
+        timer.start()
+        
+        deadline = time.monotonic() + 10
+        changed = self.watcher.wait_for_change(lambda: time.monotonic() < deadline)
+        timer.join()
+        
+        self.assertTrue(changed)
+    
+    def test_wait_interrupted_by_shutdown(self):
+        """Остановка сервиса прерывает ожидание"""
+        self.watcher.mark_synced()
+        self.assertFalse(self.watcher.wait_for_change(lambda: False))
+
+
+
+class TestChangeSet(unittest.TestCase):
+    """Тесты извлечения изменений на уровне объектов метаданных"""
+    
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self._git('init', '-q')
+        self._git('config', 'user.name', 'test')
+        self._git('config', 'user.email', 'test@ci.local')
+    
+    def _git(self, *args) -> str:
+        return subprocess.run(['git'] + list(args), cwd=self.repo, check=True,
+                              stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    
+    def _write(self, path: str, content: str):
+        full_path = os.path.join(self.repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    
+    def _commit(self) -> str:
+        self._git('add', '-A')
+        self._git('commit', '-q', '-m', 'change')
+        return self._git('rev-parse', 'HEAD')
+    
+    def test_metadata_object_for_path(self):
+        """Путь файла выгрузки сопоставляется объекту метаданных"""
+        self.assertEqual(metadata_object_for_path('src/cf/Catalogs/Номенклатура/Ext/ObjectModule.bsl'),
+                         ('Catalogs', 'Номенклатура'))
+        self.assertEqual(metadata_object_for_path('Documents/Заказ.xml'), ('Documents', 'Заказ'))
+        self.assertEqual(metadata_object_for_path('Configuration.xml'), ('Other', '*'))
+    
+    def test_collect_change_set(self):
+        """Изменения между коммитами агрегируются по объектам"""
+        self._write('Configuration.xml', '<cfg/>\n')
+        base = self._commit()
+        
+        self._write('Catalogs/Номенклатура.xml', '<catalog/>\n')
+        self._write('Catalogs/Номенклатура/Ext/ObjectModule.bsl', 'Процедура А()\nКонецПроцедуры\n')
+        self._write('CommonModules/ОбщегоНазначения/Ext/Module.bsl', 'Перем А;\n')
+        self._commit()
+        self._write('Documents/Заказ/Ext/ObjectModule.bsl', 'Перем Б;\n')
+        head = self._commit()
+        
+        change_set = collect_change_set(self.repo, head, base=base)
+        
+        self.assertEqual(change_set["files_changed"], 4)
+        self.assertEqual(change_set["lines_added"], 5)
+        objects = {(o["type"], o["name"]): o for o in change_set["objects"]}
+        self.assertEqual(set(objects), {
+            ('Catalogs', 'Номенклатура'),
+            ('CommonModules', 'ОбщегоНазначения'),
+            ('Documents', 'Заказ')
+        })
+        self.assertEqual(objects[('Catalogs', 'Номенклатура')]["files"], 2)
+    
+    def test_build_sonar_inclusions(self):
+        """Область анализа SonarQube строится по объектам, иначе - полный анализ"""
+        objects = [
+            {"type": "Catalogs", "name": "Номенклатура"},
+            {"type": "CommonModules", "name": "ОбщегоНазначения"}
+        ]
+        self.assertEqual(build_sonar_inclusions(objects),
+                         '**/Catalogs/Номенклатура/**,**/Catalogs/Номенклатура.xml,'
+                         '**/CommonModules/ОбщегоНазначения/**,**/CommonModules/ОбщегоНазначения.xml')
+        self.assertIsNone(build_sonar_inclusions(objects, max_objects=1))
+        self.assertIsNone(build_sonar_inclusions(objects + [{"type": "Other", "name": "*"}]))
+        self.assertIsNone(build_sonar_inclusions([]))
+    
+    def test_collect_change_set_without_base(self):
+        """Без базового коммита берутся изменения последнего коммита"""
+        self._write('Catalogs/Валюты.xml', '<catalog/>\n')
+        head = self._commit()
+        
+        change_set = collect_change_set(self.repo, head)
+        
+        self.assertEqual(change_set["files_changed"], 1)
+        self.assertEqual(change_set["objects"][0]["name"], 'Валюты')
+    
+    def test_same_base_and_head(self):
+        """Без новых коммитов изменений нет, коммит head не пересчитывается"""
+        self._write('Catalogs/Валюты.xml', '<catalog/>\n')
+        head = self._commit()
+        
+        change_set = collect_change_set(self.repo, head, base=head)
+        
+        self.assertEqual(change_set["files_changed"], 0)
+        self.assertEqual(change_set["objects"], [])
+    
+    def test_timeout_kills_stuck_git(self):
+        """Таймаут ограничивает и чтение вывода зависшего git"""
+        bin_dir = tempfile.mkdtemp()
+        fake_git = os.path.join(bin_dir, 'git')
+        with open(fake_git, 'w') as f:
+            f.write('#!/bin/sh\nexec sleep 60\n')
+        os.chmod(fake_git, 0o755)
+        
+        started = time.monotonic()
+        with patch.dict(os.environ, {'PATH': bin_dir + os.pathsep + os.environ['PATH']}):
+            with self.assertRaises(subprocess.TimeoutExpired):
+                collect_change_set(self.repo, 'HEAD', timeout=1)
+        self.assertLess(time.monotonic() - started, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
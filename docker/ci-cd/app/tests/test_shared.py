@@ -0,0 +1,870 @@
+"""
+Тесты общих модулей CI/CD контейнера
+"""
+import unittest
+import os
+import sys
+import tempfile
+import glob
+import gzip
+import json
+import logging
+import subprocess
+import threading
+import time
+from unittest.mock import MagicMock, Mock, patch
+
+# Добавление пути к модулям приложения
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2.errors
+
+from shared.git_lock import GitLockCoordinator, GitLockLostError, REPOSITORY_LOCK, _advisory_key
+from shared import logger as logger_module
+from shared.logger import (_LogPipeline, _LogWriterHandler, _OperationTracker, StructuredFormatter,
+                           get_logger, log_operation_error, log_operation_start, log_operation_success,
+                           new_correlation_id)
+from shared.log_index import LogIndex
+from shared.log_writer import LogWriter, LogWriterServer
+from shared.probes import Probe, ProbeRunner
+from shared.process_runner import ProcessRunner
+
+
+class TestProcessRunner(unittest.TestCase):
+    """Тесты потокового запуска процессов"""
+    
+    def setUp(self):
+        self.runs_dir = tempfile.mkdtemp()
+        self.runner = ProcessRunner("test-runner", runs_dir=self.runs_dir,
+                                    tail_lines=5, keep_runs=2, kill_grace_period=1)
+    
+    def test_bounded_tail_and_full_spool(self):
+        """В памяти остается хвост, полный вывод пишется в файл запуска"""
+        lines = []
+        result = self.runner.run(
+            [sys.executable, '-c', 'for i in range(1000): print("line", i)'],
+            run_name="test", timeout=30, on_line=lines.append
+        )
+        
+        self.assertEqual(result["exit_code"], 0)
+        self.assertFalse(result["timed_out"])
+        self.assertEqual(result["output_lines"], 1000)
+        self.assertEqual(len(lines), 1000)
+        self.assertEqual(result["output_tail"].splitlines(), [f"line {i}" for i in range(995, 1000)])
+        
+        with open(result["log_file"], encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 1000)
+    
+    def test_timeout_kills_process_group(self):
+        """Таймаут завершает процесс вместе с дочерними процессами"""
+        script = (
+            'import subprocess, sys, time\n'
+            'subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])\n'
+            'print("started", flush=True)\n'
+            'time.sleep(60)\n'
+        )
+        start = time.time()
+        result = self.runner.run([sys.executable, '-c', script], run_name="test", timeout=1)
+        
+        self.assertTrue(result["timed_out"])
+        self.assertNotEqual(result["exit_code"], 0)
+        self.assertLess(time.time() - start, 30)
+        self.assertIn("started", result["output_tail"])
+    
+    def test_run_logs_rotation(self):
+        """Хранится не более keep_runs файлов запусков"""
+        for _ in range(4):
+            self.runner.run([sys.executable, '-c', 'print(1)'], run_name="test", timeout=30)
+        
+        self.assertEqual(len(os.listdir(self.runs_dir)), 2)
+    
+    def test_missing_binary_leaves_no_run_log(self):
+        """Ошибка запуска не оставляет пустого файла запуска"""
+        with self.assertRaises(FileNotFoundError):
+            self.runner.run(['/nonexistent/precommit1c'], run_name="test", timeout=30)
+        
+        self.assertEqual(os.listdir(self.runs_dir), [])
+
+
+
+class TestGitLockCoordinator(unittest.TestCase):
+    """Тесты очереди блокировки Git"""
+    
+    def setUp(self):
+        self.lock_path = os.path.join(tempfile.mkdtemp(), 'git.lock')
+        self.coordinator = GitLockCoordinator(self.lock_path)
+        self._threads = []
+    
+    def _start_waiter(self, name: str, order: list) -> threading.Thread:
+        def worker():
+            with self.coordinator.acquire_lock(name, timeout=10):
+                order.append(name)
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        # Дожидаемся постановки в очередь, чтобы порядок билетов был детерминирован
+        deadline = time.monotonic() + 5
+        while self.coordinator.get_lock_status()["queue_depth"] < len(self._threads) + 1:
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        self._threads.append(thread)
+        return thread
+    
+    def test_waiters_served_in_order(self):
+        """Ожидающие получают блокировку в порядке очереди"""
+        order = []
+        
+        with self.coordinator.acquire_lock("holder", timeout=5):
+            for name in ("first", "second", "third"):
+                self._start_waiter(name, order)
+            self.assertEqual(self.coordinator.get_lock_status()["queue_depth"], 3)
+        
+        for thread in self._threads:
+            thread.join(10)
+        self.assertEqual(order, ["first", "second", "third"])
+    
+    def test_handoff_without_polling(self):
+        """Ожидающий просыпается сразу после освобождения блокировки"""
+        acquired_at = []
+        
+        def worker():
+            with self.coordinator.acquire_lock("waiter", timeout=10):
+                acquired_at.append(time.monotonic())
+        
+        with self.coordinator.acquire_lock("holder", timeout=5):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            time.sleep(0.2)
+            released_at = time.monotonic()
+        thread.join(10)
+        
+        self.assertLess(acquired_at[0] - released_at, 0.5)
+    
+    def test_timeout_leaves_queue(self):
+        """Ушедший по таймауту пропускается следующим в очереди"""
+        with self.coordinator.acquire_lock("holder", timeout=5):
+            with self.assertRaises(TimeoutError):
+                with self.coordinator.acquire_lock("impatient", timeout=0.2):
+                    pass
+            status = self.coordinator.get_lock_status()
+            self.assertEqual(status["owner"], "holder")
+            self.assertEqual(status["queue_depth"], 0)
+        
+        with self.coordinator.acquire_lock("next", timeout=1):
+            self.assertEqual(self.coordinator.get_lock_status()["owner"], "next")
+    
+    def test_shared_readers_run_together(self):
+        """Разделяемые блокировки не ждут друг друга, исключительная - ждет"""
+        with self.coordinator.acquire_lock("reader-1", timeout=1, shared=True):
+            with self.coordinator.acquire_lock("reader-2", timeout=1, shared=True):
+                self.assertEqual(self.coordinator.get_lock_status()["mode"], "shared")
+            
+            with self.assertRaises(TimeoutError):
+                with self.coordinator.acquire_lock("writer", timeout=0.2):
+                    pass
+    
+    def test_ref_locks(self):
+        """Разные ветки блокируются независимо, одна ветка - исключительно"""
+        with self.coordinator.acquire_lock("gitsync", timeout=1, refs=["master"]):
+            with self.coordinator.acquire_lock("precommit1c", timeout=1, refs=["external-file-1"]):
+                status = self.coordinator.get_lock_status()
+                self.assertEqual(set(status["refs"]), {"master", "external-file-1"})
+            
+            with self.assertRaises(TimeoutError):
+                with self.coordinator.acquire_lock("other", timeout=0.2, refs=["external-file-2", "master"]):
+                    pass
+            
+            # Исключительная блокировка репозитория ждет операций над ветками
+            with self.assertRaises(TimeoutError):
+                with self.coordinator.acquire_lock("maintenance", timeout=0.2):
+                    pass
+        
+        # Таймаут на второй ветке освобождает уже полученные блокировки
+        with self.coordinator.acquire_lock("precommit1c", timeout=1, refs=["external-file-2"]):
+            pass
+
+
+
+class TestGitLockLease(unittest.TestCase):
+    """Тесты аренды блокировки Git и перехвата у зависших держателей"""
+    
+    def setUp(self):
+        self.lock_path = os.path.join(tempfile.mkdtemp(), 'git.lock')
+        self.coordinator = GitLockCoordinator(self.lock_path, lease_ttl=1, heartbeat_interval=0.1)
+    
+    def _hold(self, name: str, release: threading.Event, leases: list, progress: bool = True,
+              **kwargs) -> threading.Thread:
+        def worker():
+            with self.coordinator.acquire_lock(name, timeout=5, **kwargs) as lease:
+                leases.append(lease)
+                # Операция продвигается и продлевает аренду либо зависла без продлений
+                while not release.wait(0.05):
+                    if progress:
+                        lease.renew()
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not leases and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return thread
+    
+    def test_expired_holder_taken_over(self):
+        """Держатель сверх max_hold теряет блокировку, ожидающий не ждет таймаута"""
+        release = threading.Event()
+        leases = []
+        thread = self._hold("stuck", release, leases, max_hold=0.5)
+        
+        started = time.monotonic()
+        with self.coordinator.acquire_lock("next", timeout=5) as lease:
+            self.assertLess(time.monotonic() - started, 3)
+            self.assertTrue(lease.is_valid())
+            self.assertGreater(lease.token, leases[0].token)
+            
+            with self.assertRaises(GitLockLostError):
+                leases[0].check()
+            self.assertEqual(self.coordinator.get_lock_status()["owner"], "next")
+        
+        release.set()
+        thread.join(10)
+    
+    def test_holder_without_progress_taken_over(self):
+        """Живой процесс, переставший продлевать аренду, теряет блокировку через lease_ttl"""
+        release = threading.Event()
+        leases = []
+        thread = self._hold("hung", release, leases, progress=False, max_hold=60)
+        
+        started = time.monotonic()
+        with self.coordinator.acquire_lock("next", timeout=5):
+            self.assertLess(time.monotonic() - started, 3)
+            self.assertFalse(leases[0].renew())
+        
+        release.set()
+        thread.join(10)
+    
+    def test_live_holder_keeps_lock(self):
+        """Продлеваемая аренда в пределах max_hold не перехватывается"""
+        release = threading.Event()
+        leases = []
+        thread = self._hold("busy", release, leases, max_hold=60)
+        
+        with self.assertRaises(TimeoutError):
+            with self.coordinator.acquire_lock("next", timeout=1.5):
+                pass
+        self.assertTrue(leases[0].is_valid())
+        
+        release.set()
+        thread.join(10)
+    
+    def test_silent_holder_with_own_lease_ttl_keeps_lock(self):
+        """Держатель с собственным lease_ttl (долгий шаг 1С без вывода) не теряет блокировку по общему сроку"""
+        release = threading.Event()
+        leases = []
+        thread = self._hold("gitsync", release, leases, progress=False, max_hold=60, lease_ttl=30)
+        
+        with self.assertRaises(TimeoutError):
+            with self.coordinator.acquire_lock("precommit1c", timeout=2):
+                pass
+        self.assertTrue(leases[0].is_valid())
+        
+        release.set()
+        thread.join(10)
+    
+    def test_force_unlock_revokes(self):
+        """Принудительное освобождение отзывает аренду держателя"""
+        release = threading.Event()
+        leases = []
+        thread = self._hold("holder", release, leases)
+        
+        self.assertTrue(self.coordinator.force_unlock("admin"))
+        self.assertFalse(leases[0].is_valid())
+        with self.coordinator.acquire_lock("next", timeout=1):
+            pass
+        
+        release.set()
+        thread.join(10)
+        self.assertFalse(self.coordinator.force_unlock("admin"))
+
+
+
+class TestPostgresGitLock(unittest.TestCase):
+    """Тесты бэкенда advisory locks PostgreSQL без живой базы"""
+    
+    def setUp(self):
+        self.coordinator = GitLockCoordinator(backend='postgres')
+        self.connection = MagicMock(closed=False)
+        self.cursor = self.connection.cursor.return_value.__enter__.return_value
+        patcher = patch.object(self.coordinator.backend, 'connect', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_lock_timeout_raises(self):
+        """Истечение lock_timeout ожидания превращается в TimeoutError, соединение закрывается"""
+        def execute(query, params=None):
+            if query.startswith("SELECT pg_advisory_lock"):
+                raise psycopg2.errors.LockNotAvailable()
+        
+        self.cursor.execute.side_effect = execute
+        self.cursor.fetchone.return_value = (False,)
+        
+        with self.assertRaises(TimeoutError):
+            with self.coordinator.acquire_lock("precommit1c", timeout=1, refs=["external-file-1"]):
+                pass
+        
+        queries = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertIn("SELECT pg_try_advisory_lock_shared(%s, %s)", queries)
+        self.assertIn("SELECT pg_advisory_lock_shared(%s, %s)", queries)
+        self.connection.close.assert_called_once()
+    
+    def test_wait_keeps_queue_position(self):
+        """Ожидание не прерывается для проверки аренд: запрос блокировки ставится в очередь один раз"""
+        self.coordinator.backend.heartbeat_interval = 0.05
+        
+        def execute(query, params=None):
+            if query.startswith("SELECT pg_advisory_lock"):
+                time.sleep(0.3)
+        
+        self.cursor.execute.side_effect = execute
+        self.cursor.fetchone.return_value = (False,)
+        
+        with patch.object(self.coordinator.backend, 'break_expired_holders') as mock_break:
+            with self.coordinator.acquire_lock("gitsync", timeout=5):
+                pass
+        
+        queries = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(queries.count("SELECT pg_advisory_lock(%s, %s)"), 1)
+        self.assertTrue(mock_break.called)
+    
+    def test_status_from_pg_locks(self):
+        """Держатель, возраст и очередь определяются по pg_locks"""
+        repo_key = _advisory_key(REPOSITORY_LOCK)
+        ref_key = _advisory_key("ref:master")
+        rows = [
+            (repo_key, 'ExclusiveLock', True, 101, REPOSITORY_LOCK, 'gitsync', 'cicd', 42, 1700000000, 12.5, 3.0,
+             7, 230, None),
+            (repo_key, 'ShareLock', False, 102, None, None, None, None, None, None, None, None, None, None),
+            (repo_key, 'ExclusiveLock', False, 103, None, None, None, None, None, None, None, None, None, None),
+            (ref_key, 'ExclusiveLock', True, 104, 'ref:master', 'gitsync', 'cicd', 42, 1700000000, 2.0, 1.0,
+             8, 180, 180)
+        ]
+        
+        with patch.object(self.coordinator.backend, '_query_locks', return_value=rows):
+            status = self.coordinator.get_lock_status()
+        
+        self.assertTrue(status["locked"])
+        self.assertEqual(status["owner"], "gitsync")
+        self.assertEqual(status["age_seconds"], 12.5)
+        self.assertEqual(status["queue_depth"], 2)
+        self.assertEqual(status["holders"][0]["pid"], 42)
+        self.assertEqual(status["holders"][0]["token"], 7)
+        self.assertFalse(status["holders"][0]["expired"])
+        self.assertEqual(set(status["refs"]), {"master"})
+
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+    """Тесты сбора метрик сервисов, работающих в отдельных процессах"""
+    
+    def _run(self, code: str, env: dict) -> str:
+        app_dir = os.path.join(os.path.dirname(__file__), '..')
+        result = subprocess.run([sys.executable, '-c', code], cwd=app_dir, env=env, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        return result.stdout
+    
+    def test_metrics_of_other_process_exported(self):
+        """Наблюдения процесса сервиса видны в /metrics другого процесса"""
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(), LOG_ASYNC='false')
+        
+        self._run("from shared.metrics import GIT_LOCK_WAIT_SECONDS\n"
+                  "GIT_LOCK_WAIT_SECONDS.labels(service='gitsync').observe(0.2)", env)
+        output = self._run("from shared.metrics import render_metrics\n"
+                           "print(render_metrics())", env)
+        
+        self.assertIn('ci_cd_git_lock_wait_seconds_count{service="gitsync"} 1.0', output)
+    
+    def test_gauges_of_exited_process_dropped(self):
+        """Значения Gauge завершившегося процесса не попадают в сумму живых процессов"""
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(), LOG_ASYNC='false')
+        
+        self._run("from shared.metrics import ACTIVE_PIPELINES\n"
+                  "ACTIVE_PIPELINES.labels(pipeline_type='gitsync').set(3)", env)
+        output = self._run("from shared.metrics import ACTIVE_PIPELINES, render_metrics\n"
+                           "ACTIVE_PIPELINES.labels(pipeline_type='gitsync').set(1)\n"
+                           "print(render_metrics())", env)
+        
+        self.assertIn('ci_cd_active_pipelines{pipeline_type="gitsync"} 1.0', output)
+    
+    def test_endpoint_label_without_ids(self):
+        """Идентификаторы в пути запроса не создают отдельных меток"""
+        from shared.metrics import endpoint_label
+        
+        self.assertEqual(endpoint_label("projects/12/pipelines/345"), "/projects/:id/pipelines/:id")
+        self.assertEqual(endpoint_label("/issues/7.json?include=attachments"), "/issues/:id.json")
+
+
+class TestWsgi(unittest.TestCase):
+    """Тесты общих частей HTTP сервисов"""
+    
+    def setUp(self):
+        from flask import Flask
+        from shared.wsgi import install_request_timing
+        
+        self.app = Flask("wsgi-test")
+        install_request_timing(self.app, "test-service")
+        self.app.add_url_rule('/items/<item_id>', 'item', lambda item_id: item_id)
+    
+    def test_request_timing_by_route(self):
+        """Длительность запроса учитывается по шаблону маршрута и возвращается в Server-Timing"""
+        from prometheus_client import REGISTRY
+        
+        labels = {"service": "test-service", "method": "GET", "endpoint": "/items/<item_id>", "status": "200"}
+        before = REGISTRY.get_sample_value('ci_cd_http_server_seconds_count', labels) or 0
+        
+        client = self.app.test_client()
+        for item_id in ("1", "2"):
+            response = client.get(f'/items/{item_id}')
+            self.assertTrue(response.headers['Server-Timing'].startswith('app;dur='))
+        
+        self.assertEqual(REGISTRY.get_sample_value('ci_cd_http_server_seconds_count', labels), before + 2)
+    
+    def test_worker_startup_continues_after_failure(self):
+        """Ошибка одного действия старта воркера не отменяет остальные"""
+        from shared.wsgi import on_worker_start, start_worker
+        
+        started = []
+        on_worker_start(self.app, Mock(side_effect=RuntimeError("postgres unavailable")))
+        on_worker_start(self.app, lambda: started.append("upstream_status"))
+        start_worker(self.app)
+        
+        self.assertEqual(started, ["upstream_status"])
+
+
+class _SlowHandler(logging.Handler):
+    """Обработчик, имитирующий медленную запись на диск"""
+    
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.delay = delay
+        self.gate = threading.Event()
+        self.messages = []
+    
+    def emit(self, record):
+        self.gate.wait(5)
+        time.sleep(self.delay)
+        self.messages.append(record.getMessage())
+
+
+class TestAsyncLogging(unittest.TestCase):
+    """Тесты асинхронной записи логов через ограниченную очередь"""
+    
+    def _make_logger(self, name: str, handler: logging.Handler, **env) -> tuple:
+        with patch.dict(os.environ, env):
+            pipeline = _LogPipeline()
+        self.addCleanup(pipeline.stop)
+        
+        logger = logging.getLogger(name)
+        logger.handlers = [pipeline.register(name, [handler])]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        return pipeline, logger
+    
+    def test_caller_does_not_wait_for_io(self):
+        """Вызывающий поток не ждет записи, запись выполняется в порядке поступления"""
+        handler = _SlowHandler(delay=0.01)
+        pipeline, logger = self._make_logger("test-async", handler)
+        
+        started = time.monotonic()
+        for i in range(20):
+            logger.info("message %s", i)
+        self.assertLess(time.monotonic() - started, 0.1)
+        
+        handler.gate.set()
+        self.assertTrue(pipeline.flush(5))
+        self.assertEqual(handler.messages, [f"message {i}" for i in range(20)])
+    
+    def test_drop_new_counts_overflow(self):
+        """При переполнении новые записи отбрасываются и учитываются"""
+        handler = _SlowHandler()
+        pipeline, logger = self._make_logger("test-drop-new", handler, LOG_QUEUE_SIZE='5',
+                                             LOG_QUEUE_BLOCK_TIMEOUT='0')
+        
+        for i in range(20):
+            logger.info("message %s", i)
+        
+        handler.gate.set()
+        pipeline.flush(5)
+        # Первая запись могла уже уйти в поток записи до переполнения
+        self.assertIn(pipeline.dropped["test-drop-new"], (14, 15))
+        self.assertEqual(handler.messages[0], "message 0")
+        self.assertIn("Log queue overflow, records dropped", handler.messages)
+    
+    def test_drop_oldest_keeps_recent(self):
+        """Политика drop_oldest сохраняет последние записи"""
+        handler = _SlowHandler()
+        pipeline, logger = self._make_logger("test-drop-oldest", handler, LOG_QUEUE_SIZE='5',
+                                             LOG_QUEUE_DROP_POLICY='drop_oldest',
+                                             LOG_QUEUE_BLOCK_TIMEOUT='0')
+        
+        for i in range(20):
+            logger.info("message %s", i)
+        
+        handler.gate.set()
+        pipeline.flush(5)
+        self.assertIn("message 19", handler.messages)
+        self.assertNotIn("message 10", handler.messages)
+
+
+class TestStructuredFormatter(unittest.TestCase):
+    """Тесты быстрого пути форматирования записей"""
+    
+    def _record(self, created: float) -> logging.LogRecord:
+        record = logging.LogRecord("test-format", logging.INFO, __file__, 0, "value %s", (1,), None)
+        record.created = created
+        record.component = "format"
+        record.correlation_id = "abc"
+        record.details = {"big": 2 ** 70, "path": "/tmp"}
+        return record
+    
+    def test_format_matches_fields(self):
+        """Поля записи и время совпадают со стандартной сериализацией, запись форматируется один раз"""
+        formatter = StructuredFormatter("test-format")
+        record = self._record(1700000000.25)
+        
+        line = formatter.format(record)
+        entry = json.loads(line)
+        self.assertEqual(entry["timestamp"], "2023-11-14T22:13:20.250000Z")
+        self.assertEqual(entry["message"], "value 1")
+        self.assertEqual(entry["details"], {"big": 2 ** 70, "path": "/tmp"})
+        self.assertEqual(json.loads(logger_module._dumps_stdlib(entry)), entry)
+        
+        with patch.object(logger_module, '_dumps') as mock_dumps:
+            self.assertEqual(StructuredFormatter("test-format").format(record), line)
+        mock_dumps.assert_not_called()
+    
+    def test_disabled_level_builds_nothing(self):
+        """Запись отключенного уровня не получает идентификатор корреляции"""
+        ci_logger = get_logger("test-format-level", "INFO")
+        with patch.object(logger_module, 'new_correlation_id') as mock_id:
+            ci_logger.debug("skipped", details={"i": 1})
+        mock_id.assert_not_called()
+    
+    def test_correlation_ids_unique(self):
+        ids = [new_correlation_id() for _ in range(1000)]
+        self.assertEqual(len(set(ids)), 1000)
+        # Префикс процесса - 64 случайных бита
+        self.assertEqual({correlation_id[:16] for correlation_id in ids}, {ids[0][:16]})
+        self.assertEqual(len(ids[0]), 20)
+
+
+class TestOperationSampling(unittest.TestCase):
+    """Тесты выборки записей log_operation_* и сводок по операциям"""
+    
+    def _tracker(self, **env) -> _OperationTracker:
+        with patch.dict(os.environ, env):
+            return _OperationTracker()
+    
+    def test_rate_limit_folds_into_summary(self):
+        """Сверх лимита записи подавляются, но учитываются в сводке"""
+        tracker = self._tracker(LOG_OPERATION_RATE_LIMIT='2')
+        
+        written = []
+        for i in range(10):
+            correlation_id = f"op{i}"
+            started = tracker.start("svc", "query", correlation_id)
+            finished, duration = tracker.finish("svc", "query", correlation_id, failed=False)
+            written.append((started, finished))
+            self.assertIsNotNone(duration)
+        
+        self.assertEqual(written.count((True, True)), 2)
+        self.assertEqual(written.count((False, False)), 8)
+        
+        summary = tracker.take_summaries(force=True)["svc"]["operations"]["query"]
+        self.assertEqual(summary["count"], 10)
+        self.assertEqual(summary["errors"], 0)
+        self.assertEqual(summary["suppressed"], 16)
+        self.assertIn("p95", summary)
+        self.assertEqual(tracker.take_summaries(force=True), {})
+    
+    def test_errors_and_slow_operations_always_written(self):
+        """Ошибки и медленные операции пишутся, даже если начало не попало в выборку"""
+        tracker = self._tracker(LOG_OPERATION_SAMPLE_RATE='0', LOG_OPERATION_SLOW_SECONDS='0.05')
+        
+        self.assertFalse(tracker.start("svc", "download", "failed"))
+        self.assertTrue(tracker.finish("svc", "download", "failed", failed=True)[0])
+        
+        self.assertFalse(tracker.start("svc", "download", "slow"))
+        time.sleep(0.06)
+        self.assertTrue(tracker.finish("svc", "download", "slow", failed=False)[0])
+        
+        self.assertFalse(tracker.start("svc", "download", "fast"))
+        self.assertFalse(tracker.finish("svc", "download", "fast", failed=False)[0])
+        
+        summary = tracker.take_summaries(force=True)["svc"]["operations"]["download"]
+        self.assertEqual((summary["count"], summary["errors"]), (3, 1))
+    
+    def test_summary_written_without_further_operations(self):
+        """Сводка окна пишется по таймеру, даже если операций больше нет"""
+        tracker = self._tracker(LOG_OPERATION_SUMMARY_INTERVAL='0.2')
+        tracker.start("svc", "query", "op1")
+        tracker.finish("svc", "query", "op1", failed=False)
+        
+        with patch('shared.logger.get_logger') as get_logger_mock:
+            deadline = time.monotonic() + 5
+            while not get_logger_mock.return_value.info.called and time.monotonic() < deadline:
+                time.sleep(0.05)
+        
+        get_logger_mock.assert_called_with("svc")
+        summary = get_logger_mock.return_value.info.call_args[1]["details"]
+        self.assertEqual(summary["operations"]["query"]["count"], 1)
+        # Окно сброшено: завершение процесса не повторит сводку
+        self.assertEqual(tracker.take_summaries(force=True), {})
+        tracker._timer_pid = None
+    
+    def test_durations_feed_histogram(self):
+        """Длительности операций попадают в гистограмму по сервису и операции"""
+        from prometheus_client import REGISTRY
+        labels = {"service": "test-metrics", "operation": "query"}
+        before = REGISTRY.get_sample_value('ci_cd_operation_duration_seconds_count', labels) or 0
+        
+        correlation_id = log_operation_start("test-metrics", "query")
+        log_operation_success("test-metrics", "query", correlation_id)
+        correlation_id = log_operation_start("test-metrics", "query")
+        log_operation_error("test-metrics", "query", correlation_id, ValueError("boom"))
+        
+        self.assertEqual(REGISTRY.get_sample_value('ci_cd_operation_duration_seconds_count', labels), before + 2)
+        self.assertGreaterEqual(REGISTRY.get_sample_value('ci_cd_operation_errors_total', labels), 1)
+    
+    def test_started_map_is_bounded(self):
+        tracker = self._tracker(LOG_OPERATION_TRACK_LIMIT='3')
+        for i in range(5):
+            tracker.start("svc", "query", f"op{i}")
+        # Вытесненное начало: длительность неизвестна, запись пишется
+        self.assertEqual(tracker.finish("svc", "query", "op0", failed=False), (True, None))
+        self.assertIsNotNone(tracker.finish("svc", "query", "op4", failed=False)[1])
+
+
+class TestLogWriter(unittest.TestCase):
+    """Тесты записи логов нескольких процессов через процесс записи"""
+    
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(tempfile.mkdtemp(), 'writer.sock')
+    
+    def _handler(self, name: str) -> _LogWriterHandler:
+        handler = _LogWriterHandler(self.socket_path, name, self.log_dir)
+        handler.setFormatter(StructuredFormatter(name))
+        self.addCleanup(handler.close)
+        return handler
+    
+    def _emit(self, handler: logging.Handler, name: str, count: int, sender: str):
+        for i in range(count):
+            record = logging.LogRecord(name, logging.INFO, __file__, 0, "%s %s", (sender, i), None)
+            handler.handle(record)
+    
+    def test_shared_logger_name_rotates_without_loss(self):
+        """Одноименные логгеры разных отправителей не теряют строк при ротации"""
+        writer = LogWriter(self.log_dir, max_bytes=4000, backup_count=50)
+        server = LogWriterServer(self.socket_path, writer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        senders = [threading.Thread(target=self._emit,
+                                    args=(self._handler("postgres_client"), "postgres_client", 200, sender))
+                   for sender in ("gitsync", "precommit1c")]
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join(10)
+        
+        deadline = time.monotonic() + 5
+        while writer.records.get("postgres_client", 0) < 400 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.shutdown()
+        server.server_close()
+        writer.close()
+        
+        archives = glob.glob(os.path.join(self.log_dir, "postgres_client.log.*.gz"))
+        self.assertTrue(archives)
+        lines = []
+        for path in archives:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                lines += f.read().splitlines()
+        with open(os.path.join(self.log_dir, "postgres_client.log"), encoding='utf-8') as f:
+            lines += f.read().splitlines()
+        
+        messages = sorted(json.loads(line)["message"] for line in lines)
+        expected = sorted(f"{sender} {i}" for sender in ("gitsync", "precommit1c") for i in range(200))
+        self.assertEqual(messages, expected)
+    
+    def test_fallback_without_writer(self):
+        """Без процесса записи строки пишутся в файл этого процесса"""
+        self._emit(self._handler("gitsync"), "gitsync", 3, "gitsync")
+        
+        with open(os.path.join(self.log_dir, f"gitsync.{os.getpid()}.log"), encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.log_dir, "gitsync.log")))
+    
+    def test_fallback_capped_and_ingested_by_writer(self):
+        """Резервный файл ограничен по размеру, процесс записи переносит его в общий лог и удаляет"""
+        handler = self._handler("gitsync")
+        handler.fallback_max_bytes = 2000
+        self._emit(handler, "gitsync", 40, "gitsync")
+        
+        fallback = os.path.join(self.log_dir, f"gitsync.{os.getpid()}.log")
+        self.assertLessEqual(os.path.getsize(fallback), 2000)
+        self.assertLessEqual(os.path.getsize(fallback + ".1"), 2000)
+        kept = sum(1 for path in (fallback, fallback + ".1") for _ in open(path, encoding='utf-8'))
+        
+        writer = LogWriter(self.log_dir)
+        self.addCleanup(writer.close)
+        self.assertEqual(writer.ingest_fallback_files(min_age=0), kept)
+        self.assertFalse(os.path.exists(fallback) or os.path.exists(fallback + ".1"))
+        with open(os.path.join(self.log_dir, "gitsync.log"), encoding='utf-8') as f:
+            messages = [json.loads(line)["message"] for line in f]
+        self.assertEqual(messages, [f"gitsync {i}" for i in range(40 - kept, 40)])
+        
+        # Удаленный файл создается заново при следующей записи без процесса записи
+        self._emit(handler, "gitsync", 1, "gitsync")
+        self.assertTrue(os.path.exists(fallback))
+
+
+class TestLogIndex(unittest.TestCase):
+    """Тесты индекса логов, пополняемого процессом записи"""
+    
+    def _line(self, service: str, message: str, correlation_id: str, created: float, **fields) -> bytes:
+        formatter = StructuredFormatter(service)
+        record = logging.LogRecord(service, logging.INFO, __file__, 0, message, None, None)
+        record.created = created
+        record.component = fields.pop("component", "operation")
+        record.correlation_id = correlation_id
+        for name, value in fields.items():
+            setattr(record, name, value)
+        return (formatter.format(record) + "\n").encode('utf-8')
+    
+    def test_trace_across_services(self):
+        """Трассировка операции собирает записи всех логгеров в порядке времени"""
+        log_dir = tempfile.mkdtemp()
+        index = LogIndex(os.path.join(log_dir, "log-index.db"))
+        writer = LogWriter(log_dir, index=index)
+        base = float(int(time.time()))
+        
+        writer.write("gitsync", self._line("gitsync", "Starting sync_cycle", "c1", base, operation="sync_cycle"))
+        writer.write("postgres_client", self._line("postgres_client", "Query executed", "c1", base + 1.5,
+                                                   component="query"))
+        writer.write("gitsync", self._line("gitsync", "Starting git_push", "c2", base + 2, operation="git_push"))
+        writer.write("gitsync", self._line("gitsync", "Completed sync_cycle successfully", "c1", base + 3,
+                                           operation="sync_cycle"))
+        writer.write("gitsync", b"not json\n")
+        writer.close()
+        
+        trace = index.trace("c1")
+        self.assertEqual(trace["count"], 3)
+        self.assertEqual(trace["services"], ["gitsync", "postgres_client"])
+        self.assertEqual(trace["operations"], ["sync_cycle"])
+        self.assertEqual(trace["duration"], 3.0)
+        self.assertEqual(trace["records"][1]["logger"], "postgres_client")
+        
+        # Запись внутри операции получает ее имя по correlation_id
+        by_operation = index.search(operation="sync_cycle")
+        self.assertEqual([entry["message"] for entry in by_operation],
+                         ["Starting sync_cycle", "Query executed", "Completed sync_cycle successfully"])
+        
+        self.assertEqual(len(index.search(service="gitsync", since=base + 1)), 2)
+        self.assertEqual([entry["correlation_id"] for entry in index.search(text="git_push")], ["c2"])
+        self.assertEqual(index.trace("missing")["count"], 0)
+
+
+class TestProbeRunner(unittest.TestCase):
+    """Тесты параллельного выполнения проверок"""
+    
+    def _sleeping(self, seconds: float, calls: list = None):
+        def check():
+            if calls is not None:
+                calls.append(1)
+            time.sleep(seconds)
+            return {"status": "healthy"}
+        return check
+    
+    def test_probes_run_concurrently(self):
+        """Полная проверка длится как самая медленная проверка, а не сумма"""
+        runner = ProbeRunner(Probe(f"p{i}", self._sleeping(0.3)) for i in range(4))
+        
+        started = time.monotonic()
+        results = runner.run()
+        
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(list(results), ["p0", "p1", "p2", "p3"])
+        self.assertTrue(all(result["status"] == "healthy" for result in results.values()))
+    
+    def test_timeouts_and_deadline(self):
+        """Зависшая проверка получает unhealthy по своему таймауту или общему сроку"""
+        def failing():
+            raise RuntimeError("connection refused")
+        
+        runner = ProbeRunner([Probe("slow", self._sleeping(1.0), timeout=0.2),
+                              Probe("fast", self._sleeping(0.0)),
+                              Probe("broken", failing)])
+        results = runner.run()
+        self.assertTrue(results["slow"]["timed_out"])
+        self.assertIn("0.2", results["slow"]["error"])
+        self.assertEqual(results["fast"]["status"], "healthy")
+        self.assertEqual(results["broken"], {"status": "unhealthy", "error": "connection refused"})
+        
+        runner = ProbeRunner([Probe("slow", self._sleeping(1.0), timeout=5.0)], deadline=0.2)
+        self.assertIn("deadline", runner.run()["slow"]["error"])
+    
+    def test_results_cached_and_inflight_shared(self):
+        """Результат кэшируется; повторный запуск ждет уже выполняющуюся проверку"""
+        calls = []
+        runner = ProbeRunner([Probe("gitlab", self._sleeping(0.3, calls), timeout=0.2, cache_ttl=60)])
+        
+        self.assertTrue(runner.run()["gitlab"]["timed_out"])
+        self.assertEqual(runner.run()["gitlab"]["status"], "healthy")
+        self.assertEqual(runner.run()["gitlab"]["status"], "healthy")
+        self.assertEqual(len(calls), 1)
+
+
+class TestHealthSnapshot(unittest.TestCase):
+    """Тесты фонового снимка состояния для /health"""
+    
+    def setUp(self):
+        from shared.health_check import HealthChecker, HealthSnapshot
+        self.checker = HealthChecker()
+        self.snapshot = HealthSnapshot(self.checker)
+    
+    def test_supervisor_status_parsed_from_single_call(self):
+        """Состояние всех программ берется из одного вызова supervisorctl"""
+        output = ("gitsync                          RUNNING   pid 12, uptime 0:10:00\n"
+                  "precommit1c                      BACKOFF   Exited too quickly\n")
+        completed = subprocess.CompletedProcess([], 3, stdout=output, stderr="")
+        with patch('shared.health_check.subprocess.run', return_value=completed) as run:
+            programs = self.checker.check_supervisor_programs()
+        
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(programs["gitsync"]["status"], "healthy")
+        self.assertEqual(programs["precommit1c"]["status"], "unhealthy")
+    
+    def test_status_served_from_snapshot_with_staleness(self):
+        """Статус строится из сохраненных результатов; устаревший результат снижает статус"""
+        healthy = {name: {"status": "healthy"} for name in ("gitsync", "precommit1c")}
+        self.snapshot.runner.probes["supervisor"].check = lambda: healthy
+        
+        status = self.snapshot.status()
+        self.assertEqual(status["status"], "degraded")
+        self.assertTrue(status["services"]["gitsync"]["stale"])
+        
+        self.snapshot.refresh("supervisor")
+        status = self.snapshot.status()
+        self.assertEqual(status["status"], "healthy")
+        self.assertFalse(status["services"]["gitsync"]["stale"])
+        self.assertIsNotNone(status["services"]["gitsync"]["checked_at"])
+        
+        # Результат старше трех интервалов обновления
+        self.snapshot._results["supervisor"]["checked_at"] -= 31
+        status = self.snapshot.status()
+        self.assertTrue(status["services"]["precommit1c"]["stale"])
+        self.assertEqual(status["status"], "degraded")
+
+
+if __name__ == '__main__':
+    unittest.main()
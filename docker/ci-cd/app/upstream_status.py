@@ -0,0 +1,148 @@
+"""
+Upstream Status - кэш состояния внешних сервисов для /status и /dashboard API сервера
+
+Состояние PostgreSQL, GitLab, Redmine и SonarQube обновляется в фоновом
+потоке раз в UPSTREAM_STATUS_INTERVAL секунд однократными проверками без
+повторов (ProbeRunner, таймаут UPSTREAM_PROBE_TIMEOUT). Запросы к API
+отдают последний снимок и не ждут внешние сервисы.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Добавление пути к shared модулям
+sys.path.append('/app')
+
+from shared.logger import get_logger
+from shared.probes import Probe, ProbeRunner
+from integrations import get_gitlab_client, get_postgres_client, get_redmine_client, get_sonarqube_client
+
+
+logger = get_logger("upstream_status")
+
+UPSTREAM_SERVICES = ("postgresql", "gitlab", "redmine", "sonarqube")
+
+
+class UpstreamStatusCache:
+    """Снимок состояния внешних сервисов, обновляемый в фоне"""
+    
+    def __init__(self, interval: float = None, probe_timeout: float = None):
+        self.interval = interval or float(os.getenv('UPSTREAM_STATUS_INTERVAL', '30'))
+        self.probe_timeout = probe_timeout or float(os.getenv('UPSTREAM_PROBE_TIMEOUT', '5'))
+        
+        # Таймаут проверки чуть больше таймаута HTTP запроса: ошибку сообщает клиент, а не срок
+        timeout = self.probe_timeout + 1
+        self.runner = ProbeRunner([
+            Probe("postgresql", self._check_postgres, timeout=timeout),
+            Probe("gitlab", lambda: get_gitlab_client().check_health(timeout=self.probe_timeout), timeout=timeout),
+            Probe("redmine", lambda: get_redmine_client().check_health(timeout=self.probe_timeout), timeout=timeout),
+            Probe("sonarqube", lambda: get_sonarqube_client().check_health(timeout=self.probe_timeout),
+                  timeout=timeout),
+            Probe("statistics", self._collect_statistics, timeout=timeout)
+        ], deadline=timeout)
+        
+        self._snapshot: Dict[str, Any] = {
+            "services": {name: {"status": "unknown"} for name in UPSTREAM_SERVICES},
+            "statistics": {},
+            "checked_at": None
+        }
+        self._etag = self._make_etag(self._snapshot)
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = False
+    
+    def _check_postgres(self) -> Dict[str, Any]:
+        try:
+            result = get_postgres_client().execute_query(
+                "SELECT COUNT(*) as count FROM integration_config", fetch=True
+            )
+            return {"status": "healthy", "config_entries": result[0]['count'] if result else 0}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
+    def _collect_statistics(self) -> Dict[str, Any]:
+        result = get_postgres_client().execute_query(
+            "SELECT COUNT(*) as count FROM pipelines WHERE DATE(triggered_at) = CURRENT_DATE",
+            fetch=True
+        )
+        return {"pipelines_today": result[0]['count'] if result else 0}
+    
+    @staticmethod
+    def _make_etag(snapshot: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(snapshot, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def refresh(self):
+        """Однократная проверка всех сервисов и замена снимка"""
+        results = self.runner.run()
+        statistics = results.pop("statistics")
+        snapshot = {
+            "services": results,
+            # Статистика недоступна (ошибка или таймаут проверки) - нулевые значения
+            "statistics": statistics if "status" not in statistics else {"pipelines_today": 0},
+            "checked_at": datetime.utcnow().isoformat() + "Z"
+        }
+        etag = self._make_etag(snapshot)
+        
+        with self._lock:
+            self._snapshot, self._etag = snapshot, etag
+            self._refreshed_at = time.monotonic()
+        
+        logger.debug("Upstream status refreshed",
+                    component="upstream_status",
+                    details={name: result.get("status") for name, result in results.items()})
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Failed to refresh upstream status",
+                            component="upstream_status",
+                            details={"error": str(e)})
+            self._stop.wait(self.interval)
+    
+    def start(self):
+        """Запуск фонового обновления; повторный вызов ничего не делает"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="upstream-status", daemon=True).start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def get(self) -> Tuple[Dict[str, Any], str]:
+        """Последний снимок и его ETag"""
+        with self._lock:
+            return self._snapshot, self._etag
+    
+    def max_age(self) -> int:
+        """Секунды до следующего обновления - срок кэширования ответа клиентом"""
+        with self._lock:
+            refreshed_at = self._refreshed_at
+        if not refreshed_at:
+            return 0
+        return max(0, int(self.interval - (time.monotonic() - refreshed_at)))
+
+
+# Глобальный экземпляр кэша
+_upstream_status: Optional[UpstreamStatusCache] = None
+_upstream_status_lock = threading.Lock()
+
+
+def get_upstream_status() -> UpstreamStatusCache:
+    """Получение кэша состояния внешних сервисов с запущенным обновлением"""
+    global _upstream_status
+    if _upstream_status is None:
+        with _upstream_status_lock:
+            if _upstream_status is None:
+                _upstream_status = UpstreamStatusCache()
+    _upstream_status.start()
+    return _upstream_status
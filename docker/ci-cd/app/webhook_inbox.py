@@ -0,0 +1,248 @@
+"""
+Webhook Inbox - прием webhook'ов через таблицу webhook_inbox
+
+API сервер не разбирает и не обрабатывает webhook в запросе: тело
+сохраняется в webhook_inbox без изменений, и GitLab/SonarQube получают
+ответ 202 сразу после записи. Запросы, пришедшие одновременно, пишутся
+одним многострочным INSERT (групповая фиксация), поэтому при всплеске
+webhook'ов число запросов к БД растет медленнее числа запросов к API.
+Повторная доставка с тем же delivery_id не добавляет строку.
+
+Сохраненные webhook'и обрабатывает WebhookInboxProcessor в процессе
+pipeline-coordinator: события пайплайнов проверяют отслеживаемый пайплайн
+сразу, не дожидаясь цикла мониторинга.
+"""
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+# Добавление пути к shared модулям
+sys.path.append('/app')
+
+from shared.logger import get_logger, log_operation_start, log_operation_success
+from integrations import get_postgres_client
+
+
+logger = get_logger("webhook_inbox")
+
+# Заголовки с идентификатором доставки в порядке предпочтения
+DELIVERY_ID_HEADERS = ("X-Gitlab-Event-UUID", "Idempotency-Key", "X-Request-Id")
+
+# Заголовки с секретами не сохраняются
+_SECRET_HEADERS = {"x-gitlab-token", "authorization", "cookie", "x-sonar-webhook-hmac-sha256"}
+
+
+def delivery_id(headers: Dict[str, str], body: bytes) -> str:
+    """
+    Идентификатор доставки webhook'а
+    
+    Заголовок отправителя, если он есть; иначе хэш тела - повторная
+    отправка того же события (curl из .gitlab-ci.yml, SonarQube) дает тот же идентификатор.
+    """
+    for header in DELIVERY_ID_HEADERS:
+        value = headers.get(header)
+        if value:
+            return value[:200]
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+def stored_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Заголовки запроса без секретов"""
+    return {name: value for name, value in headers.items() if name.lower() not in _SECRET_HEADERS}
+
+
+class _PendingWebhook:
+    """Webhook, ожидающий записи, и результат записи"""
+    
+    def __init__(self, webhook: Dict[str, Any]):
+        self.webhook = webhook
+        self.done = threading.Event()
+        self.inserted = False
+        self.error: Optional[Exception] = None
+
+
+class WebhookInbox:
+    """Запись webhook'ов в webhook_inbox с групповой фиксацией"""
+    
+    def __init__(self, batch_size: int = None, ack_timeout: float = None):
+        self.batch_size = batch_size or int(os.getenv('WEBHOOK_INBOX_BATCH_SIZE', '200'))
+        self.ack_timeout = ack_timeout or float(os.getenv('WEBHOOK_INBOX_ACK_TIMEOUT', '5'))
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+    
+    def append(self, source: str, delivery_id: str, event_type: Optional[str],
+               headers: Dict[str, str], body: bytes) -> bool:
+        """
+        Запись webhook'а; возврат после фиксации в БД
+        
+        Returns:
+            bool: False если webhook с этим delivery_id уже сохранен
+        
+        Raises:
+            TimeoutError: Запись не завершилась за ack_timeout
+            Exception: Ошибка записи в БД
+        """
+        pending = _PendingWebhook({"source": source, "delivery_id": delivery_id, "event_type": event_type,
+                                   "headers": headers, "body": body})
+        self._start()
+        self._queue.put(pending)
+        
+        if not pending.done.wait(self.ack_timeout):
+            raise TimeoutError(f"Webhook inbox write not confirmed within {self.ack_timeout}s")
+        if pending.error is not None:
+            raise pending.error
+        return pending.inserted
+    
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="webhook-inbox-writer", daemon=True).start()
+    
+    def _run(self):
+        while True:
+            # Пока идет запись пачки, новые webhook'и накапливаются в очереди для следующей
+            batch: List[_PendingWebhook] = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+    
+    def _write(self, batch: List[_PendingWebhook]):
+        # Повторы внутри пачки: INSERT ... ON CONFLICT не допускает одинаковых ключей в одном запросе
+        unique: Dict[tuple, Dict[str, Any]] = {}
+        for pending in batch:
+            unique.setdefault((pending.webhook["source"], pending.webhook["delivery_id"]), pending.webhook)
+        
+        try:
+            inserted = set(get_postgres_client().append_webhooks(list(unique.values())))
+            claimed = set()
+            for pending in batch:
+                key = (pending.webhook["source"], pending.webhook["delivery_id"])
+                # Новой считается только первая из одинаковых доставок
+                pending.inserted = key in inserted and key not in claimed
+                claimed.add(key)
+        except Exception as e:
+            logger.error("Failed to write webhooks to inbox",
+                        component="inbox_writer",
+                        details={"webhooks": len(batch), "error": str(e)})
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+class WebhookInboxProcessor:
+    """Обработка сохраненных webhook'ов"""
+    
+    # Статусы пайплайна GitLab, после которых он не меняется
+    FINISHED_STATUSES = ('success', 'failed', 'canceled', 'skipped')
+    
+    def __init__(self, coordinator, batch_size: int = None, max_attempts: int = None):
+        self.coordinator = coordinator
+        self.batch_size = batch_size or int(os.getenv('WEBHOOK_INBOX_PROCESS_BATCH', '100'))
+        self.max_attempts = max_attempts or int(os.getenv('WEBHOOK_INBOX_MAX_ATTEMPTS', '5'))
+        self.reclaim_after = int(os.getenv('WEBHOOK_INBOX_RECLAIM_SECONDS', '300'))
+        self.postgres_client = get_postgres_client()
+        self.handlers = {
+            "gitlab": self._handle_gitlab,
+            "sonarqube": self._handle_sonarqube,
+            "pipeline_completed": self._handle_pipeline_notification,
+            "external_file_analyzed": self._handle_pipeline_notification
+        }
+    
+    def process_pending(self) -> Dict[str, int]:
+        """
+        Обработка очередной пачки webhook'ов
+        
+        Returns:
+            Dict[str, int]: Число webhook'ов по итоговому статусу
+        """
+        webhooks = self.postgres_client.claim_webhooks(self.batch_size, self.reclaim_after)
+        if not webhooks:
+            return {}
+        
+        correlation_id = log_operation_start("webhook_inbox", "process_webhooks", {"webhooks": len(webhooks)})
+        counts: Dict[str, int] = {}
+        for webhook in webhooks:
+            status, error = self._process(webhook)
+            self.postgres_client.complete_webhook(webhook["id"], status, error)
+            counts[status] = counts.get(status, 0) + 1
+        
+        log_operation_success("webhook_inbox", "process_webhooks", correlation_id, counts)
+        return counts
+    
+    def _process(self, webhook: Dict[str, Any]) -> tuple:
+        handler = self.handlers.get(webhook["source"])
+        if handler is None:
+            return "ignored", f"Unknown webhook source: {webhook['source']}"
+        
+        try:
+            payload = json.loads(webhook["body"].decode('utf-8') or '{}')
+            return ("done" if handler(webhook, payload) else "ignored"), None
+        except Exception as e:
+            # Ошибка разбора или обработки: повтор до max_attempts
+            status = "pending" if webhook["attempts"] < self.max_attempts else "failed"
+            logger.error("Failed to process webhook",
+                        component="webhook_processor",
+                        details={"webhook_id": webhook["id"], "source": webhook["source"],
+                                 "attempts": webhook["attempts"], "status": status, "error": str(e)})
+            return status, str(e)
+    
+    def _handle_pipeline(self, gitlab_pipeline_id) -> bool:
+        if gitlab_pipeline_id in (None, ""):
+            return False
+        return self.coordinator.handle_pipeline_event(int(gitlab_pipeline_id))
+    
+    def _handle_gitlab(self, webhook: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        logger.info("Processing GitLab webhook",
+                   component="webhook_processor",
+                   details={"event_type": webhook["event_type"], "delivery_id": webhook["delivery_id"]})
+        
+        if webhook["event_type"] != 'Pipeline Hook':
+            return False
+        attributes = payload.get('object_attributes', {})
+        if attributes.get('status') not in self.FINISHED_STATUSES:
+            return False
+        return self._handle_pipeline(attributes.get('id'))
+    
+    def _handle_pipeline_notification(self, webhook: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        """Уведомление job'а notify из .gitlab-ci.yml: статус пайплайна запрашивается у GitLab"""
+        logger.info("Processing pipeline notification",
+                   component="webhook_processor",
+                   details={"source": webhook["source"], "pipeline_id": payload.get('pipeline_id'),
+                            "status": payload.get('status')})
+        return self._handle_pipeline(payload.get('pipeline_id'))
+    
+    def _handle_sonarqube(self, webhook: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        # Результаты анализа забирает обработчик завершения пайплайна; webhook фиксируется в логе
+        logger.info("Processing SonarQube webhook",
+                   component="webhook_processor",
+                   details={"project": payload.get('project', {}).get('key'),
+                            "task_id": payload.get('taskId'),
+                            "quality_gate": payload.get('qualityGate', {}).get('status')})
+        return True
+
+
+# Глобальный экземпляр записи webhook'ов
+_webhook_inbox: Optional[WebhookInbox] = None
+_webhook_inbox_lock = threading.Lock()
+
+
+def get_webhook_inbox() -> WebhookInbox:
+    """Получение записи webhook'ов процесса"""
+    global _webhook_inbox
+    if _webhook_inbox is None:
+        with _webhook_inbox_lock:
+            if _webhook_inbox is None:
+                _webhook_inbox = WebhookInbox()
+    return _webhook_inbox